@@ -0,0 +1,31 @@
+"""会话滚动摘要与上下文Token节省统计
+
+Revision ID: 20261018_01
+Revises: 
+Create Date: 2026-10-18 10:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '20261018_01'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # 新部署时表由应用启动时的create_all创建（已包含这些字段），因此使用IF NOT EXISTS
+    op.execute("ALTER TABLE conversations ADD COLUMN IF NOT EXISTS summary TEXT")
+    op.execute("ALTER TABLE conversations ADD COLUMN IF NOT EXISTS summary_until TIMESTAMP WITH TIME ZONE")
+    op.execute(
+        "ALTER TABLE conversations ADD COLUMN IF NOT EXISTS context_tokens_saved INTEGER NOT NULL DEFAULT 0"
+    )
+
+
+def downgrade() -> None:
+    op.drop_column('conversations', 'context_tokens_saved')
+    op.drop_column('conversations', 'summary_until')
+    op.drop_column('conversations', 'summary')
@@ -0,0 +1,24 @@
+"""八字档案更新时间（系统提示词缓存的档案版本）
+
+Revision ID: 20261018_02
+Revises: 20261018_01
+Create Date: 2026-10-18 14:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '20261018_02'
+down_revision = '20261018_01'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.execute("ALTER TABLE bazi_profiles ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP WITH TIME ZONE")
+
+
+def downgrade() -> None:
+    op.drop_column('bazi_profiles', 'updated_at')
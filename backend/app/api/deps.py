@@ -1,52 +1,73 @@
 """
 API依赖注入
 """
+import hmac
 from typing import Generator, Optional
-from fastapi import Depends, HTTPException, status
+from fastapi import Depends, Header, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 
+from app.core.config import settings
 from app.core.database import get_db
-from app.core.security import verify_token
 from app.models.user import User
+from app.services.user_cache import AuthUserCache
 
 security = HTTPBearer()
+user_cache = AuthUserCache()
 
 
 async def get_current_user(
     credentials: HTTPAuthorizationCredentials = Depends(security),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ) -> User:
     """
     获取当前登录用户
-    """
-    token = credentials.credentials
-    payload = verify_token(token)
     
-    if payload is None:
+    令牌解析结果和用户快照均有缓存（见AuthUserCache），命中时不访问数据库；
+    缓存的用户会加入本次请求的会话，接口中修改字段并提交仍会正常更新
+    """
+    user_id = user_cache.decode_token(credentials.credentials)
+    if user_id is None:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="无效的认证令牌",
             headers={"WWW-Authenticate": "Bearer"},
         )
     
-    user_id: str = payload.get("sub")
-    if user_id is None:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="无效的认证令牌",
-        )
+    user = await user_cache.get_user(user_id)
+    if user is not None:
+        db.add(user)
+        return user
     
-    user = db.query(User).filter(User.id == user_id).first()
+    # 查询之前读取失效计数，查询期间余额被更新时不写回旧快照
+    generation = await user_cache.get_generation(user_id)
+    result = await db.execute(select(User).where(User.id == user_id))
+    user = result.scalar_one_or_none()
     if user is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="用户不存在",
         )
     
+    await user_cache.set_user(user, generation)
     return user
 
 
+async def require_stats_token(x_stats_token: str = Header(default="")) -> None:
+    """
+    内部统计接口（/health/cache、/health/llm）的访问校验
+
+    请求头X-Stats-Token须与配置HEALTH_STATS_TOKEN一致；未配置时统计接口不开放，一律返回404
+    """
+    expected = settings.HEALTH_STATS_TOKEN
+    if not expected or not hmac.compare_digest(x_stats_token.encode(), expected.encode()):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Not Found",
+        )
+
+
 async def check_token_balance(
     user: User = Depends(get_current_user),
     min_balance: int = 10
@@ -2,12 +2,13 @@
 认证相关API
 """
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.core.database import get_db
 from app.core.security import create_access_token
 from app.core.config import settings
-from app.api.deps import get_current_user
+from app.api.deps import get_current_user, user_cache
 from app.models.user import User
 from app.schemas.auth import WxLoginRequest, WxLoginResponse, UpdateUserRequest
 from app.services.wechat_service import WeChatService
@@ -19,7 +20,7 @@ wechat_service = WeChatService()
 @router.post("/wx-login", response_model=WxLoginResponse)
 async def wx_login(
     request: WxLoginRequest,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """
     微信登录
@@ -31,7 +32,8 @@ async def wx_login(
         openid = await wechat_service.code2session(request.code)
         
         # 查找或创建用户
-        user = db.query(User).filter(User.openid == openid).first()
+        result = await db.execute(select(User).where(User.openid == openid))
+        user = result.scalar_one_or_none()
         is_new_user = False
         
         if not user:
@@ -41,8 +43,8 @@ async def wx_login(
                 token_balance=settings.INITIAL_TOKEN_BALANCE
             )
             db.add(user)
-            db.commit()
-            db.refresh(user)
+            await db.commit()
+            await db.refresh(user)
             is_new_user = True
         
         # 生成JWT token
@@ -71,7 +73,7 @@ async def wx_login(
 async def update_user(
     request: UpdateUserRequest,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """
     更新用户信息
@@ -83,8 +85,9 @@ async def update_user(
         if request.avatar_url is not None:
             current_user.avatar_url = request.avatar_url
         
-        db.commit()
-        db.refresh(current_user)
+        await db.commit()
+        await db.refresh(current_user)
+        await user_cache.invalidate(current_user.id)
         
         return {
             "id": str(current_user.id),
@@ -95,7 +98,7 @@ async def update_user(
         }
         
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail=f"更新用户信息失败：{str(e)}"
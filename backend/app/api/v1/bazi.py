@@ -1,15 +1,27 @@
 """
 八字相关API
 """
+import asyncio
+import json
+import uuid
 from typing import List
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi.responses import StreamingResponse
+from sqlalchemy import insert, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.core.database import get_db
+from app.core.database import AsyncSessionLocal, get_db
 from app.api.deps import get_current_user
 from app.models.user import User
 from app.models.bazi_profile import BaziProfile
-from app.schemas.bazi import BaziCalculateRequest, BaziProfileResponse
+from app.core.config import settings
+from app.schemas.bazi import (
+    BaziCalculateRequest,
+    BaziBatchCalculateRequest,
+    BaziProfileResponse,
+    ChartSearchResponse,
+    CitySuggestion
+)
 from app.services.bazi_service import BaziService
 
 router = APIRouter()
@@ -19,7 +31,7 @@ bazi_service = BaziService()
 @router.post("/calculate", response_model=BaziProfileResponse)
 async def calculate_bazi(
     request: BaziCalculateRequest,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
     """
@@ -32,7 +44,7 @@ async def calculate_bazi(
         logger.info(f"收到八字计算请求: user={current_user.id}, data={request.model_dump()}")
         
         # 计算八字
-        bazi_result = bazi_service.calculate(
+        bazi_result = await bazi_service.calculate_async(
             name=request.name,
             gender=request.gender,
             calendar=request.calendar,
@@ -42,7 +54,8 @@ async def calculate_bazi(
             hour=request.hour,
             minute=request.minute,
             birth_city=request.birth_city,
-            current_city=request.current_city
+            current_city=request.current_city,
+            is_leap_month=request.is_leap_month
         )
         
         logger.info(f"八字计算成功: {request.name}")
@@ -56,30 +69,147 @@ async def calculate_bazi(
             bazi_result=bazi_result
         )
         db.add(profile)
-        db.commit()
-        db.refresh(profile)
+        await db.commit()
+        await db.refresh(profile)
         
         logger.info(f"八字档案保存成功: profile_id={profile.id}")
         return profile
         
     except Exception as e:
         logger.error(f"八字计算失败: {type(e).__name__}: {str(e)}", exc_info=True)
-        db.rollback()
+        await db.rollback()
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail=f"八字计算失败：{str(e)}"
         )
 
 
+@router.post("/calculate/batch")
+async def calculate_bazi_batch(
+    request: BaziBatchCalculateRequest,
+    current_user: User = Depends(get_current_user)
+):
+    """
+    批量计算八字并保存档案（NDJSON流式响应）
+    
+    各条并行计算，按完成顺序每行返回一条结果：
+    - 成功：{"index", "status": "ok", "profile_id", "bazi_result"}
+    - 失败：{"index", "status": "error", "detail"}（不影响其它条目）
+    成功的结果按BAZI_BATCH_CHUNK_SIZE分块，每块一次批量插入后再返回
+    """
+    import logging
+    logger = logging.getLogger(__name__)
+    
+    # 在外部保存ID，避免session问题
+    user_id = current_user.id
+    items = request.items
+    logger.info(f"收到八字批量计算请求: user={user_id}, count={len(items)}")
+    
+    async def calculate_item(index: int, item: BaziCalculateRequest):
+        try:
+            return index, await bazi_service.calculate_async(**item.model_dump()), None
+        except Exception as e:
+            return index, None, e
+    
+    def to_line(data: dict) -> str:
+        return json.dumps(data, ensure_ascii=False) + "\n"
+    
+    async def generate():
+        # 创建新的db session用于流式响应
+        stream_db = AsyncSessionLocal()
+        pending = []
+        succeeded = 0
+        
+        async def flush():
+            """批量插入当前块并清空，返回(保存成功的条数, 对应的结果行)"""
+            rows = [
+                {
+                    "id": uuid.uuid4(),
+                    "user_id": user_id,
+                    "name": items[index].name,
+                    "gender": items[index].gender,
+                    "birth_info": items[index].model_dump(),
+                    "bazi_result": bazi_result
+                }
+                for index, bazi_result in pending
+            ]
+            try:
+                await stream_db.execute(insert(BaziProfile), rows)
+                await stream_db.commit()
+            except Exception as e:
+                logger.error(f"八字档案批量保存失败: {str(e)}", exc_info=True)
+                await stream_db.rollback()
+                lines = [
+                    to_line({"index": index, "status": "error", "detail": f"保存失败：{str(e)}"})
+                    for index, _ in pending
+                ]
+                pending.clear()
+                return 0, lines
+            
+            lines = [
+                to_line({
+                    "index": index,
+                    "status": "ok",
+                    "profile_id": str(row["id"]),
+                    "bazi_result": bazi_result
+                })
+                for (index, bazi_result), row in zip(pending, rows)
+            ]
+            pending.clear()
+            return len(rows), lines
+        
+        try:
+            tasks = [calculate_item(index, item) for index, item in enumerate(items)]
+            for next_done in asyncio.as_completed(tasks):
+                index, bazi_result, error = await next_done
+                if error is not None:
+                    yield to_line({"index": index, "status": "error", "detail": f"八字计算失败：{str(error)}"})
+                    continue
+                
+                pending.append((index, bazi_result))
+                if len(pending) >= settings.BAZI_BATCH_CHUNK_SIZE:
+                    saved, lines = await flush()
+                    succeeded += saved
+                    for line in lines:
+                        yield line
+            
+            if pending:
+                saved, lines = await flush()
+                succeeded += saved
+                for line in lines:
+                    yield line
+            
+            logger.info(f"八字批量计算完成: user={user_id}, total={len(items)}, saved={succeeded}")
+        
+        finally:
+            await stream_db.close()
+    
+    return StreamingResponse(generate(), media_type="application/x-ndjson")
+
+
+@router.get("/cities", response_model=List[CitySuggestion])
+async def search_cities(
+    q: str = Query(..., min_length=1, max_length=50, description="城市名称前缀"),
+    limit: int = Query(10, ge=1, le=20, description="返回条数")
+):
+    """
+    城市名称联想
+    
+    数据来自进程内的地区前缀树，不访问数据库、无需登录，可在输入时逐字调用
+    """
+    return bazi_service.suggest_cities(q, limit)
+
+
 @router.get("/profiles", response_model=List[BaziProfileResponse])
 async def get_profiles(
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
     """获取用户的八字档案列表"""
-    profiles = db.query(BaziProfile).filter(
+    result = await db.execute(select(BaziProfile).where(
         BaziProfile.user_id == current_user.id
-    ).order_by(BaziProfile.created_at.desc()).all()
+    ).order_by(BaziProfile.created_at.desc()))
+    profiles = result.scalars().all()
     
     return profiles
 
@@ -87,14 +217,15 @@ async def get_profiles(
 @router.get("/profiles/{profile_id}", response_model=BaziProfileResponse)
 async def get_profile(
     profile_id: str,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
     """获取八字档案详情"""
-    profile = db.query(BaziProfile).filter(
+    result = await db.execute(select(BaziProfile).where(
         BaziProfile.id == profile_id,
         BaziProfile.user_id == current_user.id
-    ).first()
+    ))
+    profile = result.scalar_one_or_none()
     
     if not profile:
         raise HTTPException(
@@ -108,7 +239,7 @@ async def get_profile(
 @router.delete("/profiles/{profile_id}")
 async def delete_profile(
     profile_id: str,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
     """删除八字档案"""
@@ -117,10 +248,11 @@ async def delete_profile(
     
     logger = logging.getLogger(__name__)
     
-    profile = db.query(BaziProfile).filter(
+    result = await db.execute(select(BaziProfile).where(
         BaziProfile.id == profile_id,
         BaziProfile.user_id == current_user.id
-    ).first()
+    ))
+    profile = result.scalar_one_or_none()
     
     if not profile:
         raise HTTPException(
@@ -130,25 +262,45 @@ async def delete_profile(
     
     try:
         # 先解除所有引用该档案的会话关联
-        affected_conversations = db.query(Conversation).filter(
+        result = await db.execute(update(Conversation).where(
             Conversation.bazi_profile_id == profile_id
-        ).update({"bazi_profile_id": None})
+        ).values(bazi_profile_id=None))
+        affected_conversations = result.rowcount
         
         if affected_conversations > 0:
             logger.info(f"已解除 {affected_conversations} 个会话的八字档案关联")
         
         # 再删除档案
-        db.delete(profile)
-        db.commit()
+        await db.delete(profile)
+        await db.commit()
         
         logger.info(f"八字档案删除成功: profile_id={profile_id}")
         return {"message": "删除成功"}
         
     except Exception as e:
         logger.error(f"删除八字档案失败: {str(e)}", exc_info=True)
-        db.rollback()
+        await db.rollback()
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"删除失败：{str(e)}"
         )
 
+
+@router.get("/search", response_model=ChartSearchResponse)
+async def search_charts(
+    bazi: str = Query(..., min_length=11, max_length=20, description="四柱，空格分隔，如：甲子 丙寅 戊辰 壬子")
+):
+    """
+    八字反查出生时间
+    
+    返回1900～2100年间排出该八字的全部出生时段（真太阳时，每段为一个时辰；
+    23点的晚子时与0点的子时分别返回）。数据来自进程内的反查索引，不访问数据库、无需登录
+    """
+    try:
+        matches = bazi_service.search_charts(bazi)
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+    return {"bazi": " ".join(bazi.split()), "count": len(matches), "matches": matches}
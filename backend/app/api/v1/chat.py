@@ -5,11 +5,12 @@ import json
 from typing import List
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.responses import StreamingResponse
-from sqlalchemy.orm import Session
-from sqlalchemy import and_
+from starlette.background import BackgroundTask
+from sqlalchemy import and_, func, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.core.database import get_db
-from app.api.deps import get_current_user, check_token_balance
+from app.core.database import AsyncSessionLocal, get_db
+from app.api.deps import get_current_user, check_token_balance, user_cache
 from app.models.user import User
 from app.models.conversation import Conversation
 from app.models.message import Message
@@ -21,16 +22,22 @@ from app.schemas.chat import (
     MessageResponse,
     ChatHistoryResponse
 )
+from app.services.chat_context import load_chat_context
+from app.services.context_buffer import ConversationContextBuffer
+from app.services.conversation_summary import ConversationSummarizer
 from app.services.langchain_service import LangChainChatService
+from app.services.llm_scheduler import SchedulerRejected
 
 router = APIRouter()
 chat_service = LangChainChatService()
+context_buffer = ConversationContextBuffer()
+summarizer = ConversationSummarizer()
 
 
 @router.post("/conversations", response_model=ConversationResponse)
 async def create_conversation(
     conversation_data: ConversationCreate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
     """创建新会话"""
@@ -39,8 +46,8 @@ async def create_conversation(
         **conversation_data.model_dump()
     )
     db.add(conversation)
-    db.commit()
-    db.refresh(conversation)
+    await db.commit()
+    await db.refresh(conversation)
     
     return conversation
 
@@ -49,16 +56,17 @@ async def create_conversation(
 async def get_conversations(
     skip: int = 0,
     limit: int = 20,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
     """获取会话列表"""
-    conversations = db.query(Conversation).filter(
+    result = await db.execute(select(Conversation).where(
         and_(
             Conversation.user_id == current_user.id,
             Conversation.deleted_at.is_(None)
         )
-    ).order_by(Conversation.updated_at.desc()).offset(skip).limit(limit).all()
+    ).order_by(Conversation.updated_at.desc()).offset(skip).limit(limit))
+    conversations = result.scalars().all()
     
     return conversations
 
@@ -66,15 +74,16 @@ async def get_conversations(
 @router.get("/conversations/{conversation_id}", response_model=ConversationResponse)
 async def get_conversation(
     conversation_id: str,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
     """获取会话详情"""
-    conversation = db.query(Conversation).filter(
+    result = await db.execute(select(Conversation).where(
         Conversation.id == conversation_id,
         Conversation.user_id == current_user.id,
         Conversation.deleted_at.is_(None)
-    ).first()
+    ))
+    conversation = result.scalar_one_or_none()
     
     if not conversation:
         raise HTTPException(
@@ -89,14 +98,15 @@ async def get_conversation(
 async def update_conversation(
     conversation_id: str,
     update_data: ConversationUpdate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
     """更新会话"""
-    conversation = db.query(Conversation).filter(
+    result = await db.execute(select(Conversation).where(
         Conversation.id == conversation_id,
         Conversation.user_id == current_user.id
-    ).first()
+    ))
+    conversation = result.scalar_one_or_none()
     
     if not conversation:
         raise HTTPException(
@@ -107,8 +117,8 @@ async def update_conversation(
     for field, value in update_data.model_dump(exclude_unset=True).items():
         setattr(conversation, field, value)
     
-    db.commit()
-    db.refresh(conversation)
+    await db.commit()
+    await db.refresh(conversation)
     
     return conversation
 
@@ -116,16 +126,17 @@ async def update_conversation(
 @router.delete("/conversations/{conversation_id}")
 async def delete_conversation(
     conversation_id: str,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
     """删除会话（软删除）"""
     from datetime import datetime
     
-    conversation = db.query(Conversation).filter(
+    result = await db.execute(select(Conversation).where(
         Conversation.id == conversation_id,
         Conversation.user_id == current_user.id
-    ).first()
+    ))
+    conversation = result.scalar_one_or_none()
     
     if not conversation:
         raise HTTPException(
@@ -134,7 +145,7 @@ async def delete_conversation(
         )
     
     conversation.deleted_at = datetime.utcnow()
-    db.commit()
+    await db.commit()
     
     return {"message": "删除成功"}
 
@@ -142,89 +153,124 @@ async def delete_conversation(
 @router.post("/message")
 async def send_message(
     message_data: MessageCreate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: User = Depends(check_token_balance)
 ):
     """
     发送消息（流式响应）
+    
+    会话、关联的八字档案、档案存在性和最近的消息由load_chat_context一次查询取回，
+    连同保存用户消息，流式响应开始前只有两次数据库往返；
+    最近的消息优先读取Redis上下文缓冲，消息保存后追加到缓冲。
+    历史消息按Token预算选取，窗口之外的消息在回复完成后于后台并入会话的滚动摘要。
+    同一用户/会话已有进行中的回复或排队已满时直接拒绝，模型调用名额不足时排队并推送排队位置
     """
-    # 检查用户是否有八字档案
-    from app.models.bazi_profile import BaziProfile
-    bazi_count = db.query(BaziProfile).filter(
-        BaziProfile.user_id == current_user.id
-    ).count()
+    context = await load_chat_context(
+        db, message_data.conversation_id, current_user.id, buffer=context_buffer
+    )
     
-    if bazi_count == 0:
+    if context is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="会话不存在"
+        )
+    
+    # 检查用户是否有八字档案
+    if not context.has_bazi_profile:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="请先设置出生信息才能使用AI对话功能"
         )
     
-    # 验证会话
-    conversation = db.query(Conversation).filter(
-        Conversation.id == message_data.conversation_id,
-        Conversation.user_id == current_user.id
-    ).first()
-    
-    if not conversation:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="会话不存在"
+    # 登记本次回复，保存用户消息之前拒绝，避免留下没有回复的提问
+    try:
+        ticket = chat_service.scheduler.reserve(
+            str(current_user.id), context.conversation_id, paid=context.is_paid_user
         )
+    except SchedulerRejected as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
     
     # 保存用户消息
     user_message = Message(
-        conversation_id=conversation.id,
+        conversation_id=message_data.conversation_id,
         role="user",
         content=message_data.content
     )
     db.add(user_message)
-    db.commit()
-    
     # 在外部保存ID，避免session问题
-    conversation_id = str(conversation.id)
+    conversation_id = context.conversation_id
+    try:
+        await db.commit()
+        await context_buffer.append(conversation_id, "user", message_data.content, user_message.created_at)
+    except Exception:
+        chat_service.scheduler.release(ticket)
+        raise
+    
+    window = chat_service.select_window(context)
     user_id = str(current_user.id)
     
     # 流式生成AI响应
     async def generate():
-        from app.core.database import SessionLocal
-        
-        # 创建新的db session用于流式响应
-        stream_db = SessionLocal()
+        # 创建新的db session用于流式响应（保存AI回复、扣减余额）
+        stream_db = AsyncSessionLocal()
         
         try:
             full_response = ""
             token_cost = 0
+            usage = None
+            failed = False
             
             async for chunk in chat_service.stream_chat(
                 user_message=message_data.content,
-                conversation_id=conversation_id,
-                user_id=user_id,
-                db=stream_db
+                context=context,
+                window=window,
+                ticket=ticket
             ):
+                if chunk.get("type") == "usage":
+                    usage = {key: value for key, value in chunk.items() if key != "type"}
+                    continue
+                
                 if chunk.get("type") == "token":
                     full_response += chunk.get("content", "")
                     token_cost = chunk.get("token_cost", 0)
+                elif chunk.get("type") == "error":
+                    failed = True
                 
                 # 使用json.dumps确保正确的JSON格式
                 yield f"data: {json.dumps(chunk)}\n\n"
             
+            # 排队超时或模型调用失败：不保存空回复、不扣费、不发送done
+            if failed:
+                return
+            
             # 保存AI响应
             ai_message = Message(
                 conversation_id=conversation_id,
                 role="assistant",
                 content=full_response,
-                token_cost=token_cost
+                token_cost=token_cost,
+                # 系统提示词哈希与服务端前缀缓存命中情况
+                extra_data=usage
             )
             stream_db.add(ai_message)
             
             # 扣减用户token
-            user = stream_db.query(User).filter(User.id == user_id).first()
+            result = await stream_db.execute(select(User).where(User.id == user_id))
+            user = result.scalar_one_or_none()
             if user:
                 user.token_balance -= token_cost
             
-            stream_db.commit()
-            stream_db.refresh(ai_message)
+            # 累计按Token预算选取上下文节省的输入Token
+            await stream_db.execute(
+                update(Conversation)
+                .where(Conversation.id == conversation_id)
+                .values(context_tokens_saved=Conversation.context_tokens_saved + window.tokens_saved)
+            )
+            
+            await stream_db.commit()
+            await stream_db.refresh(ai_message)
+            await user_cache.invalidate(user_id)
+            await context_buffer.append(conversation_id, "assistant", full_response, ai_message.created_at)
             
             # 发送完成消息
             done_data = {
@@ -234,6 +280,9 @@ async def send_message(
             }
             yield f"data: {json.dumps(done_data)}\n\n"
             
+            # 后台更新滚动摘要
+            summarizer.schedule(conversation_id, window)
+            
         except Exception as e:
             import traceback
             error_detail = traceback.format_exc()
@@ -246,9 +295,15 @@ async def send_message(
             yield f"data: {json.dumps(error_data)}\n\n"
         
         finally:
-            stream_db.close()
+            chat_service.scheduler.release(ticket)
+            await stream_db.close()
     
-    return StreamingResponse(generate(), media_type="text/event-stream")
+    # 客户端在流式响应开始前断开时generate()不会执行，由响应结束后的后台任务解除登记（可重复调用）
+    return StreamingResponse(
+        generate(),
+        media_type="text/event-stream",
+        background=BackgroundTask(chat_service.scheduler.release, ticket)
+    )
 
 
 @router.get("/history/{conversation_id}", response_model=ChatHistoryResponse)
@@ -256,14 +311,15 @@ async def get_chat_history(
     conversation_id: str,
     skip: int = 0,
     limit: int = 50,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
     """获取会话历史"""
-    conversation = db.query(Conversation).filter(
+    result = await db.execute(select(Conversation).where(
         Conversation.id == conversation_id,
         Conversation.user_id == current_user.id
-    ).first()
+    ))
+    conversation = result.scalar_one_or_none()
     
     if not conversation:
         raise HTTPException(
@@ -271,13 +327,14 @@ async def get_chat_history(
             detail="会话不存在"
         )
     
-    messages = db.query(Message).filter(
+    result = await db.execute(select(Message).where(
         Message.conversation_id == conversation_id
-    ).order_by(Message.created_at.desc()).offset(skip).limit(limit).all()
+    ).order_by(Message.created_at.desc()).offset(skip).limit(limit))
+    messages = result.scalars().all()
     
-    total = db.query(Message).filter(
+    total = await db.scalar(select(func.count()).select_from(Message).where(
         Message.conversation_id == conversation_id
-    ).count()
+    ))
     
     return ChatHistoryResponse(
         conversation=conversation,
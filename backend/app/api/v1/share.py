@@ -2,7 +2,8 @@
 分享功能API
 """
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from pydantic import BaseModel
 from typing import Optional
 import httpx
@@ -26,7 +27,7 @@ class MiniProgramCodeRequest(BaseModel):
 @router.post("/miniprogram-code")
 async def generate_miniprogram_code(
     request: MiniProgramCodeRequest,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
     """
@@ -35,10 +36,11 @@ async def generate_miniprogram_code(
     用于分享会话海报，扫码后可直接打开对应会话
     """
     # 验证会话是否属于当前用户
-    conversation = db.query(Conversation).filter(
+    result = await db.execute(select(Conversation).where(
         Conversation.id == request.conversation_id,
         Conversation.user_id == current_user.id
-    ).first()
+    ))
+    conversation = result.scalar_one_or_none()
     
     if not conversation:
         raise HTTPException(
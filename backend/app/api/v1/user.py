@@ -2,13 +2,13 @@
 用户相关API
 """
 from fastapi import APIRouter, Depends, HTTPException, File, UploadFile
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 import os
 import uuid
 from pathlib import Path
 
 from app.core.database import get_db
-from app.api.deps import get_current_user
+from app.api.deps import get_current_user, user_cache
 from app.models.user import User
 from app.schemas.user import UserResponse, UserUpdate, UserSettings
 from app.core.config import settings
@@ -27,15 +27,16 @@ async def get_profile(
 @router.put("/profile", response_model=UserResponse)
 async def update_profile(
     update_data: UserUpdate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
     """更新用户信息"""
     for field, value in update_data.model_dump(exclude_unset=True).items():
         setattr(current_user, field, value)
     
-    db.commit()
-    db.refresh(current_user)
+    await db.commit()
+    await db.refresh(current_user)
+    await user_cache.invalidate(current_user.id)
     return current_user
 
 
@@ -61,7 +62,7 @@ async def update_settings(
 @router.post("/upload-avatar")
 async def upload_avatar(
     file: UploadFile = File(...),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
     """
@@ -95,8 +96,9 @@ async def upload_avatar(
     
     # 更新用户头像
     current_user.avatar_url = avatar_url
-    db.commit()
-    db.refresh(current_user)
+    await db.commit()
+    await db.refresh(current_user)
+    await user_cache.invalidate(current_user.id)
     
     return {
         "avatar_url": avatar_url,
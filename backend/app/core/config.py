@@ -34,15 +34,51 @@ class Settings(BaseSettings):
     )
     OPENAI_TEMPERATURE: float = Field(default=0.7, env="OPENAI_TEMPERATURE")
     OPENAI_MAX_TOKENS: int = Field(default=2000, env="OPENAI_MAX_TOKENS")
+    OPENAI_STREAM_USAGE: bool = Field(default=True, env="OPENAI_STREAM_USAGE")  # 流式请求附带stream_options.include_usage
+    SYSTEM_PROMPT_CACHE_SIZE: int = Field(default=2000, env="SYSTEM_PROMPT_CACHE_SIZE")  # 进程内系统提示词缓存条数
     
     # 业务配置
     INITIAL_TOKEN_BALANCE: int = Field(default=10000, env="INITIAL_TOKEN_BALANCE")  # 单位：分
     TOKEN_PRICE_RATE: float = Field(default=0.01, env="TOKEN_PRICE_RATE")
     
+    # 八字计算配置
+    BAZI_EXECUTOR: str = Field(default="process", env="BAZI_EXECUTOR")  # inline/thread/process
+    BAZI_EXECUTOR_WORKERS: int = Field(default=2, env="BAZI_EXECUTOR_WORKERS")
+    BAZI_BATCH_CHUNK_SIZE: int = Field(default=50, env="BAZI_BATCH_CHUNK_SIZE")  # 批量计算每次插入的条数
+    BAZI_CACHE_SIZE: int = Field(default=10000, env="BAZI_CACHE_SIZE")  # 进程内结果缓存条数
+    BAZI_CACHE_TTL: int = Field(default=2592000, env="BAZI_CACHE_TTL")  # Redis结果缓存过期时间（秒）
+    
+    # 登录用户缓存配置
+    AUTH_TOKEN_CACHE_SIZE: int = Field(default=10000, env="AUTH_TOKEN_CACHE_SIZE")  # 进程内令牌缓存条数
+    AUTH_TOKEN_CACHE_TTL: int = Field(default=300, env="AUTH_TOKEN_CACHE_TTL")  # 令牌解析结果最长缓存时间（秒）
+    AUTH_USER_CACHE_TTL: int = Field(default=60, env="AUTH_USER_CACHE_TTL")  # Redis用户快照过期时间（秒）
+    
+    # 会话上下文缓冲配置
+    CHAT_CONTEXT_BUFFER_SIZE: int = Field(default=50, env="CHAT_CONTEXT_BUFFER_SIZE")  # 每个会话缓冲的消息条数，不小于context_size上限
+    CHAT_CONTEXT_BUFFER_TTL: int = Field(default=604800, env="CHAT_CONTEXT_BUFFER_TTL")  # 缓冲过期时间（秒）
+    CHAT_CONTEXT_TOKEN_BUDGET: int = Field(default=2000, env="CHAT_CONTEXT_TOKEN_BUDGET")  # 历史消息（含摘要）的Token预算
+    CHAT_SUMMARY_MAX_TOKENS: int = Field(default=300, env="CHAT_SUMMARY_MAX_TOKENS")  # 滚动摘要最大长度（Token）
+    CHAT_SUMMARY_MIN_MESSAGES: int = Field(default=4, env="CHAT_SUMMARY_MIN_MESSAGES")  # 窗口外累计多少条未摘要消息后更新摘要
+    
+    # AI回答缓存配置（无历史上下文的重复提问）
+    CHAT_ANSWER_CACHE_ENABLED: bool = Field(default=False, env="CHAT_ANSWER_CACHE_ENABLED")
+    CHAT_ANSWER_CACHE_STYLES: str = Field(default="simple,balanced", env="CHAT_ANSWER_CACHE_STYLES")  # 逗号分隔
+    CHAT_ANSWER_CACHE_SIZE: int = Field(default=1000, env="CHAT_ANSWER_CACHE_SIZE")  # 进程内回答缓存条数
+    CHAT_ANSWER_CACHE_TTL: int = Field(default=86400, env="CHAT_ANSWER_CACHE_TTL")  # Redis回答缓存过期时间（秒）
+    
+    # 模型调用配置
+    CHAT_COALESCE_ENABLED: bool = Field(default=True, env="CHAT_COALESCE_ENABLED")  # 合并进行中的相同模型请求
+    LLM_MAX_CONCURRENCY: int = Field(default=20, env="LLM_MAX_CONCURRENCY")  # 每个worker同时进行的上游调用上限
+    LLM_MAX_QUEUE: int = Field(default=100, env="LLM_MAX_QUEUE")  # 每个worker排队上限，超出直接拒绝
+    LLM_QUEUE_TIMEOUT: int = Field(default=60, env="LLM_QUEUE_TIMEOUT")  # 排队超时（秒）
+    LLM_PAID_PRIORITY_WEIGHT: int = Field(default=3, env="LLM_PAID_PRIORITY_WEIGHT")  # 每放行几个付费用户放行一个普通用户
+    LLM_RESERVATION_TTL: int = Field(default=600, env="LLM_RESERVATION_TTL")  # 单次回复登记的最长有效期（秒）
+    
     # 安全配置
     JWT_SECRET_KEY: str = Field(..., env="JWT_SECRET_KEY")
     JWT_ALGORITHM: str = Field(default="HS256", env="JWT_ALGORITHM")
     JWT_EXPIRE_MINUTES: int = Field(default=10080, env="JWT_EXPIRE_MINUTES")
+    HEALTH_STATS_TOKEN: str = Field(default="", env="HEALTH_STATS_TOKEN")  # 统计接口的X-Stats-Token，为空时不开放
     
     # CORS配置
     CORS_ORIGINS: List[str] = Field(
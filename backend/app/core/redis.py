@@ -0,0 +1,35 @@
+"""
+Redis连接管理
+"""
+from typing import Optional
+
+import redis.asyncio as aioredis
+
+from app.core.config import settings
+
+_redis: Optional[aioredis.Redis] = None
+
+
+def get_redis() -> aioredis.Redis:
+    """
+    获取全局异步Redis客户端（首次调用时创建，内部自带连接池）
+
+    缓存类调用方应自行捕获redis.RedisError并降级为未命中，Redis不可用时不影响主流程
+    """
+    global _redis
+    if _redis is None:
+        _redis = aioredis.from_url(
+            settings.REDIS_URL,
+            decode_responses=True,
+            socket_connect_timeout=0.5,
+            socket_timeout=0.5,
+        )
+    return _redis
+
+
+async def close_redis() -> None:
+    """关闭全局Redis客户端"""
+    global _redis
+    if _redis is not None:
+        await _redis.close()
+        _redis = None
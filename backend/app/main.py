@@ -2,14 +2,18 @@
 FastAPI主应用
 """
 from pathlib import Path
-from fastapi import FastAPI
+from fastapi import Depends, FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
 from fastapi.staticfiles import StaticFiles
 
 from app.core.config import settings
-from app.core.database import engine, Base
+from app.core.database import engine, Base, close_db
 from app.api.v1 import api_router
+from app.api.v1.bazi import bazi_service
+from app.api.v1.chat import chat_service, context_buffer
+from app.api.deps import require_stats_token, user_cache
+from app.core.redis import close_redis
 
 # 创建数据库表
 Base.metadata.create_all(bind=engine)
@@ -38,6 +42,20 @@ static_dir.mkdir(exist_ok=True)
 app.mount("/static", StaticFiles(directory=str(static_dir)), name="static")
 
 
+@app.on_event("startup")
+async def startup():
+    """预热八字计算数据并创建计算执行器"""
+    bazi_service.start()
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    """释放八字计算执行器、Redis连接和数据库连接池"""
+    bazi_service.shutdown()
+    await close_redis()
+    await close_db()
+
+
 # 健康检查
 @app.get("/health", tags=["健康检查"])
 async def health_check():
@@ -51,6 +69,27 @@ async def health_check():
     )
 
 
+@app.get("/health/cache", tags=["健康检查"], dependencies=[Depends(require_stats_token)])
+async def cache_stats():
+    """缓存命中统计（需X-Stats-Token）"""
+    return {
+        "bazi_result": bazi_service.cache.stats(),
+        "auth_user": user_cache.stats(),
+        "chat_context": context_buffer.stats(),
+        "system_prompt": chat_service.prompt_cache.stats(),
+        "chat_answer": chat_service.answer_cache.stats()
+    }
+
+
+@app.get("/health/llm", tags=["健康检查"], dependencies=[Depends(require_stats_token)])
+async def llm_stats():
+    """模型调用统计（需X-Stats-Token）"""
+    return {
+        "coalesce": chat_service.coalescer.stats(),
+        "scheduler": chat_service.scheduler.stats()
+    }
+
+
 # 注册API路由
 app.include_router(api_router, prefix="/api/v1")
 
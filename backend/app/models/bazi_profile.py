@@ -20,6 +20,7 @@ class BaziProfile(Base):
     birth_info = Column(JSONB, nullable=False, comment="出生信息")
     bazi_result = Column(JSONB, comment="八字排盘结果")
     created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now(), comment="更新时间，作为系统提示词缓存的档案版本")
     
     def __repr__(self):
         return f"<BaziProfile {self.name} ({self.id})>"
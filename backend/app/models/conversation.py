@@ -1,7 +1,7 @@
 """
 会话模型
 """
-from sqlalchemy import Column, String, Integer, DateTime, ForeignKey
+from sqlalchemy import Column, String, Integer, DateTime, ForeignKey, Text
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
@@ -20,6 +20,9 @@ class Conversation(Base):
     bazi_profile_id = Column(UUID(as_uuid=True), ForeignKey("bazi_profiles.id"), nullable=True)
     context_size = Column(Integer, default=10, comment="上下文消息数")
     ai_style = Column(String(50), default="balanced", comment="AI风格")
+    summary = Column(Text, nullable=True, comment="上下文窗口之前的滚动摘要")
+    summary_until = Column(DateTime(timezone=True), nullable=True, comment="已并入摘要的最后一条消息时间")
+    context_tokens_saved = Column(Integer, default=0, server_default="0", nullable=False, comment="按Token预算选取上下文累计节省的输入Token")
     created_at = Column(DateTime(timezone=True), server_default=func.now(), index=True)
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
     deleted_at = Column(DateTime(timezone=True), nullable=True, index=True, comment="软删除时间")
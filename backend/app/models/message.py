@@ -30,6 +30,9 @@ class Message(Base):
     # 关系
     conversation = relationship("Conversation", back_populates="messages")
     
+    # INSERT时通过RETURNING取回created_at，写入上下文缓冲不需要再查询
+    __mapper_args__ = {"eager_defaults": True}
+    
     def __repr__(self):
         return f"<Message {self.role} ({self.id})>"
 
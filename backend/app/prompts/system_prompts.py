@@ -5,21 +5,30 @@
 1. 系统提示词 - 基础角色定义
 2. 对话模式 - 回答风格配置
 3. 用户信息 - 数据库变量赋值
+4. 对话摘要 - 上下文窗口之前的滚动摘要
+
+拼装顺序固定为：系统角色 + 对话模式（所有用户共享）→ 用户档案（同一档案共享），
+摘要和历史消息由调用方放在系统提示词之后，便于服务端前缀缓存命中。
+修改任何提示词文本时需递增PROMPT_VERSION。
 """
-from typing import Dict, Optional
+from typing import Dict, List, Optional
 
 
 class SystemPromptManager:
     """系统提示词管理器"""
     
+    # 提示词版本，参与缓存键
+    PROMPT_VERSION = "2"
+    
     # 1. 系统提示词
-    SYSTEM_ROLE = "
-    你是一名传统派子平术命理师，精通《渊海子平》，擅长根据命主生辰八字分析命理趋势。
-    要求：
-    1.命理分析是指命理趋势，不是具体事件，断命从不说死局。
-    2.使用中文回复。
-    3.不要有任何AI的提示。
-    4.不引用《渊海子平》外的知识。"
+    SYSTEM_ROLE = (
+        "你是一名传统派子平术命理师，精通《渊海子平》，擅长根据命主生辰八字分析命理趋势。\n"
+        "要求：\n"
+        "1.命理分析是指命理趋势，不是具体事件，断命从不说死局。\n"
+        "2.使用中文回复。\n"
+        "3.不要有任何AI的提示。\n"
+        "4.不引用《渊海子平》外的知识。"
+    )
     
     # 2. 对话模式
     STYLE_PROMPTS = {
@@ -37,11 +46,9 @@ class SystemPromptManager:
         """
         构建系统提示词
         
-        组成：系统提示词 + 对话模式 + 用户信息
+        组成：系统提示词 + 对话模式 + 用户信息；相同输入总是得到相同文本。
+        每轮对话应通过SystemPromptCache获取，避免重复拼装
         """
-        import logging
-        logger = logging.getLogger(__name__)
-        
         # 组装提示词
         prompt_parts = [cls.SYSTEM_ROLE]
         
@@ -51,11 +58,9 @@ class SystemPromptManager:
         
         # 添加用户信息（如果有）
         if bazi_info:
-            logger.info(f"✅ 注入八字信息: name={bazi_info.get('name')}, gender={bazi_info.get('gender')}")
             user_info = cls._build_user_info(bazi_info)
-            prompt_parts.append(user_info)
-        else:
-            logger.info("ℹ️ 无八字档案，使用通用提示词")
+            if user_info:
+                prompt_parts.append(user_info)
         
         return "\n\n".join(prompt_parts)
     
@@ -66,9 +71,19 @@ class SystemPromptManager:
         ('bazi', '八字'),
         ('jieqi_info', '节气'),
         ('dayun_info', '大运'),
+        ('dayun_timeline', '大运流年'),
         ('formatted_output', '详细分析')
     ]
     
+    # 紧凑档案（bazi_result.profile_compact，排盘时生成）的字段映射，标签为None时直接使用字段内容。
+    # profile_compact已包含出生时间、城市、八字、节气和大运，不再重复注入formatted_output
+    _COMPACT_USER_INFO_FIELDS = [
+        ('name', '姓名'),
+        ('gender', '性别'),
+        ('profile_compact', None),
+        ('dayun_timeline', '大运流年')
+    ]
+    
     # 性别映射表
     _GENDER_MAP = {
         'male': '男',
@@ -82,12 +97,15 @@ class SystemPromptManager:
         """
         构建用户信息文本（数据库变量直接赋值）
         
+        有紧凑档案时使用紧凑格式，早期生成、没有profile_compact的档案仍使用完整字段
+        
         Returns:
             格式化的用户信息文本，如果没有任何信息则返回空字符串
         """
         info_parts = []
+        fields = cls._COMPACT_USER_INFO_FIELDS if bazi_info.get('profile_compact') else cls._USER_INFO_FIELDS
         
-        for field_key, field_label in cls._USER_INFO_FIELDS:
+        for field_key, field_label in fields:
             value = bazi_info.get(field_key)
             if not value:
                 continue
@@ -96,10 +114,69 @@ class SystemPromptManager:
             if field_key == 'gender':
                 value = cls._GENDER_MAP.get(value, value)
             
-            info_parts.append(f"{field_label}：{value}")
+            # 特殊处理：大运流年时间线转为紧凑表格
+            if field_key == 'dayun_timeline':
+                value = cls._format_timeline(value)
+            
+            info_parts.append(f"{field_label}：{value}" if field_label else value)
         
         return f"当前用户信息：\n" + "\n".join(info_parts) if info_parts else ""
     
+    @classmethod
+    def _format_timeline(cls, timeline: Dict) -> str:
+        """
+        将大运流年时间线格式化为紧凑表格，每行一步大运及其十年流年，如：
+        庚申 4-13岁(1997-2006)：丁丑 戊寅 ...
+        """
+        liu_nian = timeline['liunian']
+        first_year = liu_nian['start_year']
+        pillars = liu_nian['pillars']
+        
+        def years(start_year: int, end_year: int) -> str:
+            return " ".join(pillars[max(start_year - first_year, 0):max(end_year - first_year, 0)])
+        
+        dayun = timeline['dayun']
+        rows = []
+        if dayun and dayun[0]['start_year'] > first_year:
+            rows.append(f"起运前({first_year}-{dayun[0]['start_year'] - 1})：{years(first_year, dayun[0]['start_year'])}")
+        for step in dayun:
+            start_year = step['start_year']
+            row = f"{step['pillar']} {step['start_age']}-{step['start_age'] + 9}岁({start_year}-{start_year + 9})"
+            row_years = years(start_year, start_year + 10)
+            rows.append(f"{row}：{row_years}" if row_years else row)
+        
+        return "\n" + "\n".join(rows)
+    
+    # 4. 对话摘要
+    SUMMARY_PREFIX = "此前对话摘要："
+    
+    SUMMARY_INSTRUCTION = (
+        "你负责维护一段命理咨询对话的摘要。请将已有摘要与新增对话合并为一段新的摘要：\n"
+        "1.保留用户关心的问题、已给出的主要结论和用户提供的背景信息。\n"
+        "2.省略寒暄和重复内容，不展开论证。\n"
+        "3.使用中文，不超过200字，直接输出摘要正文。"
+    )
+    
+    _ROLE_NAMES = {
+        'user': '用户',
+        'assistant': '命理师'
+    }
+    
+    @classmethod
+    def build_summary_prompt(cls, previous_summary: Optional[str], messages: List[Dict]) -> str:
+        """
+        构建滚动摘要的输入
+        
+        Args:
+            previous_summary: 已有摘要（首次摘要时为None）
+            messages: 新增对话，按时间升序：[{"role", "content"}]
+        """
+        dialogue = "\n".join(
+            f"{cls._ROLE_NAMES.get(msg['role'], msg['role'])}：{msg['content']}"
+            for msg in messages
+        )
+        return f"已有摘要：\n{previous_summary or '无'}\n\n新增对话：\n{dialogue}"
+    
     @classmethod
     def get_available_styles(cls) -> list:
         """获取所有可用的对话风格"""
@@ -1,7 +1,7 @@
 """
 八字相关的Pydantic模型
 """
-from typing import Optional
+from typing import List, Optional
 from datetime import datetime
 from pydantic import BaseModel, Field
 from uuid import UUID
@@ -19,6 +19,12 @@ class BaziCalculateRequest(BaseModel):
     minute: int = Field(..., ge=0, le=59, description="分")
     birth_city: str = Field(..., description="出生城市")
     current_city: Optional[str] = Field(None, description="现居城市")
+    is_leap_month: bool = Field(False, description="农历输入时月份是否为闰月（公历输入忽略）")
+
+
+class BaziBatchCalculateRequest(BaseModel):
+    """八字批量计算请求"""
+    items: List[BaziCalculateRequest] = Field(..., min_length=1, max_length=500, description="待计算的出生信息列表")
 
 
 class BaziProfileResponse(BaseModel):
@@ -34,3 +40,23 @@ class BaziProfileResponse(BaseModel):
     class Config:
         from_attributes = True
 
+
+class CitySuggestion(BaseModel):
+    """城市联想结果"""
+    name: str = Field(..., description="地区名称")
+    full_path: str = Field(..., description="完整路径，如：广东省/惠州市/惠城区")
+    level: str = Field(..., description="行政级别（province/city/district/street）")
+    longitude: float = Field(..., description="经度")
+
+
+class ChartSearchMatch(BaseModel):
+    """八字反查命中的出生时段（真太阳时）"""
+    start: datetime = Field(..., description="开始时间（含）")
+    end: datetime = Field(..., description="结束时间（不含）")
+
+
+class ChartSearchResponse(BaseModel):
+    """八字反查结果"""
+    bazi: str = Field(..., description="查询的四柱")
+    count: int = Field(..., description="命中时段数")
+    matches: List[ChartSearchMatch] = Field(..., description="1900～2100年间对应的出生时段，按时间升序")
@@ -30,6 +30,7 @@ class ConversationResponse(BaseModel):
     bazi_profile_id: Optional[UUID]
     context_size: int
     ai_style: str
+    context_tokens_saved: int = 0
     created_at: datetime
     updated_at: Optional[datetime]
     
@@ -0,0 +1,145 @@
+"""
+AI回答缓存（精确匹配）
+
+同一命盘、同一对话模式下的常见问题（"我今年运势如何"、"适合什么职业"）大量重复，每次都要完整调用一次模型。
+对于没有历史上下文的提问（首轮或窗口内没有消息、也没有摘要），按
+(规范化的问题文本, 系统提示词哈希, ai_style, 提示词版本) 缓存回答的流式数据块，命中时按原格式重放。
+系统提示词哈希覆盖了角色、对话模式和用户档案内容，档案或提示词变化后自动不再命中。
+
+默认关闭（CHAT_ANSWER_CACHE_ENABLED），只对CHAT_ANSWER_CACHE_STYLES中的对话模式生效。
+两级存储：进程内LRU（CHAT_ANSWER_CACHE_SIZE条）+ Redis（CHAT_ANSWER_CACHE_TTL秒）。
+"""
+import hashlib
+import json
+import logging
+import re
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+from redis import RedisError
+
+from app.core.config import settings
+from app.core.redis import get_redis
+
+logger = logging.getLogger(__name__)
+
+# 规范化时去掉的空白和句末标点
+_STRIP_PATTERN = re.compile(r"\s+")
+_TRAILING_PUNCTUATION = "?？!！.。~～…"
+
+
+def normalize_question(question: str) -> str:
+    """规范化问题文本：NFKC（全角转半角）、转小写、去掉空白和句末标点"""
+    text = unicodedata.normalize("NFKC", question).lower()
+    text = _STRIP_PATTERN.sub("", text)
+    return text.rstrip(_TRAILING_PUNCTUATION)
+
+
+class AnswerCache:
+    """AI回答两级缓存（进程内LRU + Redis）"""
+
+    def __init__(
+        self,
+        enabled: Optional[bool] = None,
+        styles: Optional[str] = None,
+        max_size: Optional[int] = None,
+        ttl: Optional[int] = None
+    ):
+        """
+        Args:
+            enabled: 是否启用，默认取配置CHAT_ANSWER_CACHE_ENABLED
+            styles: 生效的对话模式（逗号分隔），默认取配置CHAT_ANSWER_CACHE_STYLES
+            max_size: 进程内LRU的最大条目数，默认取配置CHAT_ANSWER_CACHE_SIZE
+            ttl: Redis缓存过期时间（秒），默认取配置CHAT_ANSWER_CACHE_TTL
+        """
+        self.enabled = settings.CHAT_ANSWER_CACHE_ENABLED if enabled is None else enabled
+        self.styles = {
+            style.strip() for style in (styles or settings.CHAT_ANSWER_CACHE_STYLES).split(",") if style.strip()
+        }
+        self.max_size = max_size or settings.CHAT_ANSWER_CACHE_SIZE
+        self.ttl = ttl or settings.CHAT_ANSWER_CACHE_TTL
+        self._local: "OrderedDict[str, List[str]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._counters = {"local_hits": 0, "redis_hits": 0, "misses": 0, "stores": 0, "redis_errors": 0}
+
+    def make_key(self, question: str, prompt_hash: str, ai_style: str, prompt_version: str) -> Optional[str]:
+        """生成缓存键，问题规范化后为空时返回None"""
+        normalized = normalize_question(question)
+        if not normalized:
+            return None
+        canonical = json.dumps(
+            {"question": normalized, "prompt": prompt_hash, "style": ai_style},
+            ensure_ascii=False,
+            sort_keys=True,
+            separators=(",", ":"),
+        )
+        digest = hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+        return f"chat:answer:{prompt_version}:{digest}"
+
+    def applies_to(self, ai_style: str, has_context: bool) -> bool:
+        """是否对本次提问使用缓存：已启用、对话模式在范围内、且没有历史上下文"""
+        return self.enabled and ai_style in self.styles and not has_context
+
+    def _count(self, counter: str) -> None:
+        with self._lock:
+            self._counters[counter] += 1
+
+    def _set_local(self, key: str, chunks: List[str]) -> None:
+        with self._lock:
+            self._local[key] = chunks
+            self._local.move_to_end(key)
+            while len(self._local) > self.max_size:
+                self._local.popitem(last=False)
+
+    async def get(self, key: str) -> Optional[List[str]]:
+        """依次查询进程内LRU和Redis，返回回答的数据块列表"""
+        with self._lock:
+            chunks = self._local.get(key)
+            if chunks is not None:
+                self._local.move_to_end(key)
+                self._counters["local_hits"] += 1
+                return chunks
+
+        try:
+            cached = await get_redis().get(key)
+        except RedisError as e:
+            logger.warning(f"AI回答缓存读取Redis失败: {str(e)}")
+            self._count("redis_errors")
+            cached = None
+
+        if cached is None:
+            self._count("misses")
+            return None
+
+        chunks = json.loads(cached)
+        self._set_local(key, chunks)
+        self._count("redis_hits")
+        return chunks
+
+    async def set(self, key: str, chunks: List[str]) -> None:
+        """写入进程内LRU和Redis"""
+        self._set_local(key, chunks)
+        self._count("stores")
+        try:
+            await get_redis().set(key, json.dumps(chunks, ensure_ascii=False), ex=self.ttl)
+        except RedisError as e:
+            logger.warning(f"AI回答缓存写入Redis失败: {str(e)}")
+            self._count("redis_errors")
+
+    def stats(self) -> Dict:
+        """命中统计，命中次数即节省的模型调用次数"""
+        with self._lock:
+            counters = dict(self._counters)
+            size = len(self._local)
+        hits = counters["local_hits"] + counters["redis_hits"]
+        lookups = hits + counters["misses"]
+        return {
+            **counters,
+            "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+            "enabled": self.enabled,
+            "styles": sorted(self.styles),
+            "local_size": size,
+            "max_size": self.max_size,
+        }
@@ -0,0 +1,144 @@
+"""
+八字结果缓存
+
+相同的出生时间、经度、日历类型和性别总是得到相同的排盘结果，
+按规范化输入的哈希做内容寻址，先查进程内LRU，再查Redis。
+缓存键带有算法版本（计算代码和节气表的内容哈希），代码变更后旧缓存自动失效。
+"""
+import hashlib
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional
+
+from redis import RedisError
+
+from app.core.config import settings
+from app.core.redis import get_redis
+
+logger = logging.getLogger(__name__)
+
+BAZI_DIR = os.path.join(os.path.dirname(__file__), '../../bazi')
+
+# 影响排盘结果的文件（含结果字段定义），任一内容变化都会改变算法版本
+ALGORITHM_FILES = (
+    "bazi_tool.py", "result_fields.py", "jieqi_table.py", "jieqi.bin", "lunar_table.py", "lunar.bin",
+)
+
+
+def compute_algorithm_version() -> str:
+    """计算算法版本：ALGORITHM_FILES内容的SHA-256前12位"""
+    digest = hashlib.sha256()
+    for filename in ALGORITHM_FILES:
+        with open(os.path.join(BAZI_DIR, filename), "rb") as f:
+            digest.update(f.read())
+    return digest.hexdigest()[:12]
+
+
+ALGORITHM_VERSION = compute_algorithm_version()
+
+
+class BaziResultCache:
+    """八字结果两级缓存（进程内LRU + Redis）"""
+
+    def __init__(self, max_size: Optional[int] = None, ttl: Optional[int] = None):
+        """
+        Args:
+            max_size: 进程内LRU的最大条目数，默认取配置BAZI_CACHE_SIZE
+            ttl: Redis缓存过期时间（秒），默认取配置BAZI_CACHE_TTL
+        """
+        self.max_size = max_size or settings.BAZI_CACHE_SIZE
+        self.ttl = ttl or settings.BAZI_CACHE_TTL
+        self._local: "OrderedDict[str, dict]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._counters = {"local_hits": 0, "redis_hits": 0, "misses": 0, "redis_errors": 0}
+
+    @staticmethod
+    def make_key(calculator) -> str:
+        """
+        由计算器的规范化输入生成缓存键
+
+        只包含影响排盘结果的字段：日历类型、出生年月日时分、闰月标记（仅农历）、解析后的经度、性别；
+        姓名和城市名称不参与（它们只出现在格式化输出中，命中后再渲染）
+        """
+        canonical = json.dumps(
+            {
+                "calendar": calculator.calendar,
+                "datetime": [calculator.year, calculator.month, calculator.day, calculator.hour, calculator.minute],
+                "leap": calculator.calendar != "公历" and bool(calculator.is_leap_month),
+                "longitude": repr(float(calculator.birth_longitude)),
+                "gender": "男" if calculator.gender == "男" else "女",
+            },
+            ensure_ascii=False,
+            sort_keys=True,
+            separators=(",", ":"),
+        )
+        digest = hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+        return f"bazi:result:{ALGORITHM_VERSION}:{digest}"
+
+    def _count(self, counter: str) -> None:
+        with self._lock:
+            self._counters[counter] += 1
+
+    def _get_local(self, key: str) -> Optional[dict]:
+        with self._lock:
+            snapshot = self._local.get(key)
+            if snapshot is not None:
+                self._local.move_to_end(key)
+            return snapshot
+
+    def _set_local(self, key: str, snapshot: dict) -> None:
+        with self._lock:
+            self._local[key] = snapshot
+            self._local.move_to_end(key)
+            while len(self._local) > self.max_size:
+                self._local.popitem(last=False)
+
+    async def get(self, key: str) -> Optional[dict]:
+        """依次查询进程内LRU和Redis，Redis命中时回填LRU"""
+        snapshot = self._get_local(key)
+        if snapshot is not None:
+            self._count("local_hits")
+            return snapshot
+
+        try:
+            cached = await get_redis().get(key)
+        except RedisError as e:
+            logger.warning(f"八字结果缓存读取Redis失败: {str(e)}")
+            self._count("redis_errors")
+            cached = None
+
+        if cached is None:
+            self._count("misses")
+            return None
+
+        snapshot = json.loads(cached)
+        self._set_local(key, snapshot)
+        self._count("redis_hits")
+        return snapshot
+
+    async def set(self, key: str, snapshot: dict) -> None:
+        """写入进程内LRU和Redis"""
+        self._set_local(key, snapshot)
+        try:
+            await get_redis().set(key, json.dumps(snapshot, ensure_ascii=False), ex=self.ttl)
+        except RedisError as e:
+            logger.warning(f"八字结果缓存写入Redis失败: {str(e)}")
+            self._count("redis_errors")
+
+    def stats(self) -> Dict:
+        """命中统计"""
+        with self._lock:
+            counters = dict(self._counters)
+            size = len(self._local)
+        lookups = counters["local_hits"] + counters["redis_hits"] + counters["misses"]
+        hits = counters["local_hits"] + counters["redis_hits"]
+        return {
+            **counters,
+            "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+            "local_size": size,
+            "max_size": self.max_size,
+            "algorithm_version": ALGORITHM_VERSION,
+        }
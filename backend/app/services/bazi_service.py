@@ -1,18 +1,105 @@
 """
 八字计算服务
 """
+import asyncio
+import functools
+import logging
 import sys
 import os
+import threading
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Iterable, Optional
 
 # 添加bazi模块到Python路径
 sys.path.append(os.path.join(os.path.dirname(__file__), '../../bazi'))
 
 from bazi.bazi_tool import BaZiCalculator
+from bazi.chart_index import get_chart_index, search_charts
+from bazi.city_trie import suggest_cities
+from bazi.result_fields import build_result
+
+from app.core.config import settings
+from app.services.bazi_cache import BaziResultCache
+
+logger = logging.getLogger(__name__)
+
+# 计算执行方式：inline（事件循环内直接计算）/ thread（线程池）/ process（进程池）
+EXECUTOR_MODES = ("inline", "thread", "process")
+
+
+def warm_up():
+    """
+    预热计算所需的数据：加载地区索引、节气表、农历月表并触发sxtwl初始化
+
+    进程池的每个worker启动时执行一次，主进程在应用启动时执行一次，
+    避免首个请求承担这些一次性开销；城市前缀树只在主进程构建（见BaziService.start）
+    """
+    BaZiCalculator("", "男", "公历", 2000, 1, 1, 12, 0, "北京").format_output()
+
+
+def _snapshot_in_worker(kwargs: dict) -> dict:
+    """
+    进程池/线程池中执行的计算入口（需为模块级函数以便序列化）
+    
+    只返回可缓存的派生字段，格式化输出在调用方用restore()渲染
+    """
+    return BaZiCalculator(**kwargs).snapshot()
 
 
 class BaziService:
     """八字计算服务"""
     
+    def __init__(self, executor: Optional[str] = None, max_workers: Optional[int] = None):
+        """
+        Args:
+            executor: 计算执行方式（inline/thread/process），默认取配置BAZI_EXECUTOR
+            max_workers: 线程池/进程池大小，默认取配置BAZI_EXECUTOR_WORKERS
+        """
+        self._executor_mode = executor
+        self._max_workers = max_workers
+        self._executor: Optional[Executor] = None
+        self._executor_lock = threading.Lock()
+        self.cache = BaziResultCache()
+    
+    @property
+    def executor_mode(self) -> str:
+        """当前计算执行方式"""
+        mode = self._executor_mode or settings.BAZI_EXECUTOR
+        if mode not in EXECUTOR_MODES:
+            raise ValueError(f"不支持的八字计算执行方式: {mode}，可选：{'/'.join(EXECUTOR_MODES)}")
+        return mode
+    
+    def _get_executor(self) -> Executor:
+        """按配置创建（仅一次）线程池或进程池"""
+        if self._executor is None:
+            with self._executor_lock:
+                if self._executor is None:
+                    max_workers = self._max_workers or settings.BAZI_EXECUTOR_WORKERS
+                    if self.executor_mode == "process":
+                        self._executor = ProcessPoolExecutor(max_workers=max_workers, initializer=warm_up)
+                    else:
+                        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="bazi")
+                    logger.info(f"八字计算执行器已创建: mode={self.executor_mode}, workers={max_workers}")
+        return self._executor
+    
+    def start(self) -> None:
+        """
+        应用启动时调用：预热本进程的数据（含城市前缀树和八字反查索引，只在主进程提供查询），并提前创建执行器
+        """
+        warm_up()
+        suggest_cities("北京")
+        get_chart_index()
+        if self.executor_mode != "inline":
+            self._get_executor()
+    
+    def shutdown(self) -> None:
+        """应用关闭时调用：释放线程池/进程池"""
+        with self._executor_lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+    
     def calculate(
         self,
         name: str,
@@ -24,10 +111,14 @@ class BaziService:
         hour: int,
         minute: int,
         birth_city: str,
-        current_city: str = None
+        current_city: str = None,
+        is_leap_month: bool = False,
+        fields: Optional[Iterable[str]] = None
     ) -> dict:
         """
-        计算八字
+        计算八字（同步、不经过结果缓存，每次都重新计算）
+        
+        接口请求使用calculate_async（带缓存和执行器）；此方法供离线脚本和基准测试测量实际计算开销
         
         Args:
             name: 姓名
@@ -40,6 +131,9 @@ class BaziService:
             minute: 分
             birth_city: 出生城市
             current_city: 现居城市
+            is_leap_month: 农历输入时月份是否为闰月
+            fields: 需要的结果字段（见bazi/result_fields.py），默认全部；
+                只取"bazi"时不会计算节气、大运和格式化输出
             
         Returns:
             八字结果字典
@@ -54,16 +148,80 @@ class BaziService:
             hour=hour,
             minute=minute,
             birth_city=birth_city,
-            current_city=current_city
+            current_city=current_city,
+            is_leap_month=is_leap_month
         )
         
-        # 构建结果字典
-        result = {
-            "bazi": calculator.ba_zi,
-            "jieqi_info": calculator.jie_qi_info,
-            "dayun_info": calculator.da_yun_info,
-            "formatted_output": calculator.format_output()
-        }
+        return self._build_result(calculator, fields)
+    
+    @staticmethod
+    def _build_result(calculator: BaZiCalculator, fields: Optional[Iterable[str]] = None) -> dict:
+        """构建结果字典（只计算请求的字段，字段定义见bazi/result_fields.py）"""
+        return build_result(calculator, fields)
+    
+    async def calculate_async(self, fields: Optional[Iterable[str]] = None, **kwargs) -> dict:
+        """
+        异步计算八字，参数同calculate
         
-        return result
-
+        先按规范化输入查询结果缓存（进程内LRU + Redis），未命中时按BAZI_EXECUTOR配置
+        在事件循环内直接计算，或交给线程池/进程池执行，避免CPU计算阻塞同一worker上的
+        其它请求（包括进行中的SSE流式对话）
+        """
+        calculator = BaZiCalculator(**kwargs)
+        key = self.cache.make_key(calculator)
+        
+        snapshot = await self.cache.get(key)
+        if snapshot is None:
+            snapshot = await self._compute_snapshot(calculator, kwargs)
+            await self.cache.set(key, snapshot)
+        
+        # 用缓存的派生字段填充计算器，姓名、城市等只参与格式化输出
+        calculator.restore(snapshot)
+        return self._build_result(calculator, fields)
+    
+    async def _compute_snapshot(self, calculator: BaZiCalculator, kwargs: dict) -> dict:
+        """按执行方式计算可缓存的派生字段"""
+        if self.executor_mode == "inline":
+            return calculator.snapshot()
+        
+        loop = asyncio.get_running_loop()
+        try:
+            return await loop.run_in_executor(
+                self._get_executor(),
+                functools.partial(_snapshot_in_worker, kwargs)
+            )
+        except BrokenProcessPool:
+            # worker进程异常退出后进程池不可再用，丢弃以便下次请求重建
+            logger.error("八字计算进程池已损坏，将在下次请求时重建")
+            self.shutdown()
+            raise
+    
+    def suggest_cities(self, keyword: str, limit: int = 10) -> list:
+        """
+        城市名称联想（基于内存前缀树，不访问数据库）
+        
+        Args:
+            keyword: 用户输入的城市名称前缀
+            limit: 返回条数上限
+            
+        Returns:
+            联想结果列表，每项包含name、full_path、level、longitude
+        """
+        return suggest_cities(keyword, limit)
+    
+    def search_charts(self, ba_zi: str) -> list:
+        """
+        八字反查：返回1900～2100年间四柱与ba_zi相同的全部出生时段
+        
+        基于按年月日三柱排序的索引二分查找，时柱由日干推出后逐日核对，不调用sxtwl
+        
+        Args:
+            ba_zi: 四柱字符串，如"甲子 丙寅 戊辰 壬子"
+            
+        Returns:
+            [{"start", "end"}]，真太阳时，按时间升序
+            
+        Raises:
+            ValueError: 四柱格式不正确或干支组合不存在
+        """
+        return [{"start": start, "end": end} for start, end in search_charts(ba_zi)]
@@ -0,0 +1,162 @@
+"""
+对话上下文加载
+
+发送消息前需要：校验用户有八字档案、校验会话归属，并为AI准备对话风格、关联的八字档案和最近的消息，
+以及用户是否付费（模型调用排队时优先，见llm_scheduler）。
+这些数据用一条查询取回（八字档案外连接，档案存在性和付费用EXISTS，最近消息用相关子查询聚合为JSON数组），
+交给LangChainChatService.stream_chat直接使用，流式响应开始前不再另行查询。
+
+最近的消息优先从Redis会话上下文缓冲（ConversationContextBuffer）读取，命中时查询不再包含消息子查询；
+未命中时子查询多取到缓冲容量，结果回填缓冲。实际发送的窗口由context_window.select_context_window按Token预算选取。
+"""
+from datetime import datetime
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from sqlalchemy import exists, func, select
+from sqlalchemy.dialects.postgresql import JSON, aggregate_order_by
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import aliased
+
+from app.models.bazi_profile import BaziProfile
+from app.models.conversation import Conversation
+from app.models.message import Message
+from app.models.order import Order
+from app.services.context_buffer import ConversationContextBuffer
+
+
+class ChatContext(NamedTuple):
+    """一次对话所需的上下文"""
+    conversation_id: str
+    ai_style: str
+    context_size: int
+    # 用户是否有任一八字档案
+    has_bazi_profile: bool
+    # 会话关联的八字档案（name、gender及bazi_result中的字段），未关联或档案已删除时为None
+    bazi_info: Optional[Dict]
+    # 最近的消息，按时间升序：[{"role", "content", "created_at"}]，可多于context_size条
+    history: List[Dict]
+    # 上下文窗口之前的滚动摘要
+    summary: Optional[str] = None
+    # 已并入摘要的最后一条消息的创建时间
+    summary_until: Optional[datetime] = None
+    # (档案ID, 档案版本)，系统提示词缓存键的一部分，未关联档案时为None
+    profile_key: Optional[Tuple[str, str]] = None
+    # 用户是否有已支付的订单
+    is_paid_user: bool = False
+
+
+def build_context_query(conversation_id, user_id, with_history: bool = True, history_limit=None):
+    """
+    构建上下文查询：会话 + 关联档案 + 是否有档案 + 是否付费 + 最近的消息
+
+    Args:
+        with_history: 是否包含最近消息的子查询（上下文缓冲命中时不需要）
+        history_limit: 最近消息的条数，默认取会话的context_size
+    """
+    any_profile = aliased(BaziProfile)
+    columns = [
+        Conversation.id,
+        Conversation.ai_style,
+        Conversation.context_size,
+        Conversation.summary,
+        Conversation.summary_until,
+        BaziProfile.id.label("profile_id"),
+        func.coalesce(BaziProfile.updated_at, BaziProfile.created_at).label("profile_version"),
+        BaziProfile.name,
+        BaziProfile.gender,
+        BaziProfile.bazi_result,
+        exists().where(any_profile.user_id == user_id).label("has_bazi_profile"),
+        exists().where(Order.user_id == user_id, Order.status == "paid").label("is_paid_user"),
+    ]
+
+    if with_history:
+        recent = (
+            select(Message.role, Message.content, Message.created_at)
+            .where(Message.conversation_id == Conversation.id)
+            .order_by(Message.created_at.desc())
+            .limit(Conversation.context_size if history_limit is None else history_limit)
+            .correlate(Conversation)
+            .subquery("recent")
+        )
+        history = (
+            select(func.json_agg(aggregate_order_by(
+                func.json_build_object(
+                    "role", recent.c.role, "content", recent.c.content, "created_at", recent.c.created_at
+                ),
+                recent.c.created_at
+            ), type_=JSON))
+            .scalar_subquery()
+        )
+        columns.append(history.label("history"))
+
+    return (
+        select(*columns)
+        .outerjoin(BaziProfile, BaziProfile.id == Conversation.bazi_profile_id)
+        .where(Conversation.id == conversation_id, Conversation.user_id == user_id)
+    )
+
+
+async def load_chat_context(
+    db: AsyncSession,
+    conversation_id,
+    user_id,
+    buffer: Optional[ConversationContextBuffer] = None
+) -> Optional[ChatContext]:
+    """
+    加载对话上下文（一次数据库往返）
+
+    Args:
+        buffer: 会话上下文缓冲，为None时最近的消息直接从数据库读取
+
+    Returns:
+        ChatContext，会话不存在或不属于该用户时返回None
+    """
+    buffered = await buffer.get(conversation_id) if buffer is not None else None
+
+    if buffered is not None:
+        query = build_context_query(conversation_id, user_id, with_history=False)
+    elif buffer is not None:
+        # 多取到缓冲容量，用于回填；写入计数须在查询之前读取
+        generation = await buffer.get_generation(conversation_id)
+        query = build_context_query(
+            conversation_id, user_id,
+            history_limit=func.greatest(Conversation.context_size, buffer.size)
+        )
+    else:
+        query = build_context_query(conversation_id, user_id)
+
+    result = await db.execute(query)
+    row = result.one_or_none()
+    if row is None:
+        return None
+
+    if buffered is not None:
+        history = buffered
+    else:
+        history = row.history or []
+        if buffer is not None:
+            await buffer.fill(conversation_id, history, generation)
+
+    bazi_info = None
+    profile_key = None
+    if row.profile_id is not None:
+        profile_key = (str(row.profile_id), row.profile_version.isoformat() if row.profile_version else "")
+        bazi_info = {
+            "name": row.name,
+            "gender": row.gender,
+            # 从bazi_result字段获取八字分析数据
+            **(row.bazi_result or {})
+        }
+
+    return ChatContext(
+        conversation_id=str(row.id),
+        ai_style=row.ai_style or "balanced",
+        context_size=row.context_size,
+        has_bazi_profile=row.has_bazi_profile,
+        bazi_info=bazi_info,
+        history=history,
+        summary=row.summary,
+        summary_until=row.summary_until,
+        profile_key=profile_key,
+        is_paid_user=row.is_paid_user,
+    )
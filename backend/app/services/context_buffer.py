@@ -0,0 +1,157 @@
+"""
+会话上下文环形缓冲
+
+每个会话在Redis中保存最近CHAT_CONTEXT_BUFFER_SIZE条消息（列表，按时间升序，超出后裁掉最早的），
+发送消息时读取整个列表再按会话的context_size取末尾若干条，命中时不再查询messages表。
+
+列表只在从数据库完整回填后才存在（追加使用RPUSHX，列表不存在时不写入），
+因此存在即代表"最近的消息全部在列表中"，消息数少于context_size时也可直接使用。
+
+每次追加都会递增该会话的写入计数（列表不存在时也递增）。未命中时先读取写入计数再查询数据库，
+回填时写入计数已变化（查询之后有新消息保存并追加）则放弃回填，避免回填的列表缺少这条消息。
+"""
+import json
+import logging
+import threading
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from redis import RedisError, WatchError
+
+from app.core.config import settings
+from app.core.redis import get_redis
+
+logger = logging.getLogger(__name__)
+
+# 写入计数的过期时间（秒），远大于一次查询到回填的间隔
+GENERATION_TTL = 86400
+
+
+class ConversationContextBuffer:
+    """会话上下文环形缓冲（Redis列表）"""
+
+    def __init__(self, size: Optional[int] = None, ttl: Optional[int] = None):
+        """
+        Args:
+            size: 每个会话保留的消息条数，默认取配置CHAT_CONTEXT_BUFFER_SIZE
+            ttl: 过期时间（秒），每次写入时刷新，默认取配置CHAT_CONTEXT_BUFFER_TTL
+        """
+        self.size = size or settings.CHAT_CONTEXT_BUFFER_SIZE
+        self.ttl = ttl or settings.CHAT_CONTEXT_BUFFER_TTL
+        self._lock = threading.Lock()
+        self._counters = {"hits": 0, "misses": 0, "fills": 0, "appends": 0, "stale_fills_skipped": 0, "redis_errors": 0}
+
+    @staticmethod
+    def make_key(conversation_id) -> str:
+        return f"chat:context:{conversation_id}"
+
+    @staticmethod
+    def generation_key(conversation_id) -> str:
+        return f"chat:context:gen:{conversation_id}"
+
+    def _count(self, counter: str) -> None:
+        with self._lock:
+            self._counters[counter] += 1
+
+    async def get(self, conversation_id) -> Optional[List[Dict]]:
+        """
+        读取缓冲中的全部消息（按时间升序，至多size条），未命中或Redis不可用时返回None
+        """
+        try:
+            cached = await get_redis().lrange(self.make_key(conversation_id), 0, -1)
+        except RedisError as e:
+            logger.warning(f"会话上下文缓冲读取失败: {str(e)}")
+            self._count("redis_errors")
+            cached = []
+
+        if not cached:
+            self._count("misses")
+            return None
+
+        self._count("hits")
+        return [json.loads(item) for item in cached]
+
+    async def get_generation(self, conversation_id) -> Optional[str]:
+        """读取会话的写入计数（未命中、查询数据库之前调用，结果传给fill），从未追加或Redis不可用时返回None"""
+        try:
+            return await get_redis().get(self.generation_key(conversation_id))
+        except RedisError as e:
+            logger.warning(f"会话上下文缓冲读取失败: {str(e)}")
+            self._count("redis_errors")
+            return None
+
+    async def fill(self, conversation_id, messages: List[Dict], generation: Optional[str]) -> None:
+        """
+        用数据库中最近的消息（按时间升序，至多size条）重建缓冲
+
+        Args:
+            generation: 查询数据库之前get_generation()的结果；写入计数已变化时不回填
+        """
+        if not messages:
+            return
+        key = self.make_key(conversation_id)
+        generation_key = self.generation_key(conversation_id)
+        try:
+            async with get_redis().pipeline(transaction=True) as pipe:
+                await pipe.watch(generation_key)
+                if await pipe.get(generation_key) != generation:
+                    self._count("stale_fills_skipped")
+                    return
+                pipe.multi()
+                pipe.delete(key)
+                pipe.rpush(key, *(json.dumps(message, ensure_ascii=False) for message in messages[-self.size:]))
+                pipe.expire(key, self.ttl)
+                await pipe.execute()
+            self._count("fills")
+        except WatchError:
+            # 读取写入计数之后、回填之前有消息追加
+            self._count("stale_fills_skipped")
+        except RedisError as e:
+            logger.warning(f"会话上下文缓冲回填失败: {str(e)}")
+            self._count("redis_errors")
+
+    async def append(self, conversation_id, role: str, content: str, created_at: datetime) -> None:
+        """
+        消息保存后追加到缓冲末尾并裁剪到size条；缓冲不存在时不写入（下次读取时从数据库回填）
+
+        无论缓冲是否存在都递增写入计数，使进行中的回填失效
+        """
+        key = self.make_key(conversation_id)
+        generation_key = self.generation_key(conversation_id)
+        message = json.dumps(
+            {"role": role, "content": content, "created_at": created_at.isoformat()},
+            ensure_ascii=False
+        )
+        try:
+            async with get_redis().pipeline(transaction=True) as pipe:
+                pipe.incr(generation_key)
+                pipe.expire(generation_key, GENERATION_TTL)
+                pipe.rpushx(key, message)
+                pipe.ltrim(key, -self.size, -1)
+                pipe.expire(key, self.ttl)
+                await pipe.execute()
+            self._count("appends")
+        except RedisError as e:
+            logger.warning(f"会话上下文缓冲追加失败: {str(e)}")
+            self._count("redis_errors")
+            # 追加失败会使缓冲缺少这条消息，删除后由下次读取回填
+            await self.discard(conversation_id)
+
+    async def discard(self, conversation_id) -> None:
+        """删除缓冲"""
+        try:
+            await get_redis().delete(self.make_key(conversation_id))
+        except RedisError as e:
+            logger.warning(f"会话上下文缓冲删除失败: {str(e)}")
+            self._count("redis_errors")
+
+    def stats(self) -> Dict:
+        """命中统计，hits即节省的消息查询次数"""
+        with self._lock:
+            counters = dict(self._counters)
+        lookups = counters["hits"] + counters["misses"]
+        return {
+            **counters,
+            "hit_rate": round(counters["hits"] / lookups, 4) if lookups else 0.0,
+            "size": self.size,
+        }
@@ -0,0 +1,125 @@
+"""
+按Token预算选择对话上下文
+
+context_size按消息条数计算，几条professional模式的长回答就会让提示词过长，而简短的问答又用不满上下文。
+这里在最近context_size条消息内，从新到旧按Token预算选取消息窗口；
+窗口之外更早的消息由滚动摘要（Conversation.summary）概括，摘要放在历史消息之前。
+
+Token数为估算值：中日韩字符按1个Token计，其它字符按4个字符1个Token计，每条消息另加固定开销。
+"""
+import math
+import re
+from datetime import datetime
+from typing import Dict, List, NamedTuple, Optional
+
+from app.core.config import settings
+
+# 每条消息的格式开销（角色标记等）
+MESSAGE_OVERHEAD_TOKENS = 4
+
+_CJK_PATTERN = re.compile(r"[\u3000-\u303f\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uff00-\uffef]")
+
+
+def estimate_tokens(text: Optional[str]) -> int:
+    """估算文本的Token数"""
+    if not text:
+        return 0
+    cjk = len(_CJK_PATTERN.findall(text))
+    return cjk + math.ceil((len(text) - cjk) / 4)
+
+
+def message_tokens(message: Dict) -> int:
+    """估算单条消息的Token数（含格式开销）"""
+    return estimate_tokens(message.get("content")) + MESSAGE_OVERHEAD_TOKENS
+
+
+def message_time(message: Dict) -> Optional[datetime]:
+    """消息的创建时间（上下文中为ISO格式字符串）"""
+    created_at = message.get("created_at")
+    if not created_at:
+        return None
+    return datetime.fromisoformat(created_at)
+
+
+class ContextWindow(NamedTuple):
+    """一次对话实际发送给模型的上下文"""
+    # 窗口内的消息，按时间升序
+    messages: List[Dict]
+    # 窗口之前的滚动摘要，没有更早的消息或尚未生成摘要时为None
+    summary: Optional[str]
+    # 窗口之前、尚未并入摘要的消息，按时间升序
+    pending: List[Dict]
+    # 按条数选取（最近context_size条）时的历史Token数
+    baseline_tokens: int
+    # 实际使用的历史Token数（窗口消息 + 摘要）
+    used_tokens: int
+
+    @property
+    def tokens_saved(self) -> int:
+        """相对按条数选取节省的输入Token数（摘要较长时可能为负）"""
+        return self.baseline_tokens - self.used_tokens
+
+
+def select_context_window(
+    history: List[Dict],
+    context_size: int,
+    summary: Optional[str] = None,
+    summary_until: Optional[datetime] = None,
+    token_budget: Optional[int] = None
+) -> ContextWindow:
+    """
+    选取上下文窗口
+
+    Args:
+        history: 最近的消息，按时间升序（可多于context_size条，多出的部分用于判断待摘要的消息）
+        context_size: 窗口最多包含的消息条数
+        summary: 会话当前的滚动摘要
+        summary_until: 已并入摘要的最后一条消息的创建时间
+        token_budget: 历史消息（含摘要）的Token预算，默认取配置CHAT_CONTEXT_TOKEN_BUDGET
+    """
+    budget = settings.CHAT_CONTEXT_TOKEN_BUDGET if token_budget is None else token_budget
+    candidates = history[-context_size:] if context_size else []
+    candidate_tokens = [message_tokens(message) for message in candidates]
+    baseline_tokens = sum(candidate_tokens)
+
+    # 不带摘要时窗口已覆盖全部历史，则不需要摘要
+    start, used = _fit(candidate_tokens, budget)
+    if start == 0 and len(candidates) == len(history):
+        summary = None
+    elif summary:
+        start, used = _fit(candidate_tokens, budget - estimate_tokens(summary))
+        used += estimate_tokens(summary)
+
+    messages = candidates[start:]
+    older = history[:len(history) - len(messages)]
+
+    return ContextWindow(
+        messages=messages,
+        summary=summary,
+        pending=[message for message in older if _is_pending(message, summary_until)],
+        baseline_tokens=baseline_tokens,
+        used_tokens=used,
+    )
+
+
+def _fit(tokens: List[int], budget: int):
+    """
+    从新到旧选取，超出预算即停止，保证窗口是连续的最近消息
+
+    Returns:
+        (窗口起始下标, 窗口Token数)
+    """
+    start = len(tokens)
+    used = 0
+    while start > 0 and used + tokens[start - 1] <= budget:
+        start -= 1
+        used += tokens[start]
+    return start, used
+
+
+def _is_pending(message: Dict, summary_until: Optional[datetime]) -> bool:
+    """消息是否尚未并入摘要"""
+    if summary_until is None:
+        return True
+    created_at = message_time(message)
+    return created_at is None or created_at > summary_until
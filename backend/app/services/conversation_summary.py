@@ -0,0 +1,115 @@
+"""
+会话滚动摘要
+
+上下文窗口（context_window.select_context_window）之外、尚未并入摘要的消息累计到CHAT_SUMMARY_MIN_MESSAGES条后，
+在回复完成后于后台调用模型，将已有摘要与这些消息合并为新摘要，写回Conversation.summary/summary_until。
+同一会话同一时间只运行一个摘要任务；摘要失败不影响对话，下次回复后重试。
+"""
+import asyncio
+import logging
+import threading
+from typing import Dict, List, Optional
+
+from langchain.schema import HumanMessage, SystemMessage
+from langchain_openai import ChatOpenAI
+from sqlalchemy import or_, update
+
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal
+from app.models.conversation import Conversation
+from app.prompts import SystemPromptManager
+from app.services.context_window import ContextWindow, message_time
+
+logger = logging.getLogger(__name__)
+
+
+class ConversationSummarizer:
+    """会话滚动摘要（后台任务）"""
+
+    def __init__(self, min_messages: Optional[int] = None):
+        """
+        Args:
+            min_messages: 窗口外累计多少条未摘要消息后更新摘要，默认取配置CHAT_SUMMARY_MIN_MESSAGES
+        """
+        self.min_messages = min_messages or settings.CHAT_SUMMARY_MIN_MESSAGES
+        self.llm = ChatOpenAI(
+            model=settings.OPENAI_MODEL,
+            temperature=0.3,
+            max_tokens=settings.CHAT_SUMMARY_MAX_TOKENS,
+            openai_api_base=settings.OPENAI_BASE_URL,
+            openai_api_key=settings.OPENAI_API_KEY
+        )
+        # 保留任务引用，避免被回收
+        self._tasks = set()
+        # 正在摘要的会话ID
+        self._running = set()
+        self._lock = threading.Lock()
+        self._counters = {"scheduled": 0, "completed": 0, "failed": 0}
+
+    def _count(self, counter: str) -> None:
+        with self._lock:
+            self._counters[counter] += 1
+
+    def schedule(self, conversation_id: str, window: ContextWindow) -> bool:
+        """
+        回复完成后调用：未摘要的消息足够多时启动后台摘要任务
+
+        Returns:
+            是否启动了任务
+        """
+        pending = window.pending
+        if len(pending) < self.min_messages or message_time(pending[-1]) is None:
+            return False
+        with self._lock:
+            if conversation_id in self._running:
+                return False
+            self._running.add(conversation_id)
+            self._counters["scheduled"] += 1
+
+        task = asyncio.create_task(self._run(conversation_id, window.summary, pending))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return True
+
+    async def summarize(self, previous_summary: Optional[str], messages: List[Dict]) -> str:
+        """合并已有摘要与新增对话，返回新摘要"""
+        response = await self.llm.ainvoke([
+            SystemMessage(content=SystemPromptManager.SUMMARY_INSTRUCTION),
+            HumanMessage(content=SystemPromptManager.build_summary_prompt(previous_summary, messages))
+        ])
+        return response.content.strip()
+
+    async def _run(self, conversation_id: str, previous_summary: Optional[str], pending: List[Dict]) -> None:
+        try:
+            summary = await self.summarize(previous_summary, pending)
+            if not summary:
+                return
+            summary_until = message_time(pending[-1])
+            async with AsyncSessionLocal() as db:
+                # 只向前推进，避免覆盖并发请求写入的更新摘要；不改变会话的updated_at
+                await db.execute(
+                    update(Conversation)
+                    .where(
+                        Conversation.id == conversation_id,
+                        or_(Conversation.summary_until.is_(None), Conversation.summary_until < summary_until)
+                    )
+                    .values(
+                        summary=summary,
+                        summary_until=summary_until,
+                        updated_at=Conversation.updated_at
+                    )
+                )
+                await db.commit()
+            self._count("completed")
+            logger.info(f"📝 会话摘要已更新: {conversation_id}，并入{len(pending)}条消息")
+        except Exception as e:
+            self._count("failed")
+            logger.warning(f"会话摘要失败: {conversation_id}: {str(e)}")
+        finally:
+            with self._lock:
+                self._running.discard(conversation_id)
+
+    def stats(self) -> Dict:
+        """任务统计"""
+        with self._lock:
+            return {**self._counters, "running": len(self._running)}
@@ -2,88 +2,135 @@
 LangChain AI对话服务
 """
 import json
-from typing import AsyncGenerator, Dict, Optional
+from typing import Any, AsyncGenerator, AsyncIterator, Dict, List, Optional, Tuple
 from langchain_openai import ChatOpenAI
+from langchain_openai.chat_models.base import _convert_delta_to_message_chunk
 from langchain.prompts import ChatPromptTemplate
 from langchain.schema import HumanMessage, AIMessage, SystemMessage
-from sqlalchemy.orm import Session
+from langchain_core.messages import AIMessageChunk
+from langchain_core.outputs import ChatGenerationChunk
 
 from app.core.config import settings
-from app.models.conversation import Conversation
-from app.models.message import Message
-from app.models.bazi_profile import BaziProfile
 from app.prompts import SystemPromptManager
+from app.services.answer_cache import AnswerCache
+from app.services.chat_context import ChatContext
+from app.services.context_window import ContextWindow, select_context_window
+from app.services.llm_flight import StreamCoalescer, payload_hash
+from app.services.llm_scheduler import LLMScheduler, QueueTimeout, Ticket
+from app.services.prompt_cache import SystemPrompt, SystemPromptCache, cached_prompt_tokens
+
+
+class UsageChatOpenAI(ChatOpenAI):
+    """
+    流式响应结束时带回服务端usage的ChatOpenAI
+
+    langchain-openai会跳过choices为空的数据块，而stream_options.include_usage的usage正是放在
+    最后一个choices为空的数据块中。这里在其余处理不变的前提下，把usage作为一个空内容块的
+    additional_kwargs["usage"]输出。
+    """
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs: Any) -> AsyncIterator[ChatGenerationChunk]:
+        message_dicts, params = self._create_message_dicts(messages, stop)
+        params = {**params, **kwargs, "stream": True}
+
+        default_chunk_class = AIMessageChunk
+        async for chunk in await self.async_client.create(messages=message_dicts, **params):
+            if not isinstance(chunk, dict):
+                chunk = chunk.dict()
+            if chunk.get("usage"):
+                yield ChatGenerationChunk(
+                    message=AIMessageChunk(content="", additional_kwargs={"usage": chunk["usage"]})
+                )
+            if len(chunk["choices"]) == 0:
+                continue
+            choice = chunk["choices"][0]
+            message_chunk = _convert_delta_to_message_chunk(choice["delta"], default_chunk_class)
+            finish_reason = choice.get("finish_reason")
+            generation_info = dict(finish_reason=finish_reason) if finish_reason is not None else None
+            default_chunk_class = message_chunk.__class__
+            generation_chunk = ChatGenerationChunk(message=message_chunk, generation_info=generation_info)
+            yield generation_chunk
+            if run_manager:
+                await run_manager.on_llm_new_token(token=generation_chunk.text, chunk=generation_chunk)
 
 
 class LangChainChatService:
     """LangChain聊天服务"""
     
     def __init__(self):
-        self.llm = ChatOpenAI(
+        model_kwargs = {}
+        if settings.OPENAI_STREAM_USAGE:
+            model_kwargs["extra_body"] = {"stream_options": {"include_usage": True}}
+        self.llm = UsageChatOpenAI(
             model=settings.OPENAI_MODEL,
             temperature=settings.OPENAI_TEMPERATURE,
             max_tokens=settings.OPENAI_MAX_TOKENS,
             streaming=True,
             openai_api_base=settings.OPENAI_BASE_URL,
-            openai_api_key=settings.OPENAI_API_KEY
+            openai_api_key=settings.OPENAI_API_KEY,
+            model_kwargs=model_kwargs
         )
+        self.prompt_cache = SystemPromptCache()
+        self.answer_cache = AnswerCache()
+        self.coalescer = StreamCoalescer()
+        self.scheduler = LLMScheduler()
     
     def _build_system_prompt(
         self,
         ai_style: str = "balanced",
-        bazi_info: Optional[Dict] = None
-    ) -> str:
+        bazi_info: Optional[Dict] = None,
+        profile_key: Optional[Tuple[str, str]] = None
+    ) -> SystemPrompt:
         """
-        构建系统提示词
+        获取系统提示词（按对话风格和档案版本缓存）
         
         Args:
             ai_style: AI对话风格 (simple/balanced/professional)
             bazi_info: 八字档案信息（包含name, gender和bazi_result中的数据）
+            profile_key: (档案ID, 档案版本)
             
         Returns:
-            完整的系统提示词
+            系统提示词及其哈希、版本
         """
-        return SystemPromptManager.build_system_prompt(
-            ai_style=ai_style,
-            bazi_info=bazi_info
-        )
+        return self.prompt_cache.get(ai_style, bazi_info, profile_key)
     
-    def _load_context_messages(
-        self,
-        conversation_id: str,
-        context_size: int,
-        db: Session
-    ) -> list:
-        """加载上下文消息"""
-        messages = db.query(Message).filter(
-            Message.conversation_id == conversation_id
-        ).order_by(Message.created_at.desc()).limit(context_size).all()
-        
-        # 转换为LangChain消息格式
+    @staticmethod
+    def _to_langchain_messages(history: List[Dict]) -> list:
+        """将上下文消息转换为LangChain消息格式"""
         context = []
-        for msg in reversed(messages):
-            if msg.role == "user":
-                context.append(HumanMessage(content=msg.content))
-            elif msg.role == "assistant":
-                context.append(AIMessage(content=msg.content))
+        for msg in history:
+            if msg["role"] == "user":
+                context.append(HumanMessage(content=msg["content"]))
+            elif msg["role"] == "assistant":
+                context.append(AIMessage(content=msg["content"]))
         
         return context
     
+    @staticmethod
+    def select_window(context: ChatContext) -> ContextWindow:
+        """按Token预算选取上下文窗口"""
+        return select_context_window(
+            context.history,
+            context.context_size,
+            summary=context.summary,
+            summary_until=context.summary_until
+        )
+    
     async def stream_chat(
         self,
         user_message: str,
-        conversation_id: str,
-        user_id: str,
-        db: Session
+        context: ChatContext,
+        window: Optional[ContextWindow] = None,
+        ticket: Optional[Ticket] = None
     ) -> AsyncGenerator[Dict, None]:
         """
         流式对话
         
         Args:
             user_message: 用户消息
-            conversation_id: 会话ID
-            user_id: 用户ID
-            db: 数据库会话
+            context: 对话上下文（由load_chat_context加载，不再查询数据库）
+            window: 上下文窗口，默认按Token预算从context中选取
+            ticket: 调度凭据（scheduler.reserve()），需要发起上游调用时先获取全局名额，排队期间产出queue块
             
         Yields:
             消息块字典
@@ -91,76 +138,139 @@ class LangChainChatService:
         import logging
         logger = logging.getLogger(__name__)
         
-        # 获取会话信息
-        conversation = db.query(Conversation).filter(
-            Conversation.id == conversation_id
-        ).first()
-        
-        logger.info(f"📌 会话ID: {conversation_id}")
-        logger.info(f"🎨 对话模式: {conversation.ai_style}")
-        logger.info(f"📊 上下文条数: {conversation.context_size}")
-        logger.info(f"🔗 关联八字档案ID: {conversation.bazi_profile_id}")
+        if window is None:
+            window = self.select_window(context)
         
-        # 获取AI对话风格
-        ai_style = conversation.ai_style or "balanced"
+        logger.info(f"📌 会话ID: {context.conversation_id}")
+        logger.info(f"🎨 对话模式: {context.ai_style}")
+        logger.info(
+            f"📊 上下文条数: {len(window.messages)}/{context.context_size}，"
+            f"Token: {window.used_tokens}/{window.baseline_tokens}"
+            f"{'（含摘要）' if window.summary else ''}"
+        )
         
-        # 获取八字信息（如果有）
-        bazi_info = None
-        if conversation.bazi_profile_id:
-            logger.info(f"🔍 正在查询八字档案: {conversation.bazi_profile_id}")
-            profile = db.query(BaziProfile).filter(
-                BaziProfile.id == conversation.bazi_profile_id
-            ).first()
-            
-            if profile:
-                # 组合八字档案的完整信息
-                bazi_info = {
-                    'name': profile.name,
-                    'gender': profile.gender,
-                    # 从bazi_result字段获取八字分析数据
-                    **(profile.bazi_result or {})
-                }
-                logger.info(f"✅ 八字档案加载成功: {profile.name} ({profile.gender})")
-                logger.info(f"   八字字段: {list(profile.bazi_result.keys()) if profile.bazi_result else '无'}")
-            else:
-                logger.warning(f"⚠️ 未找到八字档案: {conversation.bazi_profile_id}")
+        bazi_info = context.bazi_info
+        if bazi_info:
+            logger.info(f"✅ 八字档案: {bazi_info.get('name')} ({bazi_info.get('gender')})")
         else:
             logger.info("ℹ️ 当前会话未关联八字档案")
         
-        # 构建系统提示（传入ai_style和完整的bazi_info）
+        # 获取系统提示（传入ai_style和完整的bazi_info）
         system_prompt = self._build_system_prompt(
-            ai_style=ai_style,
-            bazi_info=bazi_info
+            ai_style=context.ai_style,
+            bazi_info=bazi_info,
+            profile_key=context.profile_key
         )
+        logger.info(f"🧩 系统提示词: v{system_prompt.version} {system_prompt.hash}")
+        
+        # 没有历史上下文的提问可使用回答缓存，命中时按相同的数据块格式重放
+        answer_key = None
+        if self.answer_cache.applies_to(context.ai_style, has_context=bool(window.messages or window.summary)):
+            answer_key = self.answer_cache.make_key(
+                user_message, system_prompt.hash, context.ai_style, system_prompt.version
+            )
+        if answer_key:
+            cached_chunks = await self.answer_cache.get(answer_key)
+            if cached_chunks is not None:
+                logger.info("♻️ 命中回答缓存")
+                for token_count, content in enumerate(cached_chunks, 1):
+                    yield {
+                        "type": "token",
+                        "content": content,
+                        "token_cost": token_count
+                    }
+                yield {
+                    "type": "usage",
+                    "prompt_hash": system_prompt.hash,
+                    "prompt_version": system_prompt.version,
+                    "prompt_tokens": None,
+                    "completion_tokens": None,
+                    "cached_tokens": None,
+                    "answer_cache": "hit"
+                }
+                return
         
         # 加载上下文
-        context_messages = self._load_context_messages(
-            conversation_id,
-            conversation.context_size,
-            db
-        )
+        context_messages = self._to_langchain_messages(window.messages)
         
-        # 构建完整消息列表
-        messages = [SystemMessage(content=system_prompt)]
+        # 构建完整消息列表：系统提示 + 滚动摘要 + 窗口内的消息 + 本次提问
+        messages = [SystemMessage(content=system_prompt.text)]
+        if window.summary:
+            messages.append(SystemMessage(content=SystemPromptManager.SUMMARY_PREFIX + window.summary))
         messages.extend(context_messages)
         messages.append(HumanMessage(content=user_message))
         
         # 流式生成响应
         full_response = ""
         token_count = 0
+        usage = None
+        chunks = []
         
-        try:
-            async for chunk in self.llm.astream(messages):
-                content = chunk.content
-                if content:
-                    full_response += content
-                    token_count += 1
-                    
+        # 正在进行中的相同请求（消息列表和模型参数都相同）共用一次上游调用
+        flight_key = payload_hash(messages, {
+            "model": self.llm.model_name,
+            "temperature": self.llm.temperature,
+            "max_tokens": self.llm.max_tokens,
+        })
+        
+        # 需要发起上游调用时先获取全局名额，排队期间推送排队位置
+        on_done = None
+        if ticket is not None and not self.coalescer.in_flight(flight_key):
+            try:
+                async for position in self.scheduler.acquire(ticket):
                     yield {
-                        "type": "token",
-                        "content": content,
-                        "token_cost": token_count
+                        "type": "queue",
+                        "position": position
                     }
+            except QueueTimeout:
+                logger.warning(f"⏳ 排队超时: {context.conversation_id}")
+                yield {
+                    "type": "error",
+                    "message": "当前咨询人数较多，排队超时，请稍后再试"
+                }
+                return
+        if ticket is not None:
+            on_done = lambda: self.scheduler.release_slot(ticket)
+        
+        try:
+            stream, leader = self.coalescer.join(flight_key, lambda: self.llm.astream(messages), on_done=on_done)
+            try:
+                async for chunk in stream:
+                    if chunk.additional_kwargs.get("usage"):
+                        usage = chunk.additional_kwargs["usage"]
+                    content = chunk.content
+                    if content:
+                        full_response += content
+                        token_count += 1
+                        chunks.append(content)
+                        
+                        yield {
+                            "type": "token",
+                            "content": content,
+                            "token_cost": token_count
+                        }
+            finally:
+                # 客户端断开时立即退订（所有订阅者都离开后取消上游调用）
+                await stream.aclose()
+            
+            if answer_key and chunks and leader:
+                await self.answer_cache.set(answer_key, chunks)
+            
+            # 提示词哈希与服务端usage（服务端未返回usage时各Token数为None），由调用方记录，不发送给前端；
+            # 合并的请求共享发起请求的usage，不重复计入统计
+            cached_tokens = None
+            if usage:
+                cached_tokens = self.prompt_cache.record_usage(usage) if leader else cached_prompt_tokens(usage)
+            yield {
+                "type": "usage",
+                "prompt_hash": system_prompt.hash,
+                "prompt_version": system_prompt.version,
+                "prompt_tokens": usage.get("prompt_tokens") if usage else None,
+                "completion_tokens": usage.get("completion_tokens") if usage else None,
+                "cached_tokens": cached_tokens,
+                "answer_cache": "miss" if answer_key else None,
+                "coalesced": not leader
+            }
         
         except Exception as e:
             yield {
@@ -0,0 +1,194 @@
+"""
+相同模型请求合并（single-flight）
+
+分享海报传播时，大量用户会在几秒内打开同一会话并发出相同的首个提问，每个请求各自调用一次模型。
+这里按请求内容（完整消息列表和模型参数）的哈希合并正在进行中的相同请求：
+第一个请求启动上游流式调用，之后到达的相同请求订阅同一个流，从头重放已收到的数据块并继续接收后续数据块。
+
+上游调用由独立的任务驱动，某个客户端断开不影响其它订阅者；所有订阅者都离开后取消上游调用。
+合并只在当前worker进程内进行，上游结束后即移除，之后的相同请求重新调用模型。
+每个客户端仍各自保存消息、扣减余额。
+上游调用结束时调用发起请求传入的on_done（归还调度名额，见llm_scheduler）。
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import threading
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Tuple
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+def payload_hash(messages: List[Any], params: Dict) -> str:
+    """请求内容哈希：消息类型与内容 + 模型参数"""
+    canonical = json.dumps(
+        {
+            "messages": [[message.type, message.content] for message in messages],
+            "params": params,
+        },
+        ensure_ascii=False,
+        sort_keys=True,
+        separators=(",", ":"),
+    )
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class InFlightStream:
+    """一次进行中的上游流式调用，缓存已收到的数据块供订阅者重放"""
+
+    def __init__(
+        self,
+        key: str,
+        on_finish: Callable[["InFlightStream"], None],
+        on_done: Optional[Callable[[], None]] = None
+    ):
+        self.key = key
+        self.items: List[Any] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.subscribers = 0
+        self._on_finish = on_finish
+        self._on_done = on_done
+        self._changed = asyncio.Condition()
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self, source: AsyncIterator) -> None:
+        self._task = asyncio.create_task(self._pump(source))
+
+    async def _pump(self, source: AsyncIterator) -> None:
+        try:
+            async for item in source:
+                self.items.append(item)
+                async with self._changed:
+                    self._changed.notify_all()
+        except asyncio.CancelledError:
+            self.error = RuntimeError("上游调用已取消")
+        except Exception as e:
+            self.error = e
+        finally:
+            self.done = True
+            self._on_finish(self)
+            if self._on_done is not None:
+                self._on_done()
+            async with self._changed:
+                self._changed.notify_all()
+
+    def subscribe(self) -> AsyncIterator:
+        """
+        订阅：从头依次产出数据块，上游出错时抛出同一异常
+
+        订阅时即计入订阅者，返回的迭代器需立即开始迭代
+        """
+        self.subscribers += 1
+        return self._iterate()
+
+    async def _iterate(self) -> AsyncIterator:
+        position = 0
+        try:
+            while True:
+                while position < len(self.items):
+                    yield self.items[position]
+                    position += 1
+                if self.done:
+                    if self.error is not None:
+                        raise self.error
+                    return
+                async with self._changed:
+                    await self._changed.wait_for(lambda: self.done or position < len(self.items))
+        finally:
+            self.subscribers -= 1
+            if self.subscribers == 0 and not self.done and self._task is not None:
+                # 所有客户端都已断开，不再需要上游结果
+                self._task.cancel()
+
+
+class StreamCoalescer:
+    """相同模型请求合并"""
+
+    def __init__(self, enabled: Optional[bool] = None):
+        """
+        Args:
+            enabled: 是否启用，默认取配置CHAT_COALESCE_ENABLED
+        """
+        self.enabled = settings.CHAT_COALESCE_ENABLED if enabled is None else enabled
+        self._flights: Dict[str, InFlightStream] = {}
+        self._lock = threading.Lock()
+        self._counters = {"upstream_calls": 0, "coalesced": 0}
+
+    def _finish(self, flight: InFlightStream) -> None:
+        if self._flights.get(flight.key) is flight:
+            del self._flights[flight.key]
+
+    def in_flight(self, key: str) -> bool:
+        """是否有进行中的相同请求（加入时不会发起新的上游调用）"""
+        if not self.enabled:
+            return False
+        flight = self._flights.get(key)
+        return flight is not None and not flight.done
+
+    def join(
+        self,
+        key: str,
+        factory: Callable[[], AsyncIterator],
+        on_done: Optional[Callable[[], None]] = None
+    ) -> Tuple[AsyncIterator, bool]:
+        """
+        订阅请求key对应的流，没有进行中的相同请求时调用factory()启动上游
+
+        Args:
+            key: 请求内容哈希
+            factory: 启动上游调用
+            on_done: 本次发起的上游调用结束时调用；加入进行中的请求时立即调用
+
+        Returns:
+            (数据块异步迭代器, 是否为发起上游调用的请求)
+        """
+        if not self.enabled:
+            self._count("upstream_calls")
+            source = factory()
+            return (source if on_done is None else self._guard(source, on_done)), True
+
+        if self.in_flight(key):
+            flight = self._flights[key]
+            self._count("coalesced")
+            logger.info(f"🔗 合并相同的模型请求: {key[:16]}（当前{flight.subscribers}个订阅者）")
+            if on_done is not None:
+                on_done()
+            return flight.subscribe(), False
+
+        flight = InFlightStream(key, self._finish, on_done)
+        self._flights[key] = flight
+        flight.start(factory())
+        self._count("upstream_calls")
+        return flight.subscribe(), True
+
+    @staticmethod
+    async def _guard(source: AsyncIterator, on_done: Callable[[], None]) -> AsyncIterator:
+        """未启用合并时，在上游迭代结束（含出错、客户端断开）后调用on_done"""
+        try:
+            async for item in source:
+                yield item
+        finally:
+            try:
+                await source.aclose()
+            finally:
+                on_done()
+
+    def _count(self, counter: str) -> None:
+        with self._lock:
+            self._counters[counter] += 1
+
+    def stats(self) -> Dict:
+        """合并统计，coalesced即节省的模型调用次数"""
+        with self._lock:
+            counters = dict(self._counters)
+        requests = counters["upstream_calls"] + counters["coalesced"]
+        return {
+            **counters,
+            "coalesce_rate": round(counters["coalesced"] / requests, 4) if requests else 0.0,
+            "in_flight": len(self._flights),
+            "enabled": self.enabled,
+        }
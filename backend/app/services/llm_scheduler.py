@@ -0,0 +1,222 @@
+"""
+模型调用调度
+
+没有限制时，突发流量会让worker同时发起大量流式调用，耗尽服务端的速率限制后所有用户同时报错；
+同一用户也可以并行发起多次生成。调度规则：
+- 每个用户、每个会话同一时间只能有一个进行中的回复（含排队），否则直接拒绝（429）
+- 全局同时进行的上游调用不超过LLM_MAX_CONCURRENCY，超出的请求排队；
+  排队数达到LLM_MAX_QUEUE时直接拒绝（503），排队超过LLM_QUEUE_TIMEOUT秒时返回错误
+- 排队按先来先服务，付费用户（有已支付订单）优先：两类都有人排队时，
+  每连续LLM_PAID_PRIORITY_WEIGHT个付费用户之后放行一个普通用户，避免普通用户一直等待
+- 排队期间通过SSE推送排队位置（queue事件）
+
+只占用上游调用的请求才需要全局名额：命中回答缓存、合并到进行中相同请求的不排队。
+调度状态保存在当前worker进程内，只在事件循环中访问。
+登记由流式响应结束时的后台任务解除（含客户端在响应开始前断开）；作为兜底，超过LLM_RESERVATION_TTL秒的登记视为已失效。
+"""
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import AsyncIterator, Dict, Optional
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class SchedulerRejected(Exception):
+    """请求被调度拒绝（同一用户/会话已有进行中的回复，或排队已满）"""
+
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+class QueueTimeout(Exception):
+    """排队超时"""
+
+
+class Ticket:
+    """一次回复生成的调度凭据"""
+
+    def __init__(self, user_id: str, conversation_id: str, paid: bool):
+        self.user_id = user_id
+        self.conversation_id = conversation_id
+        self.paid = paid
+        self.reserved_at = time.monotonic()
+        # 放行（获得全局名额）时置位
+        self.granted = asyncio.Event()
+        self.holds_slot = False
+        self.queued = False
+
+
+class LLMScheduler:
+    """模型调用调度器"""
+
+    def __init__(
+        self,
+        max_concurrency: Optional[int] = None,
+        max_queue: Optional[int] = None,
+        queue_timeout: Optional[float] = None,
+        paid_weight: Optional[int] = None,
+        reservation_ttl: Optional[float] = None
+    ):
+        """
+        Args:
+            max_concurrency: 同时进行的上游调用上限，默认取配置LLM_MAX_CONCURRENCY
+            max_queue: 排队上限，默认取配置LLM_MAX_QUEUE
+            queue_timeout: 排队超时（秒），默认取配置LLM_QUEUE_TIMEOUT
+            paid_weight: 付费用户连续优先放行的个数，默认取配置LLM_PAID_PRIORITY_WEIGHT
+            reservation_ttl: 登记的最长有效期（秒），默认取配置LLM_RESERVATION_TTL
+        """
+        self.max_concurrency = max_concurrency or settings.LLM_MAX_CONCURRENCY
+        self.max_queue = max_queue or settings.LLM_MAX_QUEUE
+        self.queue_timeout = queue_timeout or settings.LLM_QUEUE_TIMEOUT
+        self.paid_weight = paid_weight or settings.LLM_PAID_PRIORITY_WEIGHT
+        self.reservation_ttl = reservation_ttl or settings.LLM_RESERVATION_TTL
+        # 排队位置推送间隔（秒）
+        self.position_interval = 1.0
+        self._active = 0
+        self._paid_queue: deque = deque()
+        self._free_queue: deque = deque()
+        self._paid_streak = 0
+        # 用户ID/会话ID -> 进行中的登记
+        self._users: Dict[str, Ticket] = {}
+        self._conversations: Dict[str, Ticket] = {}
+        self._counters = {
+            "granted": 0, "queued": 0, "timeouts": 0, "expired": 0,
+            "rejected_busy_user": 0, "rejected_queue_full": 0,
+        }
+
+    def reserve(self, user_id: str, conversation_id: str, paid: bool = False) -> Ticket:
+        """
+        登记一次回复生成（保存用户消息之前调用），请求结束时必须调用release()
+
+        Raises:
+            SchedulerRejected: 同一用户或会话已有进行中的回复，或排队已满
+        """
+        for reservations, key in ((self._users, user_id), (self._conversations, conversation_id)):
+            current = reservations.get(key)
+            if current is None:
+                continue
+            if time.monotonic() - current.reserved_at < self.reservation_ttl:
+                self._counters["rejected_busy_user"] += 1
+                raise SchedulerRejected(429, "上一条回复尚未完成，请稍候再发送")
+            logger.warning(f"调度登记已失效: 用户{current.user_id} 会话{current.conversation_id}")
+            self._counters["expired"] += 1
+            self.release(current)
+        if self._active >= self.max_concurrency and self.queue_length >= self.max_queue:
+            self._counters["rejected_queue_full"] += 1
+            raise SchedulerRejected(503, "当前咨询人数较多，请稍后再试")
+
+        ticket = Ticket(user_id, conversation_id, paid)
+        self._users[user_id] = ticket
+        self._conversations[conversation_id] = ticket
+        return ticket
+
+    @property
+    def queue_length(self) -> int:
+        return len(self._paid_queue) + len(self._free_queue)
+
+    def position(self, ticket: Ticket) -> int:
+        """
+        排队位置（从1开始，普通用户按排在所有付费用户之后估计）
+        """
+        if ticket.paid:
+            return self._paid_queue.index(ticket) + 1
+        return len(self._paid_queue) + self._free_queue.index(ticket) + 1
+
+    async def acquire(self, ticket: Ticket) -> AsyncIterator[int]:
+        """
+        获取全局名额，排队期间在位置变化时产出排队位置
+
+        Raises:
+            QueueTimeout: 排队超时
+        """
+        if ticket.holds_slot:
+            return
+        if self._active < self.max_concurrency and not self.queue_length:
+            self._grant(ticket)
+            return
+
+        (self._paid_queue if ticket.paid else self._free_queue).append(ticket)
+        ticket.queued = True
+        self._counters["queued"] += 1
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.queue_timeout
+        last_position = None
+        try:
+            while not ticket.granted.is_set():
+                position = self.position(ticket)
+                if position != last_position:
+                    last_position = position
+                    yield position
+                    if ticket.granted.is_set():
+                        break
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    self._counters["timeouts"] += 1
+                    raise QueueTimeout()
+                try:
+                    await asyncio.wait_for(ticket.granted.wait(), timeout=min(self.position_interval, remaining))
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            if ticket.queued:
+                self._dequeue(ticket)
+
+    def release_slot(self, ticket: Ticket) -> None:
+        """上游调用结束后归还全局名额并放行排队的请求"""
+        if not ticket.holds_slot:
+            return
+        ticket.holds_slot = False
+        self._active -= 1
+        self._dispatch()
+
+    def release(self, ticket: Ticket) -> None:
+        """请求结束（正常完成、出错或客户端断开）"""
+        if ticket.queued:
+            self._dequeue(ticket)
+        self.release_slot(ticket)
+        if self._users.get(ticket.user_id) is ticket:
+            del self._users[ticket.user_id]
+        if self._conversations.get(ticket.conversation_id) is ticket:
+            del self._conversations[ticket.conversation_id]
+
+    def _grant(self, ticket: Ticket) -> None:
+        ticket.holds_slot = True
+        self._active += 1
+        self._counters["granted"] += 1
+        ticket.granted.set()
+
+    def _dequeue(self, ticket: Ticket) -> None:
+        ticket.queued = False
+        queue = self._paid_queue if ticket.paid else self._free_queue
+        if ticket in queue:
+            queue.remove(ticket)
+
+    def _dispatch(self) -> None:
+        """有空闲名额时按优先级放行排队的请求"""
+        while self._active < self.max_concurrency and self.queue_length:
+            if self._paid_queue and (not self._free_queue or self._paid_streak < self.paid_weight):
+                ticket = self._paid_queue.popleft()
+                self._paid_streak += 1
+            else:
+                ticket = self._free_queue.popleft()
+                self._paid_streak = 0
+            ticket.queued = False
+            self._grant(ticket)
+
+    def stats(self) -> Dict:
+        """调度统计"""
+        return {
+            **self._counters,
+            "active": self._active,
+            "max_concurrency": self.max_concurrency,
+            "queue_paid": len(self._paid_queue),
+            "queue_free": len(self._free_queue),
+            "max_queue": self.max_queue,
+            "generating_users": len(self._users),
+        }
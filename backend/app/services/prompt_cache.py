@@ -0,0 +1,125 @@
+"""
+系统提示词缓存与服务端前缀缓存统计
+
+OpenAI、DeepSeek等服务端会缓存请求中相同的前缀，命中部分按更低价格计费且首字更快。
+系统提示词按固定顺序拼装（角色 + 对话模式 → 用户档案），摘要和历史消息在其后，
+同一对话模式的用户共享最长的前缀，同一会话的连续请求共享整个系统提示词。
+
+拼装结果按(提示词版本, ai_style, 档案ID, 档案版本)缓存在进程内LRU中，并记录内容哈希；
+服务端返回的usage（其中命中前缀缓存的Token数）在这里汇总，并与提示词哈希一起记录在AI消息的extra_data中，
+用于核对缓存命中率。
+"""
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, NamedTuple, Optional, Tuple
+
+from app.core.config import settings
+from app.prompts import SystemPromptManager
+
+
+class SystemPrompt(NamedTuple):
+    """拼装好的系统提示词"""
+    text: str
+    # 内容哈希（sha256前16位）
+    hash: str
+    version: str
+
+
+def cached_prompt_tokens(usage: Dict) -> int:
+    """
+    从服务端usage中取命中前缀缓存的Token数
+
+    OpenAI为prompt_tokens_details.cached_tokens，DeepSeek为prompt_cache_hit_tokens
+    """
+    details = usage.get("prompt_tokens_details") or {}
+    return details.get("cached_tokens") or usage.get("prompt_cache_hit_tokens") or 0
+
+
+class SystemPromptCache:
+    """系统提示词进程内LRU缓存"""
+
+    def __init__(self, max_size: Optional[int] = None):
+        """
+        Args:
+            max_size: 最大条目数，默认取配置SYSTEM_PROMPT_CACHE_SIZE
+        """
+        self.max_size = max_size or settings.SYSTEM_PROMPT_CACHE_SIZE
+        self._local: "OrderedDict[Tuple, SystemPrompt]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._counters = {
+            "hits": 0, "misses": 0,
+            "usage_reports": 0, "prompt_tokens": 0, "cached_tokens": 0,
+        }
+
+    @staticmethod
+    def build(ai_style: str, bazi_info: Optional[Dict]) -> SystemPrompt:
+        """拼装系统提示词（不经过缓存）"""
+        text = SystemPromptManager.build_system_prompt(ai_style=ai_style, bazi_info=bazi_info)
+        digest = hashlib.sha256(text.encode("utf-8")).hexdigest()[:16]
+        return SystemPrompt(text=text, hash=digest, version=SystemPromptManager.PROMPT_VERSION)
+
+    def get(
+        self,
+        ai_style: str,
+        bazi_info: Optional[Dict] = None,
+        profile_key: Optional[Tuple[str, str]] = None
+    ) -> SystemPrompt:
+        """
+        获取系统提示词
+
+        Args:
+            ai_style: 对话风格
+            bazi_info: 八字档案信息（包含name, gender和bazi_result中的数据）
+            profile_key: (档案ID, 档案版本)，有档案但未提供时不缓存
+        """
+        if bazi_info and profile_key is None:
+            return self.build(ai_style, bazi_info)
+
+        key = (SystemPromptManager.PROMPT_VERSION, ai_style, profile_key)
+        with self._lock:
+            prompt = self._local.get(key)
+            if prompt is not None:
+                self._local.move_to_end(key)
+                self._counters["hits"] += 1
+                return prompt
+            self._counters["misses"] += 1
+
+        prompt = self.build(ai_style, bazi_info)
+        with self._lock:
+            self._local[key] = prompt
+            self._local.move_to_end(key)
+            while len(self._local) > self.max_size:
+                self._local.popitem(last=False)
+        return prompt
+
+    def record_usage(self, usage: Dict) -> int:
+        """
+        汇总服务端返回的usage
+
+        Returns:
+            本次命中前缀缓存的Token数
+        """
+        cached = cached_prompt_tokens(usage)
+        with self._lock:
+            self._counters["usage_reports"] += 1
+            self._counters["prompt_tokens"] += usage.get("prompt_tokens") or 0
+            self._counters["cached_tokens"] += cached
+        return cached
+
+    def stats(self) -> Dict:
+        """提示词缓存命中统计与服务端前缀缓存命中率"""
+        with self._lock:
+            counters = dict(self._counters)
+            size = len(self._local)
+        lookups = counters["hits"] + counters["misses"]
+        return {
+            **counters,
+            "hit_rate": round(counters["hits"] / lookups, 4) if lookups else 0.0,
+            "provider_cache_hit_rate": (
+                round(counters["cached_tokens"] / counters["prompt_tokens"], 4) if counters["prompt_tokens"] else 0.0
+            ),
+            "prompt_version": SystemPromptManager.PROMPT_VERSION,
+            "size": size,
+            "max_size": self.max_size,
+        }
@@ -0,0 +1,216 @@
+"""
+登录用户缓存
+
+每个接口都要解析JWT并按用户ID查询users表。两级缓存：
+- 进程内LRU缓存解析后的令牌（不超过令牌自身的过期时间），省去重复的签名校验
+- Redis缓存用户快照（短TTL），命中时不访问数据库
+
+用户信息或余额变更后调用invalidate()删除快照并递增该用户的失效计数，各worker下次请求时重新查询。
+未命中时先读取失效计数再查询数据库，写入快照时失效计数已变化（期间有扣费等更新）则放弃写入，
+避免把查询时读到的旧余额写回缓存。
+"""
+import datetime
+import json
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Dict, Optional
+
+from redis import RedisError, WatchError
+from sqlalchemy import DateTime
+from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.orm import make_transient_to_detached
+
+from app.core.config import settings
+from app.core.redis import get_redis
+from app.core.security import verify_token
+from app.models.user import User
+
+logger = logging.getLogger(__name__)
+
+USER_COLUMNS = User.__table__.columns
+
+# 失效计数的过期时间（秒），远大于一次查询到写入快照的间隔
+GENERATION_TTL = 86400
+
+
+def dump_user(user: User) -> str:
+    """用户 -> JSON快照（包含users表全部字段）"""
+    snapshot = {}
+    for column in USER_COLUMNS:
+        value = getattr(user, column.key)
+        if isinstance(value, uuid.UUID):
+            value = str(value)
+        elif isinstance(value, datetime.datetime):
+            value = value.isoformat()
+        snapshot[column.key] = value
+    return json.dumps(snapshot, ensure_ascii=False)
+
+
+def load_user(cached: str) -> User:
+    """
+    JSON快照 -> 游离态（detached）的用户对象
+
+    加入会话后即为持久态，修改字段并提交会正常生成UPDATE，不会再查询一次
+    """
+    snapshot = json.loads(cached)
+    for column in USER_COLUMNS:
+        value = snapshot.get(column.key)
+        if value is None:
+            continue
+        if isinstance(column.type, UUID):
+            snapshot[column.key] = uuid.UUID(value)
+        elif isinstance(column.type, DateTime):
+            snapshot[column.key] = datetime.datetime.fromisoformat(value)
+    user = User(**snapshot)
+    make_transient_to_detached(user)
+    return user
+
+
+class AuthUserCache:
+    """登录用户两级缓存（进程内令牌LRU + Redis用户快照）"""
+
+    def __init__(
+        self,
+        token_cache_size: Optional[int] = None,
+        token_ttl: Optional[int] = None,
+        user_ttl: Optional[int] = None
+    ):
+        """
+        Args:
+            token_cache_size: 令牌LRU的最大条目数，默认取配置AUTH_TOKEN_CACHE_SIZE
+            token_ttl: 令牌在LRU中的最长保留时间（秒），默认取配置AUTH_TOKEN_CACHE_TTL
+            user_ttl: Redis用户快照过期时间（秒），默认取配置AUTH_USER_CACHE_TTL
+        """
+        self.token_cache_size = token_cache_size or settings.AUTH_TOKEN_CACHE_SIZE
+        self.token_ttl = token_ttl or settings.AUTH_TOKEN_CACHE_TTL
+        self.user_ttl = user_ttl or settings.AUTH_USER_CACHE_TTL
+        # 令牌 -> (用户ID, 失效时间戳)
+        self._tokens: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._counters = {
+            "token_hits": 0, "token_misses": 0,
+            "user_hits": 0, "user_misses": 0,
+            "invalidations": 0, "stale_writes_skipped": 0, "redis_errors": 0,
+        }
+
+    @staticmethod
+    def user_key(user_id) -> str:
+        return f"auth:user:{user_id}"
+
+    @staticmethod
+    def generation_key(user_id) -> str:
+        return f"auth:user:gen:{user_id}"
+
+    def _count(self, counter: str) -> None:
+        with self._lock:
+            self._counters[counter] += 1
+
+    def decode_token(self, token: str) -> Optional[str]:
+        """
+        解析令牌得到用户ID（sub），无效或已过期时返回None
+
+        LRU中的条目在令牌过期时间和token_ttl两者较早者失效
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._tokens.get(token)
+            if entry is not None and entry[1] > now:
+                self._tokens.move_to_end(token)
+                self._counters["token_hits"] += 1
+                return entry[0]
+            self._counters["token_misses"] += 1
+
+        payload = verify_token(token)
+        if payload is None or payload.get("sub") is None:
+            return None
+
+        user_id = payload["sub"]
+        expires_at = min(now + self.token_ttl, payload.get("exp", now))
+        with self._lock:
+            self._tokens[token] = (user_id, expires_at)
+            self._tokens.move_to_end(token)
+            while len(self._tokens) > self.token_cache_size:
+                self._tokens.popitem(last=False)
+        return user_id
+
+    async def get_user(self, user_id: str) -> Optional[User]:
+        """从Redis读取用户快照，未命中或Redis不可用时返回None"""
+        try:
+            cached = await get_redis().get(self.user_key(user_id))
+        except RedisError as e:
+            logger.warning(f"登录用户缓存读取Redis失败: {str(e)}")
+            self._count("redis_errors")
+            cached = None
+
+        if cached is None:
+            self._count("user_misses")
+            return None
+
+        self._count("user_hits")
+        return load_user(cached)
+
+    async def get_generation(self, user_id) -> Optional[str]:
+        """读取用户的失效计数（查询数据库之前调用，结果传给set_user），从未失效或Redis不可用时返回None"""
+        try:
+            return await get_redis().get(self.generation_key(user_id))
+        except RedisError as e:
+            logger.warning(f"登录用户缓存读取Redis失败: {str(e)}")
+            self._count("redis_errors")
+            return None
+
+    async def set_user(self, user: User, generation: Optional[str]) -> None:
+        """
+        写入用户快照
+
+        Args:
+            generation: 查询数据库之前get_generation()的结果；失效计数已变化时不写入，已有快照时不覆盖
+        """
+        generation_key = self.generation_key(user.id)
+        try:
+            async with get_redis().pipeline(transaction=True) as pipe:
+                await pipe.watch(generation_key)
+                if await pipe.get(generation_key) != generation:
+                    self._count("stale_writes_skipped")
+                    return
+                pipe.multi()
+                pipe.set(self.user_key(user.id), dump_user(user), ex=self.user_ttl, nx=True)
+                await pipe.execute()
+        except WatchError:
+            # 读取失效计数之后、写入之前发生了invalidate()
+            self._count("stale_writes_skipped")
+        except RedisError as e:
+            logger.warning(f"登录用户缓存写入Redis失败: {str(e)}")
+            self._count("redis_errors")
+
+    async def invalidate(self, user_id) -> None:
+        """用户信息或余额变更（提交）后删除快照并递增失效计数"""
+        self._count("invalidations")
+        generation_key = self.generation_key(user_id)
+        try:
+            async with get_redis().pipeline(transaction=True) as pipe:
+                pipe.incr(generation_key)
+                pipe.expire(generation_key, GENERATION_TTL)
+                pipe.delete(self.user_key(user_id))
+                await pipe.execute()
+        except RedisError as e:
+            logger.warning(f"登录用户缓存删除失败: {str(e)}")
+            self._count("redis_errors")
+
+    def stats(self) -> Dict:
+        """命中统计，user_hits即节省的数据库查询次数"""
+        with self._lock:
+            counters = dict(self._counters)
+            size = len(self._tokens)
+        token_lookups = counters["token_hits"] + counters["token_misses"]
+        user_lookups = counters["user_hits"] + counters["user_misses"]
+        return {
+            **counters,
+            "token_hit_rate": round(counters["token_hits"] / token_lookups, 4) if token_lookups else 0.0,
+            "user_hit_rate": round(counters["user_hits"] / user_lookups, 4) if user_lookups else 0.0,
+            "db_queries_saved": counters["user_hits"],
+            "token_cache_size": size,
+            "max_token_cache_size": self.token_cache_size,
+        }
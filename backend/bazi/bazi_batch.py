@@ -0,0 +1,199 @@
+"""
+八字批量计算命令行工具
+
+从CSV或JSONL读取出生信息，用进程池并行排盘，按输入顺序流式写出JSONL。
+排盘与结果字段和BaziService（API）共用BaZiCalculator与result_fields，输出的bazi_result与接口完全一致。
+
+输入字段同BaziCalculateRequest：name, gender, calendar, year, month, day, hour, minute,
+birth_city, current_city（可选）, is_leap_month（可选）。CSV需带表头。
+
+输出每行一条，与批量计算接口的NDJSON格式一致：
+    {"index": 输入序号（从0开始）, "status": "ok", "bazi_result": {...}}
+    {"index": 输入序号, "status": "error", "detail": "错误信息"}
+
+读取、计算和写出均按块进行，同时在途的块数有上限，内存占用与输入文件大小无关。
+结束时在标准错误输出条数、耗时和吞吐（条/秒）。
+
+用法：
+    python bazi_batch.py input.csv -o output.jsonl
+    python bazi_batch.py input.jsonl --workers 8 --fields bazi,dayun_timeline > output.jsonl
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from bazi_tool import BaZiCalculator
+from result_fields import RESULT_FIELDS, build_result
+
+REQUIRED_TEXT_FIELDS = ("gender", "calendar", "birth_city")
+INT_FIELDS = ("year", "month", "day", "hour", "minute")
+TRUE_VALUES = ("1", "true", "yes", "y", "是")
+
+# 每块的条数、每个worker同时在途的块数
+DEFAULT_CHUNK_SIZE = 500
+PENDING_CHUNKS_PER_WORKER = 2
+
+
+def normalize_record(record):
+    """
+    将CSV/JSONL的一行规范化为BaZiCalculator的参数（CSV中均为字符串）
+
+    Raises:
+        ValueError: 缺少必填字段或数值字段无法解析
+    """
+    kwargs = {
+        "name": record.get("name") or "",
+        "current_city": record.get("current_city") or None,
+    }
+    for field in REQUIRED_TEXT_FIELDS:
+        value = record.get(field)
+        if not value:
+            raise ValueError(f"缺少字段：{field}")
+        kwargs[field] = value
+    for field in INT_FIELDS:
+        value = record.get(field)
+        if value in (None, ""):
+            raise ValueError(f"缺少字段：{field}")
+        kwargs[field] = int(value)
+
+    leap = record.get("is_leap_month", False)
+    kwargs["is_leap_month"] = str(leap).strip().lower() in TRUE_VALUES if isinstance(leap, str) else bool(leap)
+    return kwargs
+
+
+def read_records(path, input_format):
+    """
+    逐行读取输入文件，生成(序号, 原始记录或解析错误)
+    """
+    with open(path, "r", encoding="utf-8-sig", newline="") as f:
+        if input_format == "csv":
+            for index, row in enumerate(csv.DictReader(f)):
+                yield index, row
+        else:
+            index = 0
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    yield index, json.loads(line)
+                except json.JSONDecodeError as e:
+                    yield index, ValueError(f"JSON解析失败：{e}")
+                index += 1
+
+
+def read_chunks(records, chunk_size):
+    """
+    将记录按chunk_size分块
+    """
+    chunk = []
+    for item in records:
+        chunk.append(item)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _warm_up():
+    """
+    worker启动时加载地区索引、节气表和农历月表
+    """
+    BaZiCalculator("", "男", "公历", 2000, 1, 1, 12, 0, "北京").format_output()
+
+
+def calculate_chunk(chunk, fields):
+    """
+    worker中计算一块记录（在worker中序列化，减轻主进程负担）
+
+    Returns:
+        (输出行列表, 失败条数)
+    """
+    lines = []
+    failed = 0
+    for index, record in chunk:
+        try:
+            if isinstance(record, Exception):
+                raise record
+            calculator = BaZiCalculator(**normalize_record(record))
+            line = {"index": index, "status": "ok", "bazi_result": build_result(calculator, fields)}
+        except Exception as e:
+            line = {"index": index, "status": "error", "detail": f"八字计算失败：{str(e)}"}
+            failed += 1
+        lines.append(json.dumps(line, ensure_ascii=False))
+    return lines, failed
+
+
+def run(input_path, output, input_format, workers, chunk_size, fields=None):
+    """
+    并行计算并按输入顺序写出
+
+    Returns:
+        (成功条数, 失败条数)
+    """
+    succeeded = failed = 0
+    max_pending = workers * PENDING_CHUNKS_PER_WORKER
+    chunks = read_chunks(read_records(input_path, input_format), chunk_size)
+
+    def write(future):
+        nonlocal succeeded, failed
+        lines, chunk_failed = future.result()
+        for line in lines:
+            output.write(line)
+            output.write("\n")
+        succeeded += len(lines) - chunk_failed
+        failed += chunk_failed
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_warm_up) as executor:
+        pending = deque()
+        for chunk in chunks:
+            pending.append(executor.submit(calculate_chunk, chunk, fields))
+            # 在途块数达到上限时先写出最早的一块，限制内存占用并保持输出顺序
+            if len(pending) >= max_pending:
+                write(pending.popleft())
+        while pending:
+            write(pending.popleft())
+
+    return succeeded, failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="八字批量计算：CSV/JSONL -> JSONL")
+    parser.add_argument("input", help="输入文件（.csv或.jsonl）")
+    parser.add_argument("-o", "--output", help="输出JSONL文件，默认写到标准输出")
+    parser.add_argument("--format", choices=("csv", "jsonl"), help="输入格式，默认按扩展名判断")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="进程数，默认为CPU核数")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE, help="每块的条数")
+    parser.add_argument("--fields", help=f"输出的结果字段，逗号分隔，默认全部（{','.join(RESULT_FIELDS)}）")
+    args = parser.parse_args()
+
+    input_format = args.format or ("csv" if args.input.lower().endswith(".csv") else "jsonl")
+    fields = args.fields.split(",") if args.fields else None
+    unknown = [field for field in fields or () if field not in RESULT_FIELDS]
+    if unknown:
+        parser.error(f"不支持的字段：{','.join(unknown)}")
+
+    output = open(args.output, "w", encoding="utf-8") if args.output else sys.stdout
+    start = time.perf_counter()
+    try:
+        succeeded, failed = run(args.input, output, input_format, args.workers, args.chunk_size, fields)
+    finally:
+        if args.output:
+            output.close()
+    elapsed = time.perf_counter() - start
+
+    total = succeeded + failed
+    print(
+        f"完成：{total} 条（成功 {succeeded}，失败 {failed}），{args.workers} 个进程，"
+        f"耗时 {elapsed:.2f}s，{total / elapsed if elapsed else 0:,.0f} 条/秒",
+        file=sys.stderr,
+    )
+
+
+if __name__ == "__main__":
+    main()
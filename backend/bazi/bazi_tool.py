@@ -2,6 +2,8 @@ import sxtwl
 import datetime
 import math
 from query_longitude import inquire
+from jieqi_table import datetime_to_jd, get_jieqi_table
+from lunar_table import get_lunar_table
 
 # 天干地支索引
 Gan = ["甲", "乙", "丙", "丁", "戊", "己", "庚", "辛", "壬", "癸"]
@@ -16,11 +18,72 @@ rmc = ["初一", "初二", "初三", "初四", "初五", "初六", "初七", "
     "十一", "十二", "十三", "十四", "十五", "十六", "十七", "十八", "十九", "二十", 
     "廿一", "廿二", "廿三", "廿四", "廿五", "廿六", "廿七", "廿八", "廿九", "三十", "卅一"]
 
+# 六十甲子表（序号0为甲子），大运、流年按序号偏移直接查表
+JiaZi = [Gan[i % 10] + Zhi[i % 12] for i in range(60)]
+JiaZiIndex = {gz: i for i, gz in enumerate(JiaZi)}
+
+# 日序号（date.toordinal）与日柱六十甲子序号的换算常数
+DAY_GZ_OFFSET = 14
+
+# 大运步数、流年年数
+DA_YUN_STEPS = 10
+LIU_NIAN_YEARS = 100
+# 首尾相接的六十甲子，任一起点往后LIU_NIAN_YEARS年的流年都是其中的一段切片
+LIU_NIAN_CYCLE = JiaZi * (LIU_NIAN_YEARS // 60 + 2)
+
+
+class lazy_property:
+    """
+    惰性求值属性：首次访问时计算并缓存到同名的私有slot中
+
+    与functools.cached_property不同，不依赖实例__dict__，可与__slots__配合使用
+    """
+
+    def __init__(self, func):
+        self.func = func
+        self.__doc__ = func.__doc__
+
+    def __set_name__(self, owner, name):
+        self.slot = "_" + name
+
+    def __get__(self, instance, owner=None):
+        if instance is None:
+            return self
+        try:
+            return getattr(instance, self.slot)
+        except AttributeError:
+            value = self.func(instance)
+            setattr(instance, self.slot, value)
+            return value
+
 
 class BaZiCalculator:
-    def __init__(self, name, gender, calendar, year, month, day, hour, minute, birth_city, current_city=None):
+    """
+    八字计算器
+
+    经度、真太阳时、农历、八字、节气、大运等派生字段均在首次访问时才计算并缓存，
+    只需要四柱的调用方不会为节气、大运和格式化输出付出额外开销
+    """
+
+    __slots__ = (
+        "name", "gender", "calendar", "year", "month", "day", "hour", "minute",
+        "birth_city", "current_city", "is_leap_month",
+        "_birth_longitude", "_solar_time", "_lunar_info", "_ba_zi",
+        "_jie_qi", "_jie_qi_info", "_jie_qi_hours", "_qi_yun", "_da_yun_info", "_da_yun_timeline",
+    )
+    
+    # 只由出生时间、经度、日历类型和性别决定的派生字段，可整体缓存后通过restore()复用
+    SNAPSHOT_FIELDS = (
+        "birth_longitude", "solar_time", "lunar_info", "ba_zi", "jie_qi_info", "jie_qi_hours",
+        "da_yun_info", "da_yun_timeline"
+    )
+
+    def __init__(self, name, gender, calendar, year, month, day, hour, minute, birth_city, current_city=None,
+                 is_leap_month=False):
         """
         初始化八字计算器
+        
+        is_leap_month只对农历输入有效，表示输入的月份为闰月
         """
         self.name = name
         self.gender = gender
@@ -32,24 +95,97 @@ class BaZiCalculator:
         self.minute = minute
         self.birth_city = birth_city
         self.current_city = current_city
-        
-        # 获取出生城市经度
-        self.birth_longitude = inquire(birth_city)
-        
-        # 计算真太阳时
-        self.solar_time = self.calculate_solar_time()
-        
-        # 转换为农历
-        self.lunar_date = self.convert_to_lunar()
-        
-        # 计算八字
-        self.ba_zi = self.calculate_ba_zi()
-        
-        # 计算节气信息
-        self.jie_qi_info = self.calculate_jie_qi_info()
-        
-        # 计算大运信息
-        self.da_yun_info = self.calculate_da_yun_info()
+        self.is_leap_month = is_leap_month
+    
+    @lazy_property
+    def birth_longitude(self):
+        """出生城市经度"""
+        return inquire(self.birth_city)
+    
+    @lazy_property
+    def solar_time(self):
+        """
+        真太阳时
+        农历输入时日期部分取农历对应的公历日期，时分仍为真太阳时校正后的时间
+        """
+        solar_time = self.calculate_solar_time()
+        if self.calendar != "公历":
+            solar_date = self.convert_to_solar()
+            solar_time = solar_time.replace(
+                year=solar_date.year,
+                month=solar_date.month,
+                day=solar_date.day
+            )
+        return solar_time
+    
+    @lazy_property
+    def lunar_info(self):
+        """农历年、月、日及是否闰月"""
+        return tuple(self.convert_to_lunar())
+    
+    @lazy_property
+    def ba_zi(self):
+        """八字（四柱，空格分隔）"""
+        return self.calculate_ba_zi()
+    
+    @lazy_property
+    def jie_qi(self):
+        """出生当天前后最近的节气"""
+        return self.find_jie_qi()
+    
+    @lazy_property
+    def jie_qi_info(self):
+        """节气信息"""
+        return self.calculate_jie_qi_info()
+    
+    @lazy_property
+    def jie_qi_hours(self):
+        """距前后节气的精确小时数"""
+        return self.calculate_jie_qi_hours()
+    
+    @lazy_property
+    def qi_yun(self):
+        """(年干是否为阳, 是否顺排, 起运时间（年）)，大运信息与大运时间线共用"""
+        return self.calculate_qi_yun()
+    
+    @lazy_property
+    def da_yun_info(self):
+        """大运信息"""
+        return self.calculate_da_yun_info()
+    
+    @lazy_property
+    def da_yun_timeline(self):
+        """大运、流年时间线"""
+        return self.calculate_da_yun_timeline()
+    
+    def snapshot(self):
+        """
+        导出SNAPSHOT_FIELDS中的派生字段（可JSON序列化），用于结果缓存
+        """
+        return {
+            "birth_longitude": self.birth_longitude,
+            "solar_time": self.solar_time.isoformat(),
+            "lunar_info": list(self.lunar_info),
+            "ba_zi": self.ba_zi,
+            "jie_qi_info": self.jie_qi_info,
+            "jie_qi_hours": self.jie_qi_hours,
+            "da_yun_info": self.da_yun_info,
+            "da_yun_timeline": self.da_yun_timeline,
+        }
+    
+    def restore(self, snapshot):
+        """
+        用snapshot()导出的数据直接填充派生字段，之后的format_output()不再调用sxtwl
+        """
+        self._birth_longitude = snapshot["birth_longitude"]
+        self._solar_time = datetime.datetime.fromisoformat(snapshot["solar_time"])
+        self._lunar_info = tuple(snapshot["lunar_info"])
+        self._ba_zi = snapshot["ba_zi"]
+        self._jie_qi_info = snapshot["jie_qi_info"]
+        self._jie_qi_hours = snapshot["jie_qi_hours"]
+        self._da_yun_info = snapshot["da_yun_info"]
+        self._da_yun_timeline = snapshot["da_yun_timeline"]
+        return self
     
     def calculate_solar_time(self):
         """
@@ -69,98 +205,110 @@ class BaZiCalculator:
     
     def convert_to_lunar(self):
         """
-        将公历日期转换为农历
-        """ 
-        if self.calendar == "公历":
-            # 使用真太阳时转换
-            year = self.solar_time.year
-            month = self.solar_time.month
-            day = self.solar_time.day
-            day_obj = sxtwl.fromSolar(year, month, day)
-        else:  # 农历
-            # 直接使用输入的农历日期
-            year = self.year
-            month = self.month
-            day = self.day
-            # 需要判断是否为闰月
-            day_obj = sxtwl.fromLunar(year, month, day)
-            
-            # 同时更新solar_time为对应的公历日期
-            solar_year = day_obj.getSolarYear()
-            solar_month = day_obj.getSolarMonth()
-            solar_day = day_obj.getSolarDay()
-            # 保持原始的小时和分钟，仅更新日期部分
-            self.solar_time = datetime.datetime(solar_year, solar_month, solar_day, self.solar_time.hour, self.solar_time.minute, self.solar_time.second, self.solar_time.microsecond)
-        
-        return day_obj
+        将出生日期转换为农历（查农历月表）
+        
+        公历输入使用真太阳时的日期；农历输入时solar_time的日期已是农历对应的公历日期，
+        反查一次可将超出当月天数的日期规范化（如小月的三十即下月初一）
+        
+        Returns:
+            lunar_table.LunarDate
+        """
+        return get_lunar_table().to_lunar(self.solar_time.date())
+    
+    def convert_to_solar(self):
+        """
+        将农历输入转换为公历日期（查农历月表）
+        
+        Raises:
+            ValueError: 指定了闰月但该年没有此闰月
+        """
+        return get_lunar_table().to_solar(self.year, self.month, self.day, bool(self.is_leap_month))
     
     def calculate_ba_zi(self):
         """
         计算八字
+        
+        年柱、月柱按出生当天或之前最近的"节"查节气表（与sxtwl一致，按公历日交节），
+        日柱由公历日序号直接推算，均为六十甲子查表，不再为每次计算创建sxtwl.Day
         """
-        # 获取年柱
-        year_gz = self.lunar_date.getYearGZ()
-        year_ba_zi = Gan[year_gz.tg] + Zhi[year_gz.dz]
+        birth_date = self.solar_time.date()
         
-        # 获取月柱
-        month_gz = self.lunar_date.getMonthGZ()
-        month_ba_zi = Gan[month_gz.tg] + Zhi[month_gz.dz]
+        # 获取月令：最近的节对应的月份序号（寅月为0）
+        jie = get_jieqi_table().previous_jie(birth_date)
+        month_offset = (jie.index - 3) // 2 % 12
+        
+        # 获取年柱：以立春为界，小寒（丑月）在公历1月，仍属上一年
+        jie_year = datetime.date.fromordinal(birth_date.toordinal() - jie.days).year
+        year_index = (jie_year - (1 if month_offset == 11 else 0) - 4) % 60
+        year_ba_zi = JiaZi[year_index]
+        
+        # 获取月柱：甲己之年丙作首（五虎遁），此后逐月顺推
+        month_ba_zi = JiaZi[(year_index * 12 + 2 + month_offset) % 60]
         
         # 获取日柱
-        day_gz = self.lunar_date.getDayGZ()
-        day_ba_zi = Gan[day_gz.tg] + Zhi[day_gz.dz]
+        day_index = (birth_date.toordinal() + DAY_GZ_OFFSET) % 60
+        day_ba_zi = JiaZi[day_index]
         
         # 获取时柱
         # 使用日天干和真太阳时的小时来计算时柱
-        hour_gz = sxtwl.getShiGz(day_gz.tg, self.solar_time.hour)
+        hour_gz = sxtwl.getShiGz(day_index % 10, self.solar_time.hour)
         hour_ba_zi = Gan[hour_gz.tg] + Zhi[hour_gz.dz]
         
         return year_ba_zi + " " + month_ba_zi + " " + day_ba_zi + " " + hour_ba_zi
     
+    def find_jie_qi(self):
+        """
+        查询出生当天前后最近的节气
+        
+        使用预先生成的节气时刻表二分查找，替代sxtwl逐日before/after遍历
+        
+        Returns:
+            (上一节气, 下一节气)，均为jieqi_table.JieQi
+        """
+        # solar_time的日期即出生当天的公历日期（农历输入时已换算）
+        birth_date = self.solar_time.date()
+        table = get_jieqi_table()
+        return table.previous(birth_date), table.next(birth_date)
+    
     def calculate_jie_qi_info(self):
         """
         计算节气信息
         """
-        # 获取当前日期的节气信息
-        current_day = self.lunar_date
-        
-        # 查找上一个节气
-        prev_jie_qi = None
-        prev_jie_qi_day = current_day
-        days_since_prev = 0
-        
-        # 向前查找最多30天
-        for i in range(30):
-            if prev_jie_qi_day.hasJieQi():
-                prev_jie_qi = prev_jie_qi_day.getJieQi()
-                break
-            prev_jie_qi_day = prev_jie_qi_day.before(1)
-            days_since_prev += 1
-        
-        # 查找下一个节气
-        next_jie_qi = None
-        next_jie_qi_day = current_day
-        days_to_next = 0
-        
-        # 向后查找最多30天
-        for i in range(30):
-            if next_jie_qi_day.hasJieQi():
-                next_jie_qi = next_jie_qi_day.getJieQi()
-                break
-            next_jie_qi_day = next_jie_qi_day.after(1)
-            days_to_next += 1
+        # 查表获取前后节气（按公历日计算间隔天数，当天有节气时为0）
+        prev_jie_qi, next_jie_qi = self.jie_qi
         
         # 格式化输出
-        if prev_jie_qi is not None and next_jie_qi is not None:
-            prev_jie_qi_name = jqmc[prev_jie_qi]
-            next_jie_qi_name = jqmc[next_jie_qi]
-            return f"生于{prev_jie_qi_name}节气后{days_since_prev}天，{next_jie_qi_name}节气前{days_to_next}天"
+        prev_jie_qi_name = jqmc[prev_jie_qi.index]
+        next_jie_qi_name = jqmc[next_jie_qi.index]
+        return f"生于{prev_jie_qi_name}节气后{prev_jie_qi.days}天，{next_jie_qi_name}节气前{next_jie_qi.days}天"
+    
+    def calculate_jie_qi_hours(self):
+        """
+        计算出生时刻距前后两个节气的精确小时数
         
-        return ""
+        与jie_qi_info使用同一出生时刻（真太阳时）和同一对节气：当天有节气时前后均为当天的节气，
+        hours_since与hours_until互为相反数，出生在交节时刻之前时hours_since为负
+        
+        Returns:
+            {"prev": 上一节气, "hours_since": 距上一节气的小时数, "next": 下一节气, "hours_until": 距下一节气的小时数}
+        """
+        prev_jie_qi, next_jie_qi = self.jie_qi
+        jd = datetime_to_jd(self.solar_time)
+        hours_since = (jd - prev_jie_qi.jd) * 24
+        hours_until = (next_jie_qi.jd - jd) * 24
+        return {
+            "prev": jqmc[prev_jie_qi.index],
+            "hours_since": round(hours_since, 2),
+            "next": jqmc[next_jie_qi.index],
+            "hours_until": round(hours_until, 2),
+        }
     
-    def calculate_da_yun_info(self):
+    def calculate_qi_yun(self):
         """
-        计算大运信息
+        计算大运排法和起运时间
+        
+        Returns:
+            (年干是否为阳, 是否顺排, 起运时间（年，含小数）)
         """
         # 获取年干
         year_gz = self.ba_zi[:2]
@@ -176,45 +324,30 @@ class BaZiCalculator:
         # 判断大运顺逆排
         # 阳男阴女顺排，阴男阳女逆排
         is_forward = (is_year_tg_yang and is_male) or (not is_year_tg_yang and not is_male)
-        da_yun_direction = "顺排" if is_forward else "逆排"
         
         # 计算起运时间
-        # 首先获取节气信息
-        current_day = self.lunar_date
-        
-        if is_forward:
-            # 顺排：查找下一个节气
-            jie_qi_day = current_day
-            days_to_jie_qi = 0
-            
-            # 向后查找最多30天
-            for i in range(30):
-                if jie_qi_day.hasJieQi():
-                    break
-                jie_qi_day = jie_qi_day.after(1)
-                days_to_jie_qi += 1
-        else:
-            # 逆排：查找上一个节气
-            jie_qi_day = current_day
-            days_to_jie_qi = 0
-            
-            # 向前查找最多30天
-            for i in range(30):
-                if jie_qi_day.hasJieQi():
-                    break
-                jie_qi_day = jie_qi_day.before(1)
-                days_to_jie_qi += 1
+        # 顺排取距下一个节气的天数，逆排取距上一个节气的天数
+        prev_jie_qi, next_jie_qi = self.jie_qi
+        days_to_jie_qi = next_jie_qi.days if is_forward else prev_jie_qi.days
         
         # 计算起运时间（天数转年数）
         # 起运时间 = 节气天数 ÷ 3
-        qi_yun_years_float = days_to_jie_qi / 3.0
+        return is_year_tg_yang, is_forward, days_to_jie_qi / 3.0
+    
+    def calculate_da_yun_info(self):
+        """
+        计算大运信息
+        """
+        is_year_tg_yang, is_forward, qi_yun_years_float = self.qi_yun
+        is_male = self.gender == "男"
+        da_yun_direction = "顺排" if is_forward else "逆排"
+        
         qi_yun_years = int(qi_yun_years_float)
         qi_yun_months = int(round((qi_yun_years_float - qi_yun_years) * 12))
         
         # 计算起运岁数
         # 起运时间为整数，起运岁数 = 起运时间
         # 如果起运时间为余数，起运岁数 = 起运时间向上取整
-        import math
         qi_yun_age = int(math.ceil(qi_yun_years_float))
         
         # 格式化输出
@@ -225,6 +358,47 @@ class BaZiCalculator:
             gender_info = "阳女" if is_year_tg_yang else "阴女"
         return f"{gender_info}，{da_yun_direction}，起运时间{qi_yun_years}年{qi_yun_months}月，{qi_yun_age}岁起运"
     
+    def calculate_da_yun_timeline(self):
+        """
+        计算大运、流年时间线
+        
+        大运自月柱起按顺逆排逐步推进，流年为出生当年起逐年的年柱，均按六十甲子序号偏移查表
+        
+        Returns:
+            {
+                "direction": "顺排"/"逆排",
+                "start_age": 起运岁数,
+                "dayun": [{"pillar": 大运干支, "start_age": 起始岁数, "start_year": 起始年份}] × DA_YUN_STEPS,
+                "liunian": {"start_year": 出生年份, "pillars": [流年干支] × LIU_NIAN_YEARS}
+            }
+        """
+        _, is_forward, qi_yun_years_float = self.qi_yun
+        qi_yun_age = int(math.ceil(qi_yun_years_float))
+        step = 1 if is_forward else -1
+        
+        month_index = JiaZiIndex[self.ba_zi.split()[1]]
+        birth_year = self.solar_time.year
+        
+        da_yun = []
+        for i in range(1, DA_YUN_STEPS + 1):
+            start_age = qi_yun_age + (i - 1) * 10
+            da_yun.append({
+                "pillar": JiaZi[(month_index + step * i) % 60],
+                "start_age": start_age,
+                "start_year": birth_year + start_age
+            })
+        
+        # 公元4年为甲子年
+        first_year_index = (birth_year - 4) % 60
+        liu_nian = LIU_NIAN_CYCLE[first_year_index:first_year_index + LIU_NIAN_YEARS]
+        
+        return {
+            "direction": "顺排" if is_forward else "逆排",
+            "start_age": qi_yun_age,
+            "dayun": da_yun,
+            "liunian": {"start_year": birth_year, "pillars": liu_nian}
+        }
+    
     def format_output(self):
         """
         格式化输出
@@ -239,29 +413,26 @@ class BaZiCalculator:
         
         # 出生时间
         output += "出生时间：\n"
+        solar_time = self.solar_time
         
         if self.calendar == "公历":
             # 显示公历日期和对应的农历日期
             # 公历使用真太阳时，但显示为整数分钟
-            output += f"  公历：{self.solar_time.year}年{self.solar_time.month}月{self.solar_time.day}日{self.solar_time.hour:02d}:{self.solar_time.minute:02d}\n"
+            output += f"  公历：{solar_time.year}年{solar_time.month}月{solar_time.day}日{solar_time.hour:02d}:{solar_time.minute:02d}\n"
             
             # 农历
-            lunar_year = self.lunar_date.getLunarYear()
-            lunar_month = self.lunar_date.getLunarMonth()
-            lunar_day = self.lunar_date.getLunarDay()
-            is_leap = "(闰月)" if self.lunar_date.isLunarLeap() else "(非闰月)"
-            output += f"  农历：{lunar_year}年{lunar_month}月{lunar_day}日{self.solar_time.hour:02d}:{self.solar_time.minute:02d} {is_leap}\n"
+            lunar_year, lunar_month, lunar_day, lunar_leap = self.lunar_info
+            is_leap = "(闰月)" if lunar_leap else "(非闰月)"
+            output += f"  农历：{lunar_year}年{lunar_month}月{lunar_day}日{solar_time.hour:02d}:{solar_time.minute:02d} {is_leap}\n"
         else:  # 农历
             # 显示农历日期和对应的公历日期
             # 农历使用真太阳时校正后的时间
-            lunar_year = self.lunar_date.getLunarYear()
-            lunar_month = self.lunar_date.getLunarMonth()
-            lunar_day = self.lunar_date.getLunarDay()
-            is_leap = "(闰月)" if self.lunar_date.isLunarLeap() else "(非闰月)"
-            output += f"  农历：{lunar_year}年{lunar_month}月{lunar_day}日{self.solar_time.hour:02d}:{self.solar_time.minute:02d} {is_leap}\n"
+            lunar_year, lunar_month, lunar_day, lunar_leap = self.lunar_info
+            is_leap = "(闰月)" if lunar_leap else "(非闰月)"
+            output += f"  农历：{lunar_year}年{lunar_month}月{lunar_day}日{solar_time.hour:02d}:{solar_time.minute:02d} {is_leap}\n"
             
             # 公历使用真太阳时，但显示为整数分钟
-            output += f"  公历：{self.solar_time.year}年{self.solar_time.month}月{self.solar_time.day}日{self.solar_time.hour:02d}:{self.solar_time.minute:02d}\n"
+            output += f"  公历：{solar_time.year}年{solar_time.month}月{solar_time.day}日{solar_time.hour:02d}:{solar_time.minute:02d}\n"
         
         # 出生城市
         output += f"出生城市：{self.birth_city}({self.birth_longitude}°E)\n"
@@ -282,6 +453,28 @@ class BaZiCalculator:
             output += f"大运信息：{self.da_yun_info}\n"
         
         return output
+    
+    def format_compact(self):
+        """
+        紧凑格式（用于AI对话提示词）
+        
+        只保留format_output中姓名、性别以外的事实且每项只出现一次：
+        出生时间（真太阳时，公历与农历各一次）、出生/现居城市、八字、节气、大运
+        """
+        lunar_year, lunar_month, lunar_day, lunar_leap = self.lunar_info
+        solar_time = self.solar_time
+        time_text = f"{solar_time.hour:02d}:{solar_time.minute:02d}"
+        lines = [
+            f"出生：公历{solar_time.year}年{solar_time.month}月{solar_time.day}日{time_text}"
+            f"（农历{lunar_year}年{'闰' if lunar_leap else ''}{lunar_month}月{lunar_day}日，真太阳时）",
+            f"出生地：{self.birth_city}" + (f"，现居：{self.current_city}" if self.current_city else ""),
+            f"八字：{self.ba_zi}",
+        ]
+        if self.jie_qi_info:
+            lines.append(f"节气：{self.jie_qi_info}")
+        if self.da_yun_info:
+            lines.append(f"大运：{self.da_yun_info}")
+        return "\n".join(lines)
 
 
 def main():
@@ -0,0 +1,194 @@
+"""
+批量四柱计算（NumPy向量化）
+
+用于统计分析等需要对大量（出生时间, 经度）计算四柱的场景，
+避免逐行创建BaZiCalculator和sxtwl.Day对象。结果与BaZiCalculator.calculate_ba_zi完全一致：
+- 真太阳时：出生时间 + (经度 - 120) × 4分钟，按微秒取整（与datetime.timedelta相同）
+- 日柱：真太阳时公历日的日序号直接取模60
+- 年柱、月柱：按jieqi.bin中立春及各"节"所在的公历日切换（与sxtwl一致，按日而非按时刻）
+- 时柱：与sxtwl.getShiGz相同，23点起用次日天干的子时（晚子时）
+
+仅支持公历输入；农历输入请先换算为公历。
+
+用法：
+    python bazi_vector.py verify [样本数]
+    python bazi_vector.py bench [行数]
+"""
+import datetime
+import sys
+import time
+from collections import namedtuple
+
+import numpy as np
+
+from bazi_tool import DAY_GZ_OFFSET, Gan, Zhi
+from jieqi_table import START_YEAR, END_YEAR, get_jieqi_table
+
+# jqmc中立春的序号；"节"（小寒、立春、惊蛰……大雪）均为奇数序号
+LI_CHUN = 3
+
+
+# 四柱的天干、地支序号，均为shape (n, 4)的数组，列依次为年、月、日、时
+Pillars = namedtuple("Pillars", ["stems", "branches"])
+
+_boundaries = None
+
+
+def _get_boundaries():
+    """
+    从节气表提取年、月分界（按公历日序号升序）
+
+    Returns:
+        (立春日序号, 立春所在公历年, "节"日序号, 该"节"对应的月份序号（寅月为0）, 表中最后一天)
+    """
+    global _boundaries
+    if _boundaries is None:
+        table = get_jieqi_table()
+        days = np.frombuffer(table.days, dtype=np.int32).astype(np.int64)
+        indexes = np.frombuffer(table.indexes, dtype=np.uint8).astype(np.int64)
+
+        li_chun = indexes == LI_CHUN
+        li_chun_days = days[li_chun]
+        li_chun_years = np.array(
+            [datetime.date.fromordinal(int(day)).year for day in li_chun_days], dtype=np.int64
+        )
+
+        jie = indexes % 2 == 1
+        jie_days = days[jie]
+        jie_months = ((indexes[jie] - LI_CHUN) // 2) % 12
+
+        _boundaries = (li_chun_days, li_chun_years, jie_days, jie_months, int(days[-1]))
+    return _boundaries
+
+
+def solar_times(timestamps, longitudes):
+    """
+    计算真太阳时
+
+    Args:
+        timestamps: 出生时间（北京时间，不带时区），可转换为datetime64的数组
+        longitudes: 出生地经度，与timestamps可广播的数组或标量
+
+    Returns:
+        datetime64[us]数组
+    """
+    timestamps = np.asarray(timestamps, dtype="datetime64[us]")
+    longitudes = np.asarray(longitudes, dtype=np.float64)
+    # 与timedelta(minutes=x)相同：先换算为秒，再按微秒四舍六入五成双
+    offset = np.rint((longitudes - 120) * 4 * 60 * 1e6).astype(np.int64)
+    return timestamps + offset.astype("timedelta64[us]")
+
+
+def calculate_pillars(timestamps, longitudes):
+    """
+    批量计算四柱
+
+    Args:
+        timestamps: 出生时间（北京时间，不带时区），可转换为datetime64的数组
+        longitudes: 出生地经度，与timestamps可广播的数组或标量
+
+    Returns:
+        Pillars(stems, branches)
+
+    Raises:
+        ValueError: 真太阳时超出节气表范围
+    """
+    solar = solar_times(timestamps, longitudes)
+    days = solar.astype("datetime64[D]")
+    # datetime64的0日为1970-01-01，换算为date.toordinal()
+    ordinals = days.astype(np.int64) + datetime.date(1970, 1, 1).toordinal()
+    hours = (solar - days).astype("timedelta64[h]").astype(np.int64)
+
+    li_chun_days, li_chun_years, jie_days, jie_months, last_day = _get_boundaries()
+    year_pos = np.searchsorted(li_chun_days, ordinals, side="right") - 1
+    month_pos = np.searchsorted(jie_days, ordinals, side="right") - 1
+    if ordinals.size and (
+        year_pos.min() < 0 or month_pos.min() < 0 or ordinals.max() > last_day
+    ):
+        raise ValueError(f"日期超出节气表范围（{START_YEAR}～{END_YEAR}年）")
+
+    # 六十甲子序号：年柱以公元4年为甲子；甲/己年正月为丙寅，此后逐月顺推
+    year_gz = (li_chun_years[year_pos] - 4) % 60
+    month_gz = (year_gz * 12 + 2 + jie_months[month_pos]) % 60
+    day_gz = (ordinals + DAY_GZ_OFFSET) % 60
+
+    # 时柱：五鼠遁，23点时辰序号为12，天干顺延到次日
+    hour_step = (hours + 1) // 2
+    day_stem = day_gz % 10
+    hour_stem = (day_stem % 5 * 2 + hour_step) % 10
+    hour_branch = hour_step % 12
+
+    stems = np.stack([year_gz % 10, month_gz % 10, day_stem, hour_stem], axis=-1)
+    branches = np.stack([year_gz % 12, month_gz % 12, day_gz % 12, hour_branch], axis=-1)
+    return Pillars(stems.astype(np.int8), branches.astype(np.int8))
+
+
+def format_pillars(pillars):
+    """
+    将四柱序号格式化为与BaZiCalculator.ba_zi相同的字符串，如："甲子 丙寅 戊辰 壬子"
+    """
+    stems = pillars.stems.reshape(-1, 4)
+    branches = pillars.branches.reshape(-1, 4)
+    return [
+        " ".join(Gan[stem] + Zhi[branch] for stem, branch in zip(row_stems, row_branches))
+        for row_stems, row_branches in zip(stems.tolist(), branches.tolist())
+    ]
+
+
+def _random_rows(count, seed=0):
+    """
+    生成随机样本：1900～2100年的出生时间与国内经度范围（73°～135°）
+    """
+    rng = np.random.default_rng(seed)
+    start = np.datetime64("1900-01-01T00:00", "m").astype(np.int64)
+    end = np.datetime64("2100-12-31T23:59", "m").astype(np.int64)
+    timestamps = rng.integers(start, end, size=count).astype("datetime64[m]")
+    longitudes = np.round(rng.uniform(73.0, 135.0, size=count), 6)
+    return timestamps, longitudes
+
+
+def verify(count=20000, seed=0):
+    """
+    与BaZiCalculator逐行对照，返回不一致的行数
+    """
+    from bazi_tool import BaZiCalculator
+
+    timestamps, longitudes = _random_rows(count, seed)
+    batch = format_pillars(calculate_pillars(timestamps, longitudes))
+
+    mismatches = 0
+    for moment, longitude, got in zip(timestamps.tolist(), longitudes.tolist(), batch):
+        calculator = BaZiCalculator(
+            "", "男", "公历", moment.year, moment.month, moment.day, moment.hour, moment.minute, ""
+        )
+        # 直接指定经度，跳过城市查询
+        calculator._birth_longitude = longitude
+        if calculator.ba_zi != got:
+            mismatches += 1
+            print(f"不一致: {moment} {longitude} 逐行={calculator.ba_zi} 批量={got}")
+    return mismatches
+
+
+def main():
+    command = sys.argv[1] if len(sys.argv) > 1 else "verify"
+    if command == "verify":
+        count = int(sys.argv[2]) if len(sys.argv) > 2 else 20000
+        start = time.perf_counter()
+        mismatches = verify(count)
+        print(f"校验完成：{count} 行中 {mismatches} 行不一致，耗时 {time.perf_counter() - start:.1f}s")
+        sys.exit(1 if mismatches else 0)
+    elif command == "bench":
+        count = int(sys.argv[2]) if len(sys.argv) > 2 else 1000000
+        timestamps, longitudes = _random_rows(count)
+        calculate_pillars(timestamps[:1], longitudes[:1])
+        start = time.perf_counter()
+        calculate_pillars(timestamps, longitudes)
+        elapsed = time.perf_counter() - start
+        print(f"{count} 行，耗时 {elapsed * 1000:.1f}ms（{count / elapsed:,.0f} 行/秒）")
+    else:
+        print(__doc__)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
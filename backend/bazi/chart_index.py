@@ -0,0 +1,273 @@
+"""
+八字反查索引（chart_index.bin）
+
+由四柱反查1900～2100年间所有对应的出生时段（真太阳时）。
+
+年柱、月柱按立春和各"节"所在的公历日切换，日柱按公历日切换，所以同一天内的年、月、日三柱固定，
+只有时柱随时辰变化。索引只需为每一天记录一条"年月日三柱 -> 日期"，按三柱排序后二分查找；
+时柱由日干推出（五鼠遁），查询时逐个核对命中日的时辰即可，不必为每个时辰单独建索引。
+
+三柱编码为 (年柱序号 × 60 + 月柱序号) × 60 + 日柱序号（六十甲子序号0～59），
+由bazi_vector批量计算生成（与BaZiCalculator结果一致）。
+
+文件布局（小端序）：
+    header   4s magic, uint32 version, uint32 算法版本, 32s 节气表摘要（jieqi.bin的SHA-256）,
+             int32 起始年, int32 结束年, uint32 天数n
+    keys     uint32 × n   三柱编码（升序）
+    days     int32  × n   对应的公历日序号（date.toordinal，三柱相同时升序）
+
+索引由节气表推算而来：加载时算法版本或节气表摘要与当前不一致（节气表重新生成、换月规则修改等），
+视为过期，get_chart_index()会重新构建并写回文件。
+
+用法：
+    python chart_index.py build
+    python chart_index.py bench
+"""
+import datetime
+import hashlib
+import os
+import struct
+import sys
+import threading
+import time
+
+import numpy as np
+
+from bazi_tool import Gan, Zhi
+from bazi_vector import calculate_pillars
+from jieqi_table import DEFAULT_TABLE_PATH
+
+MAGIC = b"CIX1"
+VERSION = 2
+# 三柱推算规则（bazi_vector的换年、换月、日柱）改变时递增，使已生成的索引失效
+ALGORITHM_VERSION = 1
+HEADER = struct.Struct("<4sII32siiI")
+
+START_YEAR = 1900
+END_YEAR = 2100
+
+CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_INDEX_PATH = os.path.join(CURRENT_DIR, "chart_index.bin")
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def jieqi_digest(path=DEFAULT_TABLE_PATH):
+    """
+    节气表文件的SHA-256摘要
+    """
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).digest()
+
+
+def ganzhi_index(stems, branches):
+    """
+    天干、地支序号 -> 六十甲子序号（支持NumPy数组）
+    """
+    return (6 * stems - 5 * branches) % 60
+
+
+def parse_ba_zi(ba_zi):
+    """
+    解析四柱字符串（如"甲子 丙寅 戊辰 壬子"）
+
+    Returns:
+        [(天干序号, 地支序号)] × 4，依次为年、月、日、时
+
+    Raises:
+        ValueError: 格式不正确或天干地支阴阳不匹配（如"甲丑"）
+    """
+    pillars = ba_zi.split()
+    if len(pillars) != 4 or any(len(pillar) != 2 for pillar in pillars):
+        raise ValueError("八字格式应为空格分隔的四柱，如：甲子 丙寅 戊辰 壬子")
+
+    parsed = []
+    for pillar in pillars:
+        if pillar[0] not in Gan or pillar[1] not in Zhi:
+            raise ValueError(f"无法识别的干支：{pillar}")
+        stem, branch = Gan.index(pillar[0]), Zhi.index(pillar[1])
+        if stem % 2 != branch % 2:
+            raise ValueError(f"不存在的干支组合：{pillar}")
+        parsed.append((stem, branch))
+    return parsed
+
+
+class ChartIndex:
+    """
+    八字反查索引
+
+    keys/days为按三柱编码排序的并列数组，每个公历日一条
+    """
+
+    def __init__(self, keys, days):
+        self.keys = keys
+        self.days = days
+
+    @classmethod
+    def build(cls):
+        """
+        用bazi_vector计算START_YEAR～END_YEAR每一天的年、月、日三柱并排序
+        """
+        first = datetime.date(START_YEAR, 1, 1)
+        last = datetime.date(END_YEAR, 12, 31)
+        dates = np.arange(
+            np.datetime64(first, "D"), np.datetime64(last, "D") + 1, dtype="datetime64[D]"
+        )
+        # 三柱只与公历日有关，取当日正午、东八区标准经线（真太阳时即输入时间）
+        pillars = calculate_pillars(dates.astype("datetime64[m]") + np.timedelta64(12 * 60, "m"), 120.0)
+        gz = ganzhi_index(pillars.stems[:, :3].astype(np.int64), pillars.branches[:, :3].astype(np.int64))
+        keys = ((gz[:, 0] * 60 + gz[:, 1]) * 60 + gz[:, 2]).astype(np.uint32)
+        days = (dates.astype(np.int64) + datetime.date(1970, 1, 1).toordinal()).astype(np.int32)
+
+        order = np.lexsort((days, keys))
+        return cls(keys[order], days[order])
+
+    @classmethod
+    def load(cls, path=DEFAULT_INDEX_PATH):
+        """
+        从chart_index.bin加载
+
+        Raises:
+            ValueError: 文件格式无法识别，或算法版本、节气表摘要与当前不一致（索引已过期）
+        """
+        with open(path, "rb") as f:
+            data = f.read()
+
+        magic, version, algorithm_version, digest, _, _, count = HEADER.unpack_from(data, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"无法识别的八字索引文件: {path}")
+        if algorithm_version != ALGORITHM_VERSION or digest != jieqi_digest():
+            raise ValueError(f"八字索引已过期（算法版本或节气表已变更）: {path}")
+
+        keys = np.frombuffer(data, dtype="<u4", count=count, offset=HEADER.size)
+        days = np.frombuffer(data, dtype="<i4", count=count, offset=HEADER.size + 4 * count)
+        return cls(keys, days)
+
+    def save(self, path=DEFAULT_INDEX_PATH):
+        """
+        写入chart_index.bin（先写临时文件再替换，避免读到半个文件）
+
+        Returns:
+            文件字节数
+        """
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(HEADER.pack(
+                MAGIC, VERSION, ALGORITHM_VERSION, jieqi_digest(), START_YEAR, END_YEAR, len(self.keys)
+            ))
+            f.write(self.keys.astype("<u4").tobytes())
+            f.write(self.days.astype("<i4").tobytes())
+        os.replace(tmp_path, path)
+        return os.path.getsize(path)
+
+    def search(self, ba_zi):
+        """
+        反查四柱对应的全部出生时段
+
+        Args:
+            ba_zi: 四柱字符串，如"甲子 丙寅 戊辰 壬子"
+
+        Returns:
+            [(开始时间, 结束时间)]，均为真太阳时的datetime，按时间升序；
+            23点属于次日天干的子时（晚子时），与0点的子时分别返回
+        """
+        (year, month, day, (hour_stem, hour_branch)) = parse_ba_zi(ba_zi)
+        year_gz, month_gz, day_gz = (ganzhi_index(stem, branch) for stem, branch in (year, month, day))
+        key = (year_gz * 60 + month_gz) * 60 + day_gz
+
+        start = int(np.searchsorted(self.keys, key, side="left"))
+        end = int(np.searchsorted(self.keys, key, side="right"))
+        if start == end:
+            return []
+
+        # 五鼠遁：子时天干为日干%5×2，此后每个时辰顺推一位，23点的晚子时再顺推到次日天干
+        first_stem = day[0] % 5 * 2
+        if hour_branch == 0:
+            slots = [(0, 1)] if hour_stem == first_stem else []
+            if hour_stem == (first_stem + 2) % 10:
+                slots.append((23, 24))
+        elif hour_stem == (first_stem + hour_branch) % 10:
+            slots = [(hour_branch * 2 - 1, hour_branch * 2 + 1)]
+        else:
+            slots = []
+
+        windows = []
+        for ordinal in self.days[start:end].tolist():
+            midnight = datetime.datetime.combine(datetime.date.fromordinal(ordinal), datetime.time())
+            for begin_hour, end_hour in slots:
+                windows.append((
+                    midnight + datetime.timedelta(hours=begin_hour),
+                    midnight + datetime.timedelta(hours=end_hour),
+                ))
+        return windows
+
+
+def get_chart_index():
+    """
+    获取全局八字反查索引（进程内只加载一次）
+
+    优先加载chart_index.bin（由chart_index.py build生成）；文件不存在或已过期时重新构建，
+    并尽量写回文件（目录不可写时只保留在内存中）
+    """
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _index = _load_or_build()
+    return _index
+
+
+def _load_or_build():
+    if os.path.exists(DEFAULT_INDEX_PATH):
+        try:
+            return ChartIndex.load()
+        except ValueError:
+            pass
+    index = ChartIndex.build()
+    try:
+        index.save()
+    except OSError:
+        pass
+    return index
+
+
+def search_charts(ba_zi):
+    """
+    八字反查出生时段
+    """
+    return get_chart_index().search(ba_zi)
+
+
+def main():
+    command = sys.argv[1] if len(sys.argv) > 1 else "build"
+    if command == "build":
+        start = time.perf_counter()
+        index = ChartIndex.build()
+        size = index.save()
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        print(f"已生成 {DEFAULT_INDEX_PATH}：{len(index.keys)} 天，"
+              f"{len(np.unique(index.keys))} 种年月日三柱，{size} 字节，耗时 {elapsed_ms:.1f}ms")
+    elif command == "bench":
+        start = time.perf_counter()
+        index = ChartIndex.load()
+        print(f"加载耗时 {(time.perf_counter() - start) * 1000:.2f}ms")
+
+        queries = ["甲子 丙寅 戊辰 壬子", "庚午 辛巳 丁卯 丙午", "癸亥 乙卯 壬申 庚子", "甲子 乙丑 丙寅 丁卯"]
+        rounds = 2000
+        start = time.perf_counter()
+        for _ in range(rounds):
+            for query in queries:
+                index.search(query)
+        elapsed = time.perf_counter() - start
+        print(f"单次查询 {elapsed / (rounds * len(queries)) * 1e6:.1f}µs")
+        for query in queries:
+            windows = index.search(query)
+            print(query, [f"{begin:%Y-%m-%d %H:%M}～{end:%H:%M}" for begin, end in windows])
+    else:
+        print(__doc__)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
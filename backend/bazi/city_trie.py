@@ -0,0 +1,113 @@
+import threading
+
+from query_longitude import get_region_index
+
+# 联想结果的级别排序：市 > 省 > 区县 > 街道
+LEVEL_RANK = {'city': 0, 'province': 1, 'district': 2, 'street': 3}
+
+# 每个前缀节点预先保留的候选数量（即单次查询可返回的最大条数）
+MAX_SUGGESTIONS = 20
+
+_trie = None
+_trie_lock = threading.Lock()
+
+
+class CityTrie:
+    """
+    地区名称前缀树
+
+    每个前缀节点在构建时即保存排好序的前MAX_SUGGESTIONS个候选节点编号，
+    查询只需沿输入逐字下行，耗时与输入长度成正比，与地区总数无关。
+    排序规则：名称与输入完全相同 > 级别（市/省/区县/街道） > 名称长度 > 数据顺序
+    """
+
+    def __init__(self, index):
+        self.index = index
+
+        # 前缀节点：{'children': {字: 子节点}, 'top': [候选编号], 'exact': [完全匹配编号]}
+        self.root = _new_node()
+
+        ranked = sorted(
+            range(len(index.names)),
+            key=lambda node_id: (LEVEL_RANK.get(index.levels[node_id], len(LEVEL_RANK)),
+                                 len(index.names[node_id]), node_id)
+        )
+        # 按排名顺序插入，各前缀节点的top天然有序，满额后即可停止追加
+        for node_id in ranked:
+            node = self.root
+            for char in index.names[node_id]:
+                node = node['children'].setdefault(char, _new_node())
+                if len(node['top']) < MAX_SUGGESTIONS:
+                    node['top'].append(node_id)
+            node['exact'].append(node_id)
+
+        self.paths = [self._full_path(node_id) for node_id in range(len(index.names))]
+
+    def _full_path(self, node_id):
+        """
+        拼接从省级到当前节点的完整路径，如：广东省/惠州市/惠城区
+        """
+        parts = []
+        while node_id >= 0:
+            parts.append(self.index.names[node_id])
+            node_id = self.index.parents[node_id]
+        return '/'.join(reversed(parts))
+
+    def suggest(self, prefix, limit=10):
+        """
+        返回以prefix开头的地区联想结果
+
+        Returns:
+            [{'name', 'full_path', 'level', 'longitude'}, ...]，最多limit条
+        """
+        prefix = prefix.strip()
+        limit = min(limit, MAX_SUGGESTIONS)
+        if not prefix or limit <= 0:
+            return []
+
+        node = self.root
+        for char in prefix:
+            node = node['children'].get(char)
+            if node is None:
+                return []
+
+        node_ids = node['exact'] + [node_id for node_id in node['top'] if node_id not in node['exact']]
+
+        index = self.index
+        return [
+            {
+                'name': index.names[node_id],
+                'full_path': self.paths[node_id],
+                'level': index.levels[node_id],
+                'longitude': index.longitudes[node_id],
+            }
+            for node_id in node_ids[:limit]
+        ]
+
+
+def _new_node():
+    return {'children': {}, 'top': [], 'exact': []}
+
+
+def get_city_trie():
+    """
+    获取全局地区前缀树（进程内只构建一次）
+    """
+    global _trie
+    if _trie is None:
+        with _trie_lock:
+            if _trie is None:
+                _trie = CityTrie(get_region_index())
+    return _trie
+
+
+def suggest_cities(prefix, limit=10):
+    """
+    城市名称联想
+    """
+    return get_city_trie().suggest(prefix, limit)
+
+
+if __name__ == "__main__":
+    for prefix in ["惠", "惠州", "广", "北京", "朝阳"]:
+        print(prefix, [item['full_path'] for item in suggest_cities(prefix, 5)])
@@ -0,0 +1,234 @@
+"""
+节气时刻表（jieqi.bin）
+
+sxtwl逐日before(1)/after(1)查找节气需要创建大量原生Day对象，
+这里预先把1899～2101年的全部节气时刻（儒略日，北京时间）与节气序号
+打包成定长数组，查询时对日序号做二分查找，时间复杂度O(log n)。
+
+节气序号与bazi_tool.jqmc一致（0为冬至）。表文件由sxtwl生成后随代码提交，
+sxtwl升级或需要扩展年份范围时重新执行build即可。
+
+文件布局（小端序）：
+    header   4s magic, uint32 version, int32 起始年, int32 结束年, uint32 节气数n
+    jds      float64 × n   节气时刻的儒略日（北京时间）
+    indexes  uint8   × n   节气序号
+
+用法：
+    python jieqi_table.py build
+    python jieqi_table.py verify
+"""
+import datetime
+import os
+import struct
+import sys
+import threading
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import namedtuple
+
+MAGIC = b"JQT1"
+VERSION = 1
+HEADER = struct.Struct("<4sIiiI")
+
+# 比八字支持的1900～2100年各多留一年，真太阳时校正可能跨入相邻年份
+START_YEAR = 1899
+END_YEAR = 2101
+
+# 儒略日与datetime.date.toordinal()的换算常数（JD整数日对应当日正午）
+ORDINAL_TO_JD = 1721425
+
+CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_TABLE_PATH = os.path.join(CURRENT_DIR, "jieqi.bin")
+
+# 节气查询结果：序号、时刻（儒略日）、与查询日期相差的天数
+JieQi = namedtuple("JieQi", ["index", "jd", "days"])
+
+_table = None
+_table_lock = threading.Lock()
+
+
+def jd_to_ordinal(jd):
+    """
+    儒略日 -> 公历日序号（datetime.date.toordinal）
+    """
+    return int(jd + 0.5) - ORDINAL_TO_JD
+
+
+def datetime_to_jd(moment):
+    """
+    datetime（北京时间，不带时区） -> 儒略日
+    """
+    seconds = moment.hour * 3600 + moment.minute * 60 + moment.second + moment.microsecond / 1e6
+    return moment.toordinal() + ORDINAL_TO_JD - 0.5 + seconds / 86400
+
+
+class JieQiTable:
+    """
+    节气时刻表
+
+    jds/indexes为按时间升序的并列数组，days为各节气所在公历日的日序号，
+    与sxtwl的Day.hasJieQi()判定的日期一致
+    """
+
+    def __init__(self, jds, indexes):
+        self.jds = jds
+        self.indexes = indexes
+        self.days = array("i", (jd_to_ordinal(jd) for jd in jds))
+
+    @classmethod
+    def load(cls, path=DEFAULT_TABLE_PATH):
+        """
+        从jieqi.bin加载
+        """
+        with open(path, "rb") as f:
+            data = f.read()
+
+        magic, version, _, _, count = HEADER.unpack_from(data, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"无法识别的节气表文件: {path}")
+
+        jds_at = HEADER.size
+        indexes_at = jds_at + 8 * count
+        jds = array("d", data[jds_at:indexes_at])
+        indexes = array("B", data[indexes_at:indexes_at + count])
+        if sys.byteorder != "little":
+            jds.byteswap()
+        return cls(jds, indexes)
+
+    def _check_range(self, position):
+        if position < 0 or position >= len(self.jds):
+            raise ValueError(f"日期超出节气表范围（{START_YEAR}～{END_YEAR}年）")
+
+    def _event(self, position, days):
+        return JieQi(self.indexes[position], self.jds[position], days)
+
+    def previous(self, day):
+        """
+        查询当天或之前最近的节气
+
+        Args:
+            day: datetime.date（或datetime），按公历日比较
+
+        Returns:
+            JieQi，days为距该节气的天数（当天有节气时为0）
+        """
+        ordinal = day.toordinal()
+        position = bisect_right(self.days, ordinal) - 1
+        self._check_range(position)
+        return self._event(position, ordinal - self.days[position])
+
+    def next(self, day):
+        """
+        查询当天或之后最近的节气
+
+        Returns:
+            JieQi，days为距该节气的天数（当天有节气时为0）
+        """
+        ordinal = day.toordinal()
+        position = bisect_left(self.days, ordinal)
+        self._check_range(position)
+        return self._event(position, self.days[position] - ordinal)
+
+    def previous_jie(self, day):
+        """
+        查询当天或之前最近的"节"（小寒、立春、惊蛰……大雪，序号为奇数），月柱以此为界
+
+        Returns:
+            JieQi，days为距该节的天数（当天交节时为0）
+        """
+        ordinal = day.toordinal()
+        position = bisect_right(self.days, ordinal) - 1
+        # 节与中气交替出现，最近的是中气时再往前一个即为节
+        if position >= 0 and self.indexes[position] % 2 == 0:
+            position -= 1
+        self._check_range(position)
+        return self._event(position, ordinal - self.days[position])
+
+
+def get_jieqi_table():
+    """
+    获取全局节气表（进程内只加载一次）
+    """
+    global _table
+    if _table is None:
+        with _table_lock:
+            if _table is None:
+                _table = JieQiTable.load()
+    return _table
+
+
+def build(path=DEFAULT_TABLE_PATH):
+    """
+    使用sxtwl生成jieqi.bin
+
+    Returns:
+        写入的节气数
+    """
+    import sxtwl
+
+    jds = array("d")
+    indexes = array("B")
+    # getJieQiByYear(y)返回y年立春至次年立春，从前一年开始才能覆盖起始年的小寒、大寒
+    for year in range(START_YEAR - 1, END_YEAR + 1):
+        for info in sxtwl.getJieQiByYear(year):
+            # 相邻年份的结果首尾（立春）重叠，只保留严格递增的部分
+            if jds and info.jd <= jds[-1]:
+                continue
+            jds.append(info.jd)
+            indexes.append(info.jqIndex)
+
+    count = len(jds)
+    if sys.byteorder != "little":
+        jds.byteswap()
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, VERSION, START_YEAR, END_YEAR, count))
+        f.write(jds.tobytes())
+        f.write(indexes.tobytes())
+    os.replace(tmp_path, path)
+    return count
+
+
+def verify(path=DEFAULT_TABLE_PATH):
+    """
+    逐日与sxtwl的hasJieQi()/getJieQi()对照，返回不一致的天数
+    """
+    import sxtwl
+
+    table = JieQiTable.load(path)
+    marked = dict(zip(table.days, table.indexes))
+
+    mismatches = 0
+    day = datetime.date(START_YEAR, 1, 1)
+    last_day = datetime.date(END_YEAR, 12, 31)
+    while day <= last_day:
+        native = sxtwl.fromSolar(day.year, day.month, day.day)
+        expected = native.getJieQi() if native.hasJieQi() else None
+        if marked.get(day.toordinal()) != expected:
+            mismatches += 1
+            print(f"不一致: {day} sxtwl={expected} table={marked.get(day.toordinal())}")
+        day += datetime.timedelta(days=1)
+    return mismatches
+
+
+def main():
+    command = sys.argv[1] if len(sys.argv) > 1 else "build"
+    start = time.perf_counter()
+    if command == "build":
+        count = build()
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        print(f"已生成 {DEFAULT_TABLE_PATH}：{count} 个节气，"
+              f"{os.path.getsize(DEFAULT_TABLE_PATH)} 字节，耗时 {elapsed_ms:.1f}ms")
+    elif command == "verify":
+        mismatches = verify()
+        print(f"校验完成：{mismatches} 天不一致，耗时 {time.perf_counter() - start:.1f}s")
+        sys.exit(1 if mismatches else 0)
+    else:
+        print(__doc__)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
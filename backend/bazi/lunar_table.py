@@ -0,0 +1,259 @@
+"""
+农历月表（lunar.bin）
+
+预先把1899～2101年每个农历月的初一（公历日序号）、农历年、月份、是否闰月和天数
+打包成定长数组，公历 -> 农历对初一日序号二分查找，农历 -> 公历对(年, 月, 闰)编码二分查找，
+均为O(log n)，替代每次请求调用sxtwl.fromSolar/fromLunar。
+
+表文件由sxtwl生成后随代码提交，sxtwl升级或需要扩展年份范围时重新执行build即可。
+
+文件布局（小端序）：
+    header   4s magic, uint32 version, int32 起始年, int32 结束年, uint32 月数n
+    starts   int32  × n   初一的公历日序号（date.toordinal，升序）
+    years    int16  × n   农历年
+    months   uint8  × n   月份（1～12）
+    leaps    uint8  × n   是否闰月（0/1）
+    lengths  uint8  × n   当月天数（29/30）
+
+用法：
+    python lunar_table.py build
+    python lunar_table.py verify
+"""
+import datetime
+import os
+import struct
+import sys
+import threading
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import namedtuple
+
+MAGIC = b"LMT1"
+VERSION = 1
+HEADER = struct.Struct("<4sIiiI")
+
+# 与节气表一致，比八字支持的1900～2100年各多留一年
+START_YEAR = 1899
+END_YEAR = 2101
+
+CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_TABLE_PATH = os.path.join(CURRENT_DIR, "lunar.bin")
+
+# 农历日期：年、月、日、是否闰月
+LunarDate = namedtuple("LunarDate", ["year", "month", "day", "leap"])
+
+_table = None
+_table_lock = threading.Lock()
+
+
+def month_key(year, month, leap):
+    """
+    (农历年, 月, 是否闰月) -> 排序编码，闰月紧跟在同号月之后，编码随时间单调递增
+    """
+    return year * 32 + month * 2 + (1 if leap else 0)
+
+
+class LunarTable:
+    """
+    农历月表
+
+    starts/years/months/leaps/lengths为按时间升序的并列数组，每个农历月一条
+    """
+
+    def __init__(self, starts, years, months, leaps, lengths):
+        self.starts = starts
+        self.years = years
+        self.months = months
+        self.leaps = leaps
+        self.lengths = lengths
+        self.keys = array("i", (
+            month_key(year, month, leap) for year, month, leap in zip(years, months, leaps)
+        ))
+
+    @classmethod
+    def load(cls, path=DEFAULT_TABLE_PATH):
+        """
+        从lunar.bin加载
+        """
+        with open(path, "rb") as f:
+            data = f.read()
+
+        magic, version, _, _, count = HEADER.unpack_from(data, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"无法识别的农历月表文件: {path}")
+
+        offset = HEADER.size
+        columns = []
+        for typecode in ("i", "h", "B", "B", "B"):
+            column = array(typecode)
+            size = column.itemsize * count
+            column.frombytes(data[offset:offset + size])
+            if sys.byteorder != "little":
+                column.byteswap()
+            columns.append(column)
+            offset += size
+        return cls(*columns)
+
+    def _check_range(self, ordinal):
+        if ordinal < self.starts[0] or ordinal >= self.starts[-1] + self.lengths[-1]:
+            raise ValueError(f"日期超出农历月表范围（{START_YEAR}～{END_YEAR}年）")
+
+    def to_lunar(self, day):
+        """
+        公历 -> 农历
+
+        Args:
+            day: datetime.date（或datetime），按公历日计算
+
+        Returns:
+            LunarDate
+        """
+        ordinal = day.toordinal()
+        self._check_range(ordinal)
+        position = bisect_right(self.starts, ordinal) - 1
+        return LunarDate(
+            self.years[position],
+            self.months[position],
+            ordinal - self.starts[position] + 1,
+            bool(self.leaps[position])
+        )
+
+    def to_solar(self, year, month, day, leap=False):
+        """
+        农历 -> 公历
+
+        与sxtwl.fromLunar一致，日数超过当月天数时顺延到下个月（如小月的三十即下月初一）
+
+        Args:
+            year: 农历年
+            month: 月份（1～12）
+            day: 日
+            leap: 是否闰月
+
+        Returns:
+            datetime.date
+
+        Raises:
+            ValueError: 超出表范围，或该年没有指定的闰月
+        """
+        key = month_key(year, month, leap)
+        position = bisect_left(self.keys, key)
+        if position >= len(self.keys) or self.keys[position] != key:
+            if leap and START_YEAR <= year <= END_YEAR:
+                raise ValueError(f"农历{year}年没有闰{month}月")
+            raise ValueError(f"日期超出农历月表范围（{START_YEAR}～{END_YEAR}年）")
+
+        ordinal = self.starts[position] + day - 1
+        self._check_range(ordinal)
+        return datetime.date.fromordinal(ordinal)
+
+
+def get_lunar_table():
+    """
+    获取全局农历月表（进程内只加载一次）
+    """
+    global _table
+    if _table is None:
+        with _table_lock:
+            if _table is None:
+                _table = LunarTable.load()
+    return _table
+
+
+def build(path=DEFAULT_TABLE_PATH):
+    """
+    使用sxtwl生成lunar.bin：逐日遍历，记录每个农历初一
+
+    Returns:
+        写入的农历月数
+    """
+    import sxtwl
+
+    starts, years, months, leaps = array("i"), array("h"), array("B"), array("B")
+    # 从起始年前一个月开始，保证起始年1月1日所在的农历月完整
+    day = datetime.date(START_YEAR - 1, 12, 1)
+    # 多扫一个月，用于计算最后一个月的天数
+    last_day = datetime.date(END_YEAR + 1, 2, 1)
+    while day <= last_day:
+        native = sxtwl.fromSolar(day.year, day.month, day.day)
+        if native.getLunarDay() == 1:
+            starts.append(day.toordinal())
+            years.append(native.getLunarYear())
+            months.append(native.getLunarMonth())
+            leaps.append(1 if native.isLunarLeap() else 0)
+        day += datetime.timedelta(days=1)
+
+    lengths = array("B", (starts[i + 1] - starts[i] for i in range(len(starts) - 1)))
+    # 最后一条只用于计算天数，不写入
+    for column in (starts, years, months, leaps):
+        column.pop()
+
+    count = len(starts)
+    columns = (starts, years, months, leaps, lengths)
+    if sys.byteorder != "little":
+        for column in columns:
+            column.byteswap()
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, VERSION, START_YEAR, END_YEAR, count))
+        for column in columns:
+            f.write(column.tobytes())
+    os.replace(tmp_path, path)
+    return count
+
+
+def verify(path=DEFAULT_TABLE_PATH):
+    """
+    逐日与sxtwl对照公历 -> 农历，逐月对照农历 -> 公历（含闰月与日数顺延），返回不一致的条数
+    """
+    import sxtwl
+
+    table = LunarTable.load(path)
+
+    mismatches = 0
+    day = datetime.date(START_YEAR, 1, 1)
+    last_day = datetime.date(END_YEAR, 12, 31)
+    while day <= last_day:
+        native = sxtwl.fromSolar(day.year, day.month, day.day)
+        expected = LunarDate(native.getLunarYear(), native.getLunarMonth(),
+                             native.getLunarDay(), bool(native.isLunarLeap()))
+        got = table.to_lunar(day)
+        if got != expected:
+            mismatches += 1
+            print(f"不一致: {day} sxtwl={expected} table={got}")
+        day += datetime.timedelta(days=1)
+
+    for year, month, leap in zip(table.years, table.months, table.leaps):
+        if not START_YEAR < year < END_YEAR:
+            continue
+        for lunar_day in (1, 15, 29, 30):
+            native = sxtwl.fromLunar(year, month, lunar_day, bool(leap))
+            expected = datetime.date(native.getSolarYear(), native.getSolarMonth(), native.getSolarDay())
+            got = table.to_solar(year, month, lunar_day, bool(leap))
+            if got != expected:
+                mismatches += 1
+                print(f"不一致: 农历{year}年{'闰' if leap else ''}{month}月{lunar_day}日 sxtwl={expected} table={got}")
+    return mismatches
+
+
+def main():
+    command = sys.argv[1] if len(sys.argv) > 1 else "build"
+    start = time.perf_counter()
+    if command == "build":
+        count = build()
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        print(f"已生成 {DEFAULT_TABLE_PATH}：{count} 个农历月，"
+              f"{os.path.getsize(DEFAULT_TABLE_PATH)} 字节，耗时 {elapsed_ms:.1f}ms")
+    elif command == "verify":
+        mismatches = verify()
+        print(f"校验完成：{mismatches} 处不一致，耗时 {time.perf_counter() - start:.1f}s")
+        sys.exit(1 if mismatches else 0)
+    else:
+        print(__doc__)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
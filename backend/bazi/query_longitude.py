@@ -1,74 +1,219 @@
 import json
-import re
+import os
+import threading
+from functools import lru_cache
+
+from region_table import RegionTable, flatten_region_data, is_fresh
+
+# 城市名称常见后缀（按长度降序，优先剥离较长的后缀）
+NAME_SUFFIXES = ("特别行政区", "维吾尔自治区", "壮族自治区", "回族自治区", "自治区", "自治州", "地区", "省", "市", "区", "县")
+
+# 未匹配到任何地区时使用的默认经度（东八区标准经线）
+DEFAULT_LONGITUDE = 120.0
+
+_index = None
+_index_lock = threading.Lock()
+
 
 def load_region_data():
     """
     加载region.json数据
     """
-    import os
     # 获取当前文件所在目录
     current_dir = os.path.dirname(os.path.abspath(__file__))
     region_file = os.path.join(current_dir, 'region.json')
-    
+
     with open(region_file, 'r', encoding='utf-8') as f:
         return json.load(f)
 
-def fuzzy_match(city_name, target_name):
+
+def normalize_name(name):
     """
-    模糊匹配城市名称
+    规范化地区名称：去除首尾空白并剥离省/市/区/县等行政后缀
     """
-    return re.search(city_name, target_name)
+    name = name.strip()
+    for suffix in NAME_SUFFIXES:
+        if len(name) > len(suffix) and name.endswith(suffix):
+            return name[:-len(suffix)]
+    return name
+
+
+class RegionIndex:
+    """
+    地区经度索引
+
+    将region.json的省/市/区树按深度优先顺序展平为并列数组（列表或region.bin的只读映射列），
+    节点编号即遍历顺序，并在此基础上使用三个查找表（由build_lookups生成，
+    使用region.bin时为文件中的只读映射列，接口与dict.get一致）：
+    - exact：完整名称 -> 查询结果的节点编号
+    - normalized：剥离行政后缀后的名称 -> 节点编号列表
+    - grams：单字/双字 -> 包含该片段的节点编号列表（升序）
+    """
+
+    def __init__(self, names, levels, longitudes, parents, exact, normalized, grams):
+        self.names = names
+        self.levels = levels
+        self.longitudes = longitudes
+        self.parents = parents
+        self.exact = exact
+        self.normalized = normalized
+        self.grams = grams
+
+    @classmethod
+    def from_region_data(cls, data):
+        """
+        从region.json的数据树构建索引（根节点"国家"本身不参与匹配）
+        """
+        names, levels, longitudes, _, parents = flatten_region_data(data)
+        return cls(names, levels, longitudes, parents, *build_lookups(names, levels))
+
+    @classmethod
+    def from_table(cls, table):
+        """
+        从mmap映射的region.bin构建索引，各列及查找表直接引用映射页
+        """
+        return cls(
+            table.names, table.levels, table.longitudes, table.parents,
+            table.exact, table.normalized, table.grams
+        )
+
+    def _substring_matches(self, city_name):
+        """
+        返回名称中包含city_name（按字面子串）的全部节点编号，保持遍历顺序
+        """
+        if not city_name:
+            return range(len(self.names))
+
+        if len(city_name) == 1:
+            return self.grams.get(city_name, ())
+
+        # 取最短的双字倒排列表作为候选，再逐个做字面子串校验
+        candidates = None
+        for gram in _grams(city_name, unigrams=False):
+            postings = self.grams.get(gram)
+            if not postings:
+                return ()
+            if candidates is None or len(postings) < len(candidates):
+                candidates = postings
+
+        names = self.names
+        return [node_id for node_id in candidates if city_name in names[node_id]]
+
+    def _pick(self, node_ids):
+        """
+        按 市级 > 省级 > 第一个匹配项 的优先级选出节点编号，没有匹配项时返回None
+        """
+        first_province = None
+        first_match = None
+        for node_id in node_ids:
+            level = self.levels[node_id]
+            if level == 'city':
+                return node_id
+            if first_match is None:
+                first_match = node_id
+            if level == 'province' and first_province is None:
+                first_province = node_id
 
+        if first_province is not None:
+            return first_province
+        return first_match
+
+    def lookup(self, city_name):
+        """
+        查询城市经度，没有匹配项时返回None
+
+        依次尝试：完整名称精确匹配 -> 字面子串匹配 -> 剥离行政后缀后的名称匹配
+        """
+        node_id = self.exact.get(city_name)
+        if node_id is None:
+            node_id = self._pick(self._substring_matches(city_name))
+        if node_id is None:
+            normalized = normalize_name(city_name)
+            if normalized:
+                node_id = self._pick(self.normalized.get(normalized, ()))
+        if node_id is None:
+            return None
+        return self.longitudes[node_id]
+
+
+def _grams(text, unigrams=True):
+    """
+    生成文本的单字与相邻双字片段
+    """
+    if unigrams:
+        yield from text
+    for i in range(len(text) - 1):
+        yield text[i:i + 2]
+
+
+def build_lookups(names, levels):
+    """
+    建立RegionIndex的三个查找表
+
+    Returns:
+        (exact, normalized, grams) 三个字典
+    """
+    normalized = {}
+    grams = {}
+    for node_id, name in enumerate(names):
+        normalized.setdefault(normalize_name(name), []).append(node_id)
+        for gram in _grams(name):
+            postings = grams.setdefault(gram, [])
+            # 同一名称中重复出现的片段只记录一次
+            if not postings or postings[-1] != node_id:
+                postings.append(node_id)
+
+    # 完整名称直接预先计算出与子串查询一致的结果
+    index = RegionIndex(names, levels, None, None, {}, normalized, grams)
+    exact = {}
+    for name in names:
+        if name not in exact:
+            exact[name] = index._pick(index._substring_matches(name))
+    return exact, normalized, grams
+
+
+def get_region_index():
+    """
+    获取全局地区索引（进程内只构建一次）
+
+    优先使用mmap映射的region.bin（由region_table.py build生成），
+    文件不存在、早于region.json或格式版本不符时回退为解析JSON
+    """
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _index = _load_region_index()
+    return _index
+
+
+def _load_region_index():
+    if is_fresh():
+        try:
+            return RegionIndex.from_table(RegionTable())
+        except ValueError:
+            pass
+    return RegionIndex.from_region_data(load_region_data())
+
+
+@lru_cache(maxsize=4096)
 def inquire(birth_city):
     """
     根据输入的城市名称查询经度
-    支持模糊查询，优先返回市级经度
+    支持模糊查询（按字面子串匹配，不作为正则表达式解析），优先返回市级经度
     如果没有找到匹配项，返回默认经度120.0
     """
-    data = load_region_data()
-    
-    # 存储匹配的结果
-    matched_cities = []
-    
-    # 递归搜索函数
-    def search_districts(districts):
-        """
-        递归搜索地区数据
-        """
-        for district in districts:
-            # 检查当前地区名称是否匹配
-            if fuzzy_match(birth_city, district['name']):
-                matched_cities.append(district)
-            
-            # 递归搜索子地区
-            if 'districts' in district and district['districts']:
-                search_districts(district['districts'])
-    
-    # 开始搜索
-    search_districts(data['districts'])
-    
-    # 如果没有匹配项，返回默认经度
-    if not matched_cities:
-        return 120.0
-    
-    # 优先选择市级数据
-    for city in matched_cities:
-        if city['level'] == 'city':
-            return float(city['center']['longitude'])
-    
-    # 如果没有市级数据，选择省级数据
-    for city in matched_cities:
-        if city['level'] == 'province':
-            return float(city['center']['longitude'])
-    
-    # 如果没有省市级数据，返回第一个匹配项的经度
-    return float(matched_cities[0]['center']['longitude'])
+    longitude = get_region_index().lookup(birth_city)
+    if longitude is None:
+        return DEFAULT_LONGITUDE
+    return longitude
+
 
 # 主函数示例
 if __name__ == "__main__":
     # 测试用例
     test_cities = ["广东","深圳", "北京市", "上海", "小榄", "广东惠州"]
-    
+
     for city in test_cities:
         city_longitude = inquire(city)
-        print(f"{city}的经度是: {city_longitude}")
\ No newline at end of file
+        print(f"{city}的经度是: {city_longitude}")
@@ -0,0 +1,465 @@
+"""
+地区数据的紧凑二进制格式（region.bin）
+
+region.json解析成Python字典后每个worker都要各自持有一份，而地区数据是只读的。
+这里把它转换为按列存放的二进制文件，运行时通过mmap只读映射，
+同一台机器上的所有worker共享同一份文件页。
+query_longitude的三个查找表（完整名称、规范化名称、单字/双字倒排）也在生成时算好写入文件，
+worker加载时不再解码名称、建立字典。
+
+文件布局（小端序，各列按4字节对齐，经纬度列按8字节对齐）：
+    header      4s magic, uint32 version, uint32 节点数n, uint32 名称区字节数,
+                以及三个查找表的大小：uint32 键数, uint32 键区字节数（, uint32 倒排总数）
+    offsets     uint32 × (n + 1)   名称在名称区中的起止偏移
+    parents     int32  × n         父节点编号（省级为-1）
+    longitudes  float64 × n
+    latitudes   float64 × n
+    levels      uint8  × n         LEVELS中的下标
+    names       UTF-8名称区
+    查找表      依次为exact、normalized、grams，每个表：
+        key_offsets  uint32 × (k + 1)  键在键区中的起止偏移
+        keys         UTF-8键区
+        slots        uint32 × m        开放寻址散列表（m为不小于2k的2的幂，CRC32取模、线性探测），
+                                       存放键的位置+1，0为空槽
+        exact:       values   uint32 × k         完整名称 -> 查询结果的节点编号
+        其余两个:    starts   uint32 × (k + 1)   各键的倒排在postings中的起止位置
+                     postings uint32 × 倒排总数   节点编号（升序）
+
+节点按深度优先先序排列，与query_longitude中的节点编号一致。
+
+用法：
+    python region_table.py build [region.json] [region.bin]
+    python region_table.py bench [次数]
+"""
+import json
+import mmap
+import os
+import struct
+import subprocess
+import sys
+import time
+import zlib
+from array import array
+
+MAGIC = b"RGN1"
+VERSION = 2
+HEADER = struct.Struct("<4sI10I")
+LEVELS = ("country", "province", "city", "district", "street")
+
+CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_JSON_PATH = os.path.join(CURRENT_DIR, "region.json")
+DEFAULT_BIN_PATH = os.path.join(CURRENT_DIR, "region.bin")
+
+
+def _layout(sizes):
+    """
+    计算各列在文件中的起止偏移
+
+    Args:
+        sizes: header中version之后的10个大小字段
+
+    Returns:
+        {列名: (起始偏移, 结束偏移)}，另有"end"为文件总字节数
+    """
+    (count, blob_size,
+     exact_count, exact_blob_size,
+     normalized_count, normalized_blob_size, normalized_postings,
+     gram_count, gram_blob_size, gram_postings) = sizes
+
+    layout = {}
+    position = HEADER.size
+
+    def column(name, size, align=4):
+        nonlocal position
+        position += -position % align
+        layout[name] = (position, position + size)
+        position += size
+
+    column("offsets", 4 * (count + 1))
+    column("parents", 4 * count)
+    column("longitudes", 8 * count, align=8)
+    column("latitudes", 8 * count, align=8)
+    column("levels", count, align=1)
+    column("names", blob_size, align=1)
+
+    column("exact_key_offsets", 4 * (exact_count + 1))
+    column("exact_keys", exact_blob_size, align=1)
+    column("exact_slots", 4 * _slot_count(exact_count))
+    column("exact_values", 4 * exact_count)
+    for prefix, key_count, key_blob_size, postings in (
+        ("normalized", normalized_count, normalized_blob_size, normalized_postings),
+        ("grams", gram_count, gram_blob_size, gram_postings),
+    ):
+        column(f"{prefix}_key_offsets", 4 * (key_count + 1))
+        column(f"{prefix}_keys", key_blob_size, align=1)
+        column(f"{prefix}_slots", 4 * _slot_count(key_count))
+        column(f"{prefix}_starts", 4 * (key_count + 1))
+        column(f"{prefix}_postings", 4 * postings)
+
+    layout["end"] = position
+    return layout
+
+
+def _pack_strings(strings):
+    """
+    字符串 -> (起止偏移, UTF-8字节区)
+    """
+    blob = bytearray()
+    offsets = array("I", [0])
+    for string in strings:
+        blob += string.encode("utf-8")
+        offsets.append(len(blob))
+    return offsets, blob
+
+
+def _slot_count(key_count):
+    """
+    散列表槽数：不小于键数两倍的2的幂
+    """
+    return 1 << max(key_count * 2 - 1, 1).bit_length()
+
+
+def _pack_slots(keys):
+    """
+    键 -> 开放寻址散列表（槽中存放键的位置+1）
+    """
+    mask = _slot_count(len(keys)) - 1
+    slots = array("I", bytes(4 * (mask + 1)))
+    for position, key in enumerate(keys):
+        slot = zlib.crc32(key.encode("utf-8")) & mask
+        while slots[slot]:
+            slot = (slot + 1) & mask
+        slots[slot] = position + 1
+    return slots
+
+
+def flatten_region_data(data):
+    """
+    将region.json的数据树按先序展平（根节点"国家"本身不计入）
+
+    Returns:
+        (names, levels, longitudes, latitudes, parents) 五个等长列表
+    """
+    names, levels, longitudes, latitudes, parents = [], [], [], [], []
+
+    stack = [(district, -1) for district in reversed(data["districts"])]
+    while stack:
+        district, parent_id = stack.pop()
+        node_id = len(names)
+        names.append(district["name"])
+        levels.append(district["level"])
+        longitudes.append(float(district["center"]["longitude"]))
+        latitudes.append(float(district["center"]["latitude"]))
+        parents.append(parent_id)
+        for child in reversed(district.get("districts") or []):
+            stack.append((child, node_id))
+
+    return names, levels, longitudes, latitudes, parents
+
+
+def build(json_path=DEFAULT_JSON_PATH, bin_path=DEFAULT_BIN_PATH):
+    """
+    将region.json转换为region.bin
+
+    Returns:
+        写入的节点数
+    """
+    from query_longitude import build_lookups
+
+    with open(json_path, "r", encoding="utf-8") as f:
+        names, levels, longitudes, latitudes, parents = flatten_region_data(json.load(f))
+    exact, normalized, grams = build_lookups(names, levels)
+
+    count = len(names)
+    columns = {}
+    columns["offsets"], columns["names"] = _pack_strings(names)
+    columns["parents"] = array("i", parents)
+    columns["longitudes"] = array("d", longitudes)
+    columns["latitudes"] = array("d", latitudes)
+    columns["levels"] = bytes(LEVELS.index(level) for level in levels)
+
+    exact_keys = list(exact)
+    columns["exact_key_offsets"], columns["exact_keys"] = _pack_strings(exact_keys)
+    columns["exact_slots"] = _pack_slots(exact_keys)
+    columns["exact_values"] = array("I", (exact[key] for key in exact_keys))
+    for prefix, mapping in (("normalized", normalized), ("grams", grams)):
+        keys = list(mapping)
+        columns[f"{prefix}_key_offsets"], columns[f"{prefix}_keys"] = _pack_strings(keys)
+        columns[f"{prefix}_slots"] = _pack_slots(keys)
+        starts = array("I", [0])
+        postings = array("I")
+        for key in keys:
+            postings.extend(mapping[key])
+            starts.append(len(postings))
+        columns[f"{prefix}_starts"] = starts
+        columns[f"{prefix}_postings"] = postings
+
+    sizes = (
+        count, len(columns["names"]),
+        len(exact_keys), len(columns["exact_keys"]),
+        len(normalized), len(columns["normalized_keys"]), len(columns["normalized_postings"]),
+        len(grams), len(columns["grams_keys"]), len(columns["grams_postings"]),
+    )
+    layout = _layout(sizes)
+    buffer = bytearray(layout["end"])
+    HEADER.pack_into(buffer, 0, MAGIC, VERSION, *sizes)
+    for name, data in columns.items():
+        if isinstance(data, array) and sys.byteorder != "little":
+            data.byteswap()
+        start, end = layout[name]
+        buffer[start:end] = data
+
+    # 先写临时文件再原子替换，避免正在映射该文件的worker读到半截数据
+    tmp_path = f"{bin_path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(buffer)
+    os.replace(tmp_path, bin_path)
+    return count
+
+
+class _NameColumn:
+    """按需从名称区解码的名称列"""
+
+    __slots__ = ("_offsets", "_blob")
+
+    def __init__(self, offsets, blob):
+        self._offsets = offsets
+        self._blob = blob
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def __getitem__(self, node_id):
+        return str(self._blob[self._offsets[node_id]:self._offsets[node_id + 1]], "utf-8")
+
+    def __iter__(self):
+        for node_id in range(len(self)):
+            yield self[node_id]
+
+
+class _KeyColumn:
+    """查找表的键列，按散列表定位后取出字节比较"""
+
+    __slots__ = ("_offsets", "_blob", "_slots", "_mask")
+
+    def __init__(self, offsets, blob, slots):
+        self._offsets = offsets
+        self._blob = blob
+        self._slots = slots
+        self._mask = len(slots) - 1
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def find(self, key):
+        """
+        返回键的位置，不存在时返回-1
+        """
+        encoded = key.encode("utf-8")
+        slots, offsets, mask = self._slots, self._offsets, self._mask
+        slot = zlib.crc32(encoded) & mask
+        while True:
+            entry = slots[slot]
+            if not entry:
+                return -1
+            # 槽中存放位置+1，entry即该键的结束偏移下标
+            if self._blob[offsets[entry - 1]:offsets[entry]] == encoded:
+                return entry - 1
+            slot = (slot + 1) & mask
+
+
+class _ValueColumn:
+    """键 -> 节点编号，接口与dict.get一致"""
+
+    __slots__ = ("_keys", "_values")
+
+    def __init__(self, keys, values):
+        self._keys = keys
+        self._values = values
+
+    def __len__(self):
+        return len(self._keys)
+
+    def get(self, key, default=None):
+        position = self._keys.find(key)
+        if position < 0:
+            return default
+        return self._values[position]
+
+
+class _PostingsColumn:
+    """键 -> 节点编号倒排（映射页上的只读切片），接口与dict.get一致"""
+
+    __slots__ = ("_keys", "_starts", "_postings")
+
+    def __init__(self, keys, starts, postings):
+        self._keys = keys
+        self._starts = starts
+        self._postings = postings
+
+    def __len__(self):
+        return len(self._keys)
+
+    def get(self, key, default=None):
+        position = self._keys.find(key)
+        if position < 0:
+            return default
+        return self._postings[self._starts[position]:self._starts[position + 1]]
+
+
+class _LevelColumn:
+    """将uint8级别编码映射回级别名称的列"""
+
+    __slots__ = ("_codes",)
+
+    def __init__(self, codes):
+        self._codes = codes
+
+    def __len__(self):
+        return len(self._codes)
+
+    def __getitem__(self, node_id):
+        return LEVELS[self._codes[node_id]]
+
+
+class RegionTable:
+    """
+    只读映射region.bin，各列以memoryview的形式直接引用映射页，不做拷贝
+    """
+
+    def __init__(self, bin_path=DEFAULT_BIN_PATH):
+        if sys.byteorder != "little":
+            raise RuntimeError("region.bin仅支持小端序平台")
+
+        with open(bin_path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        view = memoryview(self._mmap)
+        magic, version, *sizes = HEADER.unpack_from(view, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"无法识别的地区数据文件: {bin_path}")
+
+        layout = _layout(sizes)
+        if len(view) < layout["end"]:
+            raise ValueError(f"地区数据文件不完整: {bin_path}")
+
+        def column(name, fmt=None):
+            start, end = layout[name]
+            return view[start:end].cast(fmt) if fmt else view[start:end]
+
+        self.count = sizes[0]
+        self.parents = column("parents", "i")
+        self.longitudes = column("longitudes", "d")
+        self.latitudes = column("latitudes", "d")
+        self.levels = _LevelColumn(column("levels"))
+        self.names = _NameColumn(column("offsets", "I"), column("names"))
+        self.exact = _ValueColumn(
+            _KeyColumn(column("exact_key_offsets", "I"), column("exact_keys"), column("exact_slots", "I")),
+            column("exact_values", "I")
+        )
+        self.normalized, self.grams = (
+            _PostingsColumn(
+                _KeyColumn(
+                    column(f"{prefix}_key_offsets", "I"), column(f"{prefix}_keys"), column(f"{prefix}_slots", "I")
+                ),
+                column(f"{prefix}_starts", "I"),
+                column(f"{prefix}_postings", "I")
+            )
+            for prefix in ("normalized", "grams")
+        )
+
+    def __len__(self):
+        return self.count
+
+
+def is_fresh(json_path=DEFAULT_JSON_PATH, bin_path=DEFAULT_BIN_PATH):
+    """
+    判断region.bin是否存在且不早于region.json
+    """
+    try:
+        return os.path.getmtime(bin_path) >= os.path.getmtime(json_path)
+    except OSError:
+        return False
+
+
+def _read_rss_kb():
+    """
+    读取当前进程的私有/文件映射常驻内存（KB），非Linux平台返回峰值RSS
+    """
+    try:
+        with open("/proc/self/status", "r") as f:
+            fields = dict(line.split(":", 1) for line in f)
+        return {
+            "rss_anon_kb": int(fields["RssAnon"].split()[0]),
+            "rss_file_kb": int(fields["RssFile"].split()[0]),
+        }
+    except (OSError, KeyError):
+        import resource
+        return {"rss_anon_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, "rss_file_kb": 0}
+
+
+def _bench_worker(mode):
+    """
+    在全新解释器中加载地区索引，模拟一个worker冷启动后的首次查询
+    """
+    import query_longitude
+
+    before = _read_rss_kb()
+    start = time.perf_counter()
+    if mode == "json":
+        index = query_longitude.RegionIndex.from_region_data(query_longitude.load_region_data())
+    else:
+        index = query_longitude.RegionIndex.from_table(RegionTable())
+    index.lookup("深圳")
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    after = _read_rss_kb()
+
+    print(json.dumps({
+        "load_ms": elapsed_ms,
+        "rss_anon_kb": after["rss_anon_kb"] - before["rss_anon_kb"],
+        "rss_file_kb": after["rss_file_kb"] - before["rss_file_kb"],
+    }))
+
+
+def bench(rounds=5):
+    """
+    对比JSON与region.bin两种加载方式的冷启动耗时与单worker内存增量
+    """
+    if not is_fresh():
+        build()
+
+    print(f"{'模式':<8}{'冷加载(ms)':>12}{'私有RSS(KB)':>14}{'共享文件页(KB)':>16}")
+    for mode in ("json", "mmap"):
+        samples = []
+        for _ in range(rounds):
+            output = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "_bench_worker", mode],
+                cwd=CURRENT_DIR, capture_output=True, text=True, check=True
+            ).stdout
+            samples.append(json.loads(output))
+        load_ms = sorted(s["load_ms"] for s in samples)[rounds // 2]
+        rss_anon = sorted(s["rss_anon_kb"] for s in samples)[rounds // 2]
+        rss_file = sorted(s["rss_file_kb"] for s in samples)[rounds // 2]
+        print(f"{mode:<10}{load_ms:>12.1f}{rss_anon:>14}{rss_file:>16}")
+
+
+def main():
+    command = sys.argv[1] if len(sys.argv) > 1 else "build"
+    if command == "build":
+        json_path = sys.argv[2] if len(sys.argv) > 2 else DEFAULT_JSON_PATH
+        bin_path = sys.argv[3] if len(sys.argv) > 3 else DEFAULT_BIN_PATH
+        start = time.perf_counter()
+        count = build(json_path, bin_path)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        print(f"已生成 {bin_path}：{count} 个节点，{os.path.getsize(bin_path)} 字节，耗时 {elapsed_ms:.1f}ms")
+    elif command == "bench":
+        bench(int(sys.argv[2]) if len(sys.argv) > 2 else 5)
+    elif command == "_bench_worker":
+        _bench_worker(sys.argv[2])
+    else:
+        print(__doc__)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,33 @@
+"""
+八字结果字段
+
+BaziService（API）与bazi_batch（命令行批量计算）共用，保证两者输出的bazi_result完全一致
+"""
+
+# 八字结果字段 -> 从计算器读取该字段的方式（计算器各字段均为惰性求值）
+RESULT_FIELDS = {
+    "bazi": lambda calculator: calculator.ba_zi,
+    "jieqi_info": lambda calculator: calculator.jie_qi_info,
+    "jieqi_hours": lambda calculator: calculator.jie_qi_hours,
+    "dayun_info": lambda calculator: calculator.da_yun_info,
+    "dayun_timeline": lambda calculator: calculator.da_yun_timeline,
+    "formatted_output": lambda calculator: calculator.format_output(),
+    "profile_compact": lambda calculator: calculator.format_compact(),
+}
+
+
+def build_result(calculator, fields=None):
+    """
+    构建结果字典（只计算请求的字段）
+
+    Args:
+        calculator: BaZiCalculator
+        fields: 需要的结果字段，默认全部
+
+    Raises:
+        KeyError: 不支持的字段
+    """
+    return {
+        field: RESULT_FIELDS[field](calculator)
+        for field in (fields or RESULT_FIELDS)
+    }
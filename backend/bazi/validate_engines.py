@@ -0,0 +1,323 @@
+"""
+排盘引擎差分校验
+
+以直接调用sxtwl的参考实现（与改用查表前的BaZiCalculator逐步一致）为基准，
+对比各候选引擎在1900～2100年的结果：
+- 每个整点（经度在国内范围内轮换，覆盖真太阳时换算）
+- 每个节气当天零点前后、交节时刻前后各30分钟内的每一分钟
+- 每天子时边界（23:00、00:00、01:00）前后各2分钟内的每一分钟
+
+参考实现不做任何修正。sxtwl的getMonthGZ在交节时刻为零点后几分钟时提前一天换月（与其自身的hasJieQi/getJieQiJD矛盾），
+按交节当天换月的候选引擎在这些日期会报告月柱不一致，已知的日期记录在tests/validation/test_engines.py中。
+
+候选引擎（ENGINES）：
+- calculator   BaZiCalculator公历输入：四柱、农历日期、节气信息
+- lunar_input  BaZiCalculator农历输入（含闰月）：四柱、对应的公历日期
+- vector       bazi_vector批量计算：四柱
+
+按年份分片到多个进程，报告每个引擎、字段的不一致数量，以及最早一条不一致的最小复现输入。
+
+用法：
+    python validate_engines.py                         # 全量
+    python validate_engines.py --years 1984,2033       # 指定年份
+    python validate_engines.py --year-step 20 --workers 4
+"""
+import argparse
+import datetime
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+
+import numpy as np
+import sxtwl
+
+from bazi_tool import BaZiCalculator, Gan, Zhi, jqmc
+from bazi_vector import calculate_pillars, format_pillars
+from jieqi_table import get_jieqi_table, jd_to_ordinal
+
+START_YEAR = 1900
+END_YEAR = 2100
+
+# 整点扫描时轮换使用的经度（国内最西、最东与若干常见城市）
+LONGITUDES = (73.5, 87.6, 104.06, 116.4, 120.0, 121.47, 126.63, 134.77)
+
+# 节气边界、子时边界前后扫描的分钟数
+JIE_QI_WINDOW_MINUTES = 30
+ZI_SHI_WINDOW_MINUTES = 2
+
+# 每个引擎、字段最多保留的不一致样例数
+MAX_SAMPLES = 5
+
+
+def reference_chart(moment, longitude):
+    """
+    参考实现（公历输入）：真太阳时换算后逐项调用sxtwl
+
+    Returns:
+        {"ba_zi", "lunar", "jie_qi_info"}
+    """
+    solar_time = moment + datetime.timedelta(minutes=(longitude - 120) * 4)
+    day = sxtwl.fromSolar(solar_time.year, solar_time.month, solar_time.day)
+    result = _reference_pillars(day, solar_time.hour)
+    result["lunar"] = (day.getLunarYear(), day.getLunarMonth(), day.getLunarDay(), bool(day.isLunarLeap()))
+    result["jie_qi_info"] = _reference_jie_qi_info(solar_time.year, solar_time.month, solar_time.day)
+    return result
+
+
+def reference_lunar_chart(year, month, day, leap, hour, minute, longitude):
+    """
+    参考实现（农历输入）：时分按真太阳时换算，日期取sxtwl.fromLunar对应的公历日期
+
+    Returns:
+        {"ba_zi", "solar_date"}
+    """
+    solar_time = datetime.datetime(year, month, day, hour, minute) + datetime.timedelta(minutes=(longitude - 120) * 4)
+    lunar_day = sxtwl.fromLunar(year, month, day, leap)
+    result = _reference_pillars(lunar_day, solar_time.hour)
+    result["solar_date"] = datetime.date(lunar_day.getSolarYear(), lunar_day.getSolarMonth(), lunar_day.getSolarDay())
+    return result
+
+
+def _reference_pillars(day, hour):
+    year_gz = day.getYearGZ()
+    month_gz = day.getMonthGZ()
+    day_gz = day.getDayGZ()
+    hour_gz = sxtwl.getShiGz(day_gz.tg, hour)
+    pillars = [Gan[gz.tg] + Zhi[gz.dz] for gz in (year_gz, month_gz, day_gz, hour_gz)]
+    return {"ba_zi": " ".join(pillars)}
+
+
+@lru_cache(maxsize=1024)
+def _reference_jie_qi_info(year, month, day):
+    """
+    逐日向前、向后最多30天查找节气（sxtwl的hasJieQi/getJieQi）
+
+    hasJieQi每次调用约0.1ms，结果只与公历日有关，按日缓存
+    """
+    day = sxtwl.fromSolar(year, month, day)
+    prev_day, days_since_prev = day, 0
+    while not prev_day.hasJieQi() and days_since_prev < 30:
+        prev_day, days_since_prev = prev_day.before(1), days_since_prev + 1
+    next_day, days_to_next = day, 0
+    while not next_day.hasJieQi() and days_to_next < 30:
+        next_day, days_to_next = next_day.after(1), days_to_next + 1
+    return (f"生于{jqmc[prev_day.getJieQi()]}节气后{days_since_prev}天，"
+            f"{jqmc[next_day.getJieQi()]}节气前{days_to_next}天")
+
+
+def moments_for_year(year, hour_step=1):
+    """
+    生成某一年需要校验的(出生时间, 经度)，按时间升序、去重
+
+    整点按LONGITUDES轮换经度；节气和子时边界使用经度120（输入即真太阳时），精确落在边界上
+    """
+    moments = {}
+    start = datetime.datetime(year, 1, 1)
+    end = datetime.datetime(year + 1, 1, 1)
+
+    moment, i = start, 0
+    while moment < end:
+        moments[(moment, LONGITUDES[i % len(LONGITUDES)])] = None
+        moment += datetime.timedelta(hours=hour_step)
+        i += 1
+
+    def add_window(center, window_minutes):
+        for offset in range(-window_minutes, window_minutes + 1):
+            moment = center + datetime.timedelta(minutes=offset)
+            if start <= moment < end:
+                moments[(moment, 120.0)] = None
+
+    table = get_jieqi_table()
+    for jd in table.jds:
+        term_day = datetime.date.fromordinal(jd_to_ordinal(jd))
+        if term_day.year != year:
+            continue
+        midnight = datetime.datetime.combine(term_day, datetime.time())
+        add_window(midnight, JIE_QI_WINDOW_MINUTES)
+        term_moment = midnight + datetime.timedelta(days=jd + 0.5 - int(jd + 0.5))
+        add_window(term_moment.replace(second=0, microsecond=0), JIE_QI_WINDOW_MINUTES)
+
+    day = start
+    while day < end:
+        for boundary_hour in (0, 1, 23):
+            add_window(day + datetime.timedelta(hours=boundary_hour), ZI_SHI_WINDOW_MINUTES)
+        day += datetime.timedelta(days=1)
+
+    return sorted(moments)
+
+
+def _calculator_kwargs(moment, **overrides):
+    kwargs = dict(calendar="公历", year=moment.year, month=moment.month, day=moment.day,
+                  hour=moment.hour, minute=moment.minute)
+    kwargs.update(overrides)
+    return kwargs
+
+
+def _calculator(kwargs, longitude):
+    calculator = BaZiCalculator(name="", gender="男", birth_city="", **kwargs)
+    # 直接指定经度，跳过城市查询
+    calculator._birth_longitude = longitude
+    return calculator
+
+
+def check_calculator(moment, longitude, reference):
+    kwargs = _calculator_kwargs(moment)
+    calculator = _calculator(kwargs, longitude)
+    got = {
+        "ba_zi": calculator.ba_zi,
+        "lunar": calculator.lunar_info,
+        "jie_qi_info": calculator.jie_qi_info,
+    }
+    return kwargs, got, reference
+
+
+def check_lunar_input(moment, longitude, reference):
+    year, month, day, leap = reference["lunar"]
+    try:
+        # 与参考实现一致，时分以农历数字构造datetime（如二月三十不是合法公历日期时两边都跳过）
+        datetime.date(year, month, day)
+    except ValueError:
+        return None
+    kwargs = _calculator_kwargs(moment, calendar="农历", year=year, month=month, day=day, is_leap_month=leap)
+    calculator = _calculator(kwargs, longitude)
+    got = {"ba_zi": calculator.ba_zi, "solar_date": calculator.solar_time.date()}
+    return kwargs, got, reference_lunar_chart(year, month, day, leap, moment.hour, moment.minute, longitude)
+
+
+# 引擎名 -> 逐条校验函数，返回(BaZiCalculator参数, 候选结果, 参考结果)，不适用时返回None；
+# vector按分片批量校验
+ENGINES = {
+    "calculator": check_calculator,
+    "lunar_input": check_lunar_input,
+    "vector": None,
+}
+
+
+def _record(report, engine, field, kwargs, longitude, expected, got):
+    """
+    记录一处不一致，样例为可直接复现的BaZiCalculator参数与出生地经度
+    """
+    key = f"{engine}.{field}"
+    entry = report.setdefault(key, {"count": 0, "samples": []})
+    entry["count"] += 1
+    if len(entry["samples"]) < MAX_SAMPLES:
+        entry["samples"].append({"input": {**kwargs, "longitude": longitude}, "expected": expected, "got": got})
+
+
+def validate_year(year, engines=tuple(ENGINES), hour_step=1):
+    """
+    校验某一年（一个分片）
+
+    Returns:
+        (校验的时刻数, {"引擎.字段": {"count", "samples"}})
+    """
+    moments = moments_for_year(year, hour_step)
+    report = {}
+    references = []
+
+    for moment, longitude in moments:
+        reference = reference_chart(moment, longitude)
+        references.append(reference)
+
+        for engine in engines:
+            check = ENGINES[engine]
+            if check is None:
+                continue
+            try:
+                outcome = check(moment, longitude, reference)
+            except Exception as e:
+                _record(report, engine, "exception", _calculator_kwargs(moment), longitude, "", repr(e))
+                continue
+            if outcome is None:
+                continue
+            kwargs, got, expected = outcome
+            for field, value in got.items():
+                if value != expected[field]:
+                    _record(report, engine, field, kwargs, longitude, repr(expected[field]), repr(value))
+
+    if "vector" in engines:
+        timestamps = np.array([moment for moment, _ in moments], dtype="datetime64[m]")
+        longitudes = np.array([longitude for _, longitude in moments])
+        for (moment, longitude), reference, ba_zi in zip(
+                moments, references, format_pillars(calculate_pillars(timestamps, longitudes))):
+            if ba_zi != reference["ba_zi"]:
+                _record(report, "vector", "ba_zi", _calculator_kwargs(moment), longitude,
+                        repr(reference["ba_zi"]), repr(ba_zi))
+
+    return len(moments), report
+
+
+def _validate_year_task(args):
+    return args[0], validate_year(*args)
+
+
+def validate(years=None, workers=None, engines=tuple(ENGINES), hour_step=1):
+    """
+    按年份分片并行校验
+
+    Returns:
+        (校验的时刻总数, 合并后的不一致报告)
+    """
+    years = list(years or range(START_YEAR, END_YEAR + 1))
+    total = 0
+    merged = {}
+    tasks = [(year, tuple(engines), hour_step) for year in years]
+
+    if workers == 1:
+        results = map(_validate_year_task, tasks)
+        executor = None
+    else:
+        executor = ProcessPoolExecutor(max_workers=workers)
+        results = executor.map(_validate_year_task, tasks)
+
+    try:
+        # 按年份顺序合并，样例即为最早的不一致
+        for _, (count, report) in sorted(results, key=lambda item: item[0]):
+            total += count
+            for key, entry in report.items():
+                target = merged.setdefault(key, {"count": 0, "samples": []})
+                target["count"] += entry["count"]
+                target["samples"].extend(entry["samples"][:MAX_SAMPLES - len(target["samples"])])
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    return total, merged
+
+
+def main():
+    parser = argparse.ArgumentParser(description="排盘引擎差分校验（以sxtwl参考实现为基准）")
+    parser.add_argument("--years", help="逗号分隔的年份，默认1900～2100全部")
+    parser.add_argument("--year-step", type=int, default=1, help="每隔几年取一年")
+    parser.add_argument("--hour-step", type=int, default=1, help="整点扫描的间隔小时数")
+    parser.add_argument("--engines", default=",".join(ENGINES), help="逗号分隔的候选引擎")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="进程数")
+    args = parser.parse_args()
+
+    if args.years:
+        years = [int(year) for year in args.years.split(",")]
+    else:
+        years = range(START_YEAR, END_YEAR + 1, args.year_step)
+    engines = args.engines.split(",")
+    unknown = [engine for engine in engines if engine not in ENGINES]
+    if unknown:
+        parser.error(f"不支持的引擎：{','.join(unknown)}")
+
+    start = time.perf_counter()
+    total, report = validate(years, args.workers, engines, args.hour_step)
+    elapsed = time.perf_counter() - start
+
+    for key, entry in sorted(report.items()):
+        print(f"不一致 {key}: {entry['count']} 处")
+        for sample in entry["samples"]:
+            print(f"  输入={sample['input']} 参考={sample['expected']} 候选={sample['got']}")
+    mismatches = sum(entry["count"] for entry in report.values())
+    print(f"校验完成：{len(list(years))} 年，{total} 个时刻，引擎 {','.join(engines)}，"
+          f"{mismatches} 处不一致，{args.workers} 个进程，耗时 {elapsed:.1f}s")
+    sys.exit(1 if mismatches else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""
+数据库同步/异步模式并发对比
+
+在同一并发度下模拟请求链路的数据库访问（每个请求顺序执行若干次查询），分别使用：
+- sync   同步会话（SessionLocal），在协程中直接调用，即改造前接口的写法
+- async  异步会话（AsyncSessionLocal，asyncpg）
+
+统计吞吐、请求延迟分位数，以及事件循环的最大停顿（即同一worker上其它SSE流、请求被阻塞的时长）。
+两种模式使用相同的连接池配置，查询为 SELECT pg_sleep(...)，不读写业务表。
+
+需要可连接的数据库（DATABASE_URL），在backend目录下执行：
+    python scripts/db_load_compare.py
+    python scripts/db_load_compare.py --requests 2000 --concurrency 100 --queries 3 --query-ms 5
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import text
+
+from app.core.database import AsyncSessionLocal, SessionLocal, async_engine, engine, POOL_OPTIONS
+
+QUERY = text("SELECT pg_sleep(:seconds)")
+
+# 事件循环停顿的采样间隔（秒）
+LAG_INTERVAL = 0.005
+
+
+async def sync_request(queries, seconds):
+    db = SessionLocal()
+    try:
+        for _ in range(queries):
+            db.execute(QUERY, {"seconds": seconds})
+    finally:
+        db.close()
+
+
+async def async_request(queries, seconds):
+    async with AsyncSessionLocal() as db:
+        for _ in range(queries):
+            await db.execute(QUERY, {"seconds": seconds})
+
+
+MODES = {
+    "sync": sync_request,
+    "async": async_request,
+}
+
+
+async def monitor_lag(lags, stop):
+    """
+    按固定间隔休眠，记录每次实际唤醒比预期晚的时间
+    """
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(LAG_INTERVAL)
+        lags.append(time.perf_counter() - start - LAG_INTERVAL)
+
+
+async def run_mode(mode, requests, concurrency, queries, seconds):
+    """
+    以固定并发执行requests个请求
+
+    Returns:
+        (总耗时, 各请求延迟列表, 事件循环停顿列表)
+    """
+    request = MODES[mode]
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def one():
+        async with semaphore:
+            start = time.perf_counter()
+            await request(queries, seconds)
+            latencies.append(time.perf_counter() - start)
+
+    # 预热：先建立连接，避免把建连耗时计入结果
+    await asyncio.gather(*(request(1, 0) for _ in range(min(concurrency, POOL_OPTIONS["pool_size"]))))
+
+    lags = []
+    stop = asyncio.Event()
+    monitor = asyncio.create_task(monitor_lag(lags, stop))
+    start = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(requests)))
+    elapsed = time.perf_counter() - start
+    stop.set()
+    await monitor
+    return elapsed, latencies, lags
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="数据库同步/异步模式并发对比")
+    parser.add_argument("--requests", type=int, default=1000, help="请求数")
+    parser.add_argument("--concurrency", type=int, default=50, help="并发数")
+    parser.add_argument("--queries", type=int, default=3, help="每个请求的查询次数")
+    parser.add_argument("--query-ms", type=float, default=5, help="每次查询在数据库端的耗时（毫秒）")
+    parser.add_argument("--modes", default=",".join(MODES), help="逗号分隔的模式")
+    args = parser.parse_args()
+
+    print(f"请求 {args.requests}，并发 {args.concurrency}，每请求 {args.queries} 次查询 × {args.query_ms}ms，"
+          f"连接池 {POOL_OPTIONS['pool_size']}+{POOL_OPTIONS['max_overflow']}")
+    print(f"{'模式':<6}{'耗时':>9}{'吞吐':>12}{'p50':>10}{'p95':>10}{'p99':>10}{'循环最大停顿':>14}")
+    for mode in args.modes.split(","):
+        elapsed, latencies, lags = await run_mode(
+            mode, args.requests, args.concurrency, args.queries, args.query_ms / 1000
+        )
+        print(
+            f"{mode:<6}{elapsed:>8.2f}s{args.requests / elapsed:>9.0f}/s"
+            f"{percentile(latencies, 0.5) * 1000:>8.1f}ms"
+            f"{percentile(latencies, 0.95) * 1000:>8.1f}ms"
+            f"{percentile(latencies, 0.99) * 1000:>8.1f}ms"
+            f"{max(lags, default=0) * 1000:>12.1f}ms"
+        )
+
+    engine.dispose()
+    await async_engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
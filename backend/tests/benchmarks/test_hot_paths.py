@@ -0,0 +1,70 @@
+"""
+热点路径基准用例（说明见conftest.py）
+"""
+import pytest
+
+from query_longitude import inquire
+
+from app.prompts.system_prompts import SystemPromptManager
+from app.services.bazi_service import BaziService
+from bazi.bazi_tool import BaZiCalculator
+
+
+@pytest.fixture(scope="module")
+def charts(corpus):
+    return corpus["charts"]
+
+
+@pytest.fixture(scope="module")
+def service():
+    return BaziService(executor="inline")
+
+
+def test_inquire(bench, charts):
+    # 绕过lru_cache，测量地区索引本身的查询开销
+    lookup = inquire.__wrapped__
+    cities = [chart["birth_city"] for chart in charts]
+    result = bench.run("inquire", lookup, cities)
+    bench.check("inquire", result)
+
+
+def test_calculator_format_output(bench, charts):
+    result = bench.run(
+        "BaZiCalculator.format_output",
+        lambda chart: BaZiCalculator(**chart).format_output(),
+        charts,
+    )
+    bench.check("BaZiCalculator.format_output", result)
+
+
+def test_calculator_ba_zi(bench, charts):
+    result = bench.run(
+        "BaZiCalculator.ba_zi",
+        lambda chart: BaZiCalculator(**chart).ba_zi,
+        charts,
+    )
+    bench.check("BaZiCalculator.ba_zi", result)
+
+
+def test_service_calculate(bench, charts, service):
+    result = bench.run(
+        "BaziService.calculate",
+        lambda chart: service.calculate(**chart),
+        charts,
+    )
+    bench.check("BaziService.calculate", result)
+
+
+def test_build_system_prompt(bench, charts, service):
+    styles = SystemPromptManager.get_available_styles()
+    # 预先算好八字档案，只测量提示词拼装本身
+    profiles = [
+        (styles[i % len(styles)], {"name": chart["name"], "gender": chart["gender"], **service.calculate(**chart)})
+        for i, chart in enumerate(charts)
+    ]
+    result = bench.run(
+        "SystemPromptManager.build_system_prompt",
+        lambda profile: SystemPromptManager.build_system_prompt(ai_style=profile[0], bazi_info=profile[1]),
+        profiles,
+    )
+    bench.check("SystemPromptManager.build_system_prompt", result)
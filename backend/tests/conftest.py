@@ -0,0 +1,28 @@
+"""
+测试公共配置
+
+基准测试的命令行选项在此注册，使其在backend目录下直接执行pytest时同样可用（用例说明见benchmarks/conftest.py）
+"""
+import os
+
+
+def pytest_addoption(parser):
+    group = parser.getgroup("benchmark", "热点路径微基准测试")
+    group.addoption(
+        "--bench",
+        action="store_true",
+        default=os.environ.get("BENCH") == "1",
+        help="运行基准测试（默认跳过）",
+    )
+    group.addoption(
+        "--bench-threshold",
+        type=float,
+        default=float(os.environ.get("BENCH_THRESHOLD", 0.3)),
+        help="允许的退化比例：每秒操作数低于基线×(1-阈值)或内存分配高于基线×(1+阈值)时失败",
+    )
+    group.addoption(
+        "--bench-save",
+        action="store_true",
+        default=False,
+        help="不做对比，以本次结果重写baseline.json",
+    )
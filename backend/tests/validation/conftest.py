@@ -0,0 +1,16 @@
+"""
+排盘引擎差分校验
+
+在backend目录下执行：
+    pytest tests/validation
+
+测试只抽取少量年份；1900～2100年全量校验使用命令行：
+    python bazi/validate_engines.py
+"""
+import os
+import sys
+
+VALIDATION_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.abspath(os.path.join(VALIDATION_DIR, "../.."))
+
+sys.path.insert(0, os.path.join(BACKEND_DIR, "bazi"))
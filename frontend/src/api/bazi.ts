@@ -2,7 +2,7 @@
  * 八字相关API
  */
 import { get, post, del } from './request'
-import type { BaziProfile } from '@/types'
+import type { BaziProfile, CitySuggestion } from '@/types'
 
 /**
  * 计算八字
@@ -18,6 +18,7 @@ export function calculateBazi(data: {
   minute: number
   birth_city: string
   current_city?: string
+  is_leap_month?: boolean
 }) {
   return post<BaziProfile>('/api/v1/bazi/calculate', data)
 }
@@ -43,3 +44,9 @@ export function deleteBaziProfile(id: string) {
   return del(`/api/v1/bazi/profiles/${id}`)
 }
 
+/**
+ * 城市名称联想
+ */
+export function searchCities(q: string, limit = 10) {
+  return get<CitySuggestion[]>('/api/v1/bazi/cities', { q, limit })
+}
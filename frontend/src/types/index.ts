@@ -53,16 +53,33 @@ export interface BaziProfile {
     minute: number
     birth_city: string
     current_city?: string
+    is_leap_month?: boolean
   }
   bazi_result: {
     bazi: string
     jieqi_info: string
+    jieqi_hours?: { prev: string; hours_since: number; next: string; hours_until: number }
     dayun_info: string
+    dayun_timeline?: {
+      direction: string
+      start_age: number
+      dayun: { pillar: string; start_age: number; start_year: number }[]
+      liunian: { start_year: number; pillars: string[] }
+    }
     formatted_output: string
+    profile_compact?: string
   }
   created_at: string
 }
 
+// 城市联想结果
+export interface CitySuggestion {
+  name: string
+  full_path: string
+  level: 'province' | 'city' | 'district' | 'street'
+  longitude: number
+}
+
 // 订单类型
 export interface Order {
   id: string